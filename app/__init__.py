@@ -6,6 +6,7 @@ from flask_jwt_extended import create_access_token, get_jwt, get_jwt_identity
 from werkzeug.utils import safe_join
 from config import Config
 from app.extensions import db, bcrypt, login_manager, cors, jwt
+from app.services import ai_cancel, sse
 
 def create_app(config_class=Config):
     app = Flask(__name__)
@@ -15,6 +16,8 @@ def create_app(config_class=Config):
     bcrypt.init_app(app)
     login_manager.init_app(app)
     jwt.init_app(app)
+    sse.init_app(app)
+    ai_cancel.init_app(app)
 
     # Configurar CORS baseado em variável de ambiente FRONTEND_URL
     frontend_origin = app.config.get('FRONTEND_URL') or os.environ.get('FRONTEND_URL', '*')
@@ -58,6 +61,7 @@ def create_app(config_class=Config):
     from app.routes.bot_routes import bot_bp
     from app.routes.conversation_routes import conversation_bp
     from app.routes.dashboard_routes import dashboard_bp
+    from app.routes.stream_routes import stream_bp
 
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp)
@@ -67,6 +71,7 @@ def create_app(config_class=Config):
     app.register_blueprint(bot_bp)
     app.register_blueprint(conversation_bp)
     app.register_blueprint(dashboard_bp)
+    app.register_blueprint(stream_bp)
 
     configured_upload_root = os.path.abspath(app.config['UPLOAD_FOLDER'])
     local_upload_root = os.path.abspath(os.path.join(app.root_path, '..', 'uploads'))
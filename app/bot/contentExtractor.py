@@ -0,0 +1,102 @@
+import os
+import re
+
+# Upper bound of the text handed to the LLM per page; listing lines are kept first.
+MAX_CONTENT_CHARS = int(os.environ.get("SCRAPER_MAX_CONTENT_CHARS", 12000))
+
+# Tags that never hold listing data.
+BOILERPLATE_TAGS = [
+    'script', 'style', 'noscript', 'template', 'svg', 'iframe', 'canvas',
+    'nav', 'footer', 'aside', 'form', 'button', 'select'
+]
+# class/id fragments of menus, banners and similar blocks.
+BOILERPLATE_PATTERN = re.compile(
+    r'(^|[\s_-])(menu|navbar|nav|breadcrumbs?|cookies?|consent|newsletter|footer|'
+    r'sidebar|modal|popup|banner|advert|ads|social|share|login|signup)([\s_-]|$)',
+    re.IGNORECASE
+)
+# Lines carrying price, area, rooms or address information.
+LISTING_PATTERN = re.compile(
+    r'R\$|\bm²|\bm2\b|metros?|quartos?|dormit[óo]rios?|su[íi]tes?|banheiros?|vagas?|'
+    r'condom[íi]nio|iptu|aluguel|venda|endere[çc]o|\brua\b|\bav\.|avenida|bairro|cep\b',
+    re.IGNORECASE
+)
+WHITESPACE_PATTERN = re.compile(r'\s+')
+MIN_MAIN_CHARS = 200
+MIN_DEDUPE_CHARS = 15
+
+
+def _strip_boilerplate(soup):
+    for tag in soup(BOILERPLATE_TAGS):
+        tag.decompose()
+    for tag in soup.find_all(attrs={'class': True}) + soup.find_all(attrs={'id': True}):
+        if tag.decomposed or tag.name in ('html', 'body', 'main'):
+            continue
+        classes = tag.get('class') or []
+        marker = ' '.join(classes if isinstance(classes, list) else [classes]) + ' ' + (tag.get('id') or '')
+        if BOILERPLATE_PATTERN.search(marker):
+            tag.decompose()
+
+
+def _text_lines(soup):
+    root = soup.body or soup
+    main = soup.find('main') or soup.find(attrs={'role': 'main'})
+    # Some layouts only wrap a gallery or a form in <main>; fall back to the whole body then.
+    if main is not None and len(main.get_text(strip=True)) >= MIN_MAIN_CHARS:
+        root = main
+    lines = []
+    seen = set()
+    for raw in root.get_text('\n').split('\n'):
+        line = WHITESPACE_PATTERN.sub(' ', raw).strip()
+        if not line:
+            continue
+        # Repeated sentences are teasers and menu entries; short values ("2", "m²") may repeat.
+        if len(line) >= MIN_DEDUPE_CHARS:
+            if line in seen:
+                continue
+            seen.add(line)
+        lines.append(line)
+    return lines
+
+
+def _cap_lines(lines, max_chars):
+    """Keeps listing lines (with their neighbours as labels) first, then the rest in page order."""
+    if sum(len(line) + 1 for line in lines) <= max_chars:
+        return lines, False
+
+    relevant = set()
+    for index, line in enumerate(lines):
+        if LISTING_PATTERN.search(line):
+            relevant.update((index - 1, index, index + 1))
+    ordered = [index for index in range(len(lines)) if index in relevant]
+    ordered += [index for index in range(len(lines)) if index not in relevant]
+
+    kept = set()
+    total = 0
+    for index in ordered:
+        size = len(lines[index]) + 1
+        if total + size > max_chars:
+            continue
+        kept.add(index)
+        total += size
+    return [lines[index] for index in sorted(kept)], True
+
+
+def reduce_page(soup, max_chars=MAX_CONTENT_CHARS):
+    """
+    Main-content text of a parsed page for the LLM: drops scripts, menus, headers and
+    footers, collapses whitespace, dedupes lines and caps the size keeping listing
+    lines (price, área, quartos, endereço) first. Mutates `soup`.
+
+    Returns (text, size) where size reports the bytes of the full page text and of
+    the reduced text.
+    """
+    original_bytes = len(soup.get_text().encode('utf-8'))
+    _strip_boilerplate(soup)
+    lines, truncated = _cap_lines(_text_lines(soup), max_chars)
+    text = '\n'.join(lines)
+    return text, {
+        'original_bytes': original_bytes,
+        'reduced_bytes': len(text.encode('utf-8')),
+        'truncated': truncated
+    }
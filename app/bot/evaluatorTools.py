@@ -1,11 +1,13 @@
 from langchain_core.tools import tool
-from scraper import extract_content
+from scraper import extract_content, extract_contents, BATCH_MAX_URLS
 from langgraph.prebuilt import ToolNode
-from webSearch import web_search
+from webSearch import web_search, multi_search, SearchUnavailableError
 from app.bot.customTypes import SalvarAvaliacaoInput
-from app.extensions import db
+from app.extensions import db, bot_evaluation_id_var
+from app.services.ai_cancel import is_current_run_canceled
 from app.models.evaluation import Evaluation, BaseListing
 from datetime import datetime
+from typing import Optional
 
 def normalize_purpose(value):
     if value is None:
@@ -59,23 +61,74 @@ def normalize_property_type(value):
     return normalized
 
 @tool
-def ler_conteudo_site(url: str):
+def ler_conteudo_site(url: str, ignorar_cache: bool = False):
     """
         Use essa ferramente para ler conteúdos de sites através de urls.
+        Páginas lidas recentemente vêm do cache; use ignorar_cache=True para forçar uma leitura nova.
+        Quando o anúncio traz dados estruturados, eles vêm prontos em 'imoveis' (mesmos campos de imoveis_considerados).
     """
-    content = extract_content(url)
+    if is_current_run_canceled():
+        return "Operacao cancelada pelo usuario."
+    # Plain HTTP first; a pooled browser is only borrowed when the page needs JS.
+    content = extract_content(url, should_cancel=is_current_run_canceled, use_cache=not ignorar_cache)
+    if content.get('cancelled'):
+        return "Operacao cancelada pelo usuario."
     return content
 
+@tool
+def ler_conteudos_sites(urls: list[str], ignorar_cache: bool = False):
+    """
+        Use essa ferramenta para ler vários anúncios de uma vez (até 10 urls por chamada).
+        Prefira-a a várias chamadas de ler_conteudo_site. Retorna um resultado por url, na
+        mesma ordem; urls que falharem vêm com 'error' no lugar do conteúdo.
+    """
+    if is_current_run_canceled():
+        return "Operacao cancelada pelo usuario."
+    urls = urls[:BATCH_MAX_URLS]
+    contents = extract_contents(urls, should_cancel=is_current_run_canceled, use_cache=not ignorar_cache)
+    if is_current_run_canceled():
+        return "Operacao cancelada pelo usuario."
+    return contents
+
 @tool
 def pesquisar_sites(pesquisa: str):
     """
         Use essa ferramenta pra fazer pesquisas online.
     """
+    if is_current_run_canceled():
+        return "Operacao cancelada pelo usuario."
     cx = "f250cd15b14884f9f" 
     num_results=10
-    results = web_search(pesquisa, num_results, cx)
+    try:
+        results = web_search(pesquisa, num_results, cx)
+    except SearchUnavailableError as e:
+        return str(e)
     return results
 
+@tool
+def pesquisar_sites_variacoes(pesquisas: list[str], resultados_por_pesquisa: int = 10, avaliacao_id: Optional[int] = None):
+    """
+        Use essa ferramenta para fazer várias pesquisas de uma vez (até 8 variações da mesma busca,
+        ex.: bairros vizinhos, sinônimos, faixas de área), com até 30 resultados por pesquisa.
+        Retorna uma lista única de links, sem repetidos e sem os anúncios que já são imóveis base
+        da avaliação (avaliacao_id, ou a avaliação da conversa atual), ordenada pelos links
+        encontrados em mais pesquisas.
+    """
+    if is_current_run_canceled():
+        return "Operacao cancelada pelo usuario."
+    cx = "f250cd15b14884f9f"
+    evaluation_id = avaliacao_id or bot_evaluation_id_var.get()
+    existing_links = []
+    if evaluation_id:
+        existing_links = [
+            link for (link,) in db.session.query(BaseListing.link).filter(
+                BaseListing.evaluation_id == evaluation_id,
+                BaseListing.link.isnot(None)
+            ).all()
+        ]
+    results_per_query = max(1, min(resultados_por_pesquisa, 30))
+    return multi_search(pesquisas[:8], cx, results_per_query=results_per_query, exclude_links=existing_links)
+
 @tool(args_schema=SalvarAvaliacaoInput)
 def salvar_avaliacao_db(
     endereco: str,
@@ -211,5 +264,5 @@ def salvar_avaliacao_db(
         db.session.rollback()
         return f"Erro ao salvar avaliação: {str(e)}"
 
-toolsList = [ler_conteudo_site, pesquisar_sites, salvar_avaliacao_db]
+toolsList = [ler_conteudo_site, ler_conteudos_sites, pesquisar_sites, pesquisar_sites_variacoes, salvar_avaliacao_db]
 tools_node = ToolNode(toolsList)
\ No newline at end of file
@@ -0,0 +1,283 @@
+import json
+import logging
+import re
+from urllib.parse import urljoin, urlparse
+
+from pydantic import ValidationError
+
+from app.bot.customTypes import ImovelConsiderado
+
+logger = logging.getLogger(__name__)
+
+# schema.org types describing a property (or its offer) in JSON-LD and microdata.
+LISTING_TYPES = {
+    'residence', 'apartment', 'house', 'singlefamilyresidence', 'accommodation',
+    'apartmentcomplex', 'gatedresidencecommunity', 'realestatelisting', 'offer',
+    'product', 'place', 'room', 'suite'
+}
+# Key aliases found in portal state blobs (__NEXT_DATA__ and similar), mapped to ImovelConsiderado fields.
+FIELD_ALIASES = {
+    'area': ('usableAreas', 'usableArea', 'area', 'areaUtil', 'totalAreas', 'floorSize'),
+    'quartos': ('bedrooms', 'numberOfBedrooms', 'numberOfRooms', 'quartos', 'dormitorios', 'rooms'),
+    'banheiros': ('bathrooms', 'numberOfBathroomsTotal', 'numberOfFullBathrooms', 'banheiros'),
+    'vagas': ('parkingSpaces', 'parkingSpots', 'garageSpaces', 'vagas'),
+    'valor_aluguel': ('price', 'rentalPrice', 'salePrice', 'valor', 'preco'),
+    'valor_condominio': ('monthlyCondoFee', 'condoFee', 'condominio', 'valorCondominio'),
+    'tipo': ('unitTypes', 'propertyType', 'tipo'),
+    'link': ('url', 'link', 'href')
+}
+PRICE_KEYS = ('pricingInfos', 'prices', 'offers', 'offer')
+NUMBER_PATTERN = re.compile(r'\d[\d.,]*')
+# Blobs are walked to this depth only; listing objects sit a few levels down.
+MAX_DEPTH = 12
+MAX_ROWS = 50
+
+# domain -> callable(url, soup) returning ImovelConsiderado-shaped dicts; tried before the generic parsers.
+DOMAIN_PARSERS = {}
+
+
+def register_parser(domain, parser):
+    """Plugs in a parser for a portal; subdomains of `domain` use it too."""
+    DOMAIN_PARSERS[domain] = parser
+
+
+def _parser_for(url):
+    host = (urlparse(url).hostname or '').lower()
+    for domain, parser in DOMAIN_PARSERS.items():
+        if host == domain or host.endswith('.' + domain):
+            return parser
+    return None
+
+
+def _first(value):
+    while isinstance(value, list):
+        if not value:
+            return None
+        value = value[0]
+    return value
+
+
+def _number(value):
+    """Numbers from 1200, "R$ 1.200,50", {"value": 70} or ["70"]; None when there is none."""
+    value = _first(value)
+    if isinstance(value, dict):
+        value = value.get('value', value.get('amount', value.get('price')))
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = NUMBER_PATTERN.search(str(value))
+    if not match:
+        return None
+    digits = match.group(0)
+    if ',' in digits:
+        digits = digits.replace('.', '').replace(',', '.')
+    elif digits.count('.') > 1 or re.search(r'\.\d{3}$', digits):
+        digits = digits.replace('.', '')
+    try:
+        return float(digits)
+    except ValueError:
+        return None
+
+
+def _lookup(node, aliases):
+    for key in aliases:
+        if key in node and node[key] not in (None, '', []):
+            return node[key]
+    return None
+
+
+def _address_fields(node):
+    address = node.get('address') or {}
+    if isinstance(address, str):
+        return {'endereco': address}
+    if not isinstance(address, dict):
+        return {}
+    street = address.get('streetAddress') or address.get('street')
+    number = address.get('streetNumber')
+    if street and number:
+        street = f"{street}, {number}"
+    return {
+        'endereco': street,
+        'bairro': address.get('neighborhood') or address.get('addressNeighborhood'),
+        'cidade': address.get('addressLocality') or address.get('city'),
+        'estado': address.get('addressRegion') or address.get('stateAcronym') or address.get('state')
+    }
+
+
+def _price_fields(node):
+    fields = {}
+    for key in PRICE_KEYS:
+        offer = _first(node.get(key))
+        if isinstance(offer, dict):
+            fields['valor_aluguel'] = _number(_lookup(offer, FIELD_ALIASES['valor_aluguel']))
+            fields['valor_condominio'] = _number(_lookup(offer, FIELD_ALIASES['valor_condominio']))
+            business = str(offer.get('businessType') or '').upper()
+            if business == 'RENTAL':
+                fields['classificacao'] = 'Aluguel'
+            elif business == 'SALE':
+                fields['classificacao'] = 'Venda'
+            break
+    return fields
+
+
+def _listing_from_node(node, page_url):
+    """Maps a JSON-LD/microdata/state object to ImovelConsiderado fields."""
+    item = node.get('itemOffered') if isinstance(node.get('itemOffered'), dict) else None
+    source = {**node, **item} if item else node
+
+    row = _address_fields(source)
+    for field in ('area', 'quartos', 'banheiros', 'vagas', 'valor_aluguel', 'valor_condominio'):
+        row[field] = _number(_lookup(source, FIELD_ALIASES[field]))
+    for field, value in _price_fields(source).items():
+        if value is not None:
+            row[field] = value
+    kind = _first(_lookup(source, FIELD_ALIASES['tipo']))
+    if kind is None:
+        schema_type = _first(source.get('@type'))
+        if isinstance(schema_type, str) and schema_type.lower() not in ('offer', 'product', 'place', 'realestatelisting'):
+            kind = schema_type
+    row['tipo'] = str(kind) if kind else None
+    link = _first(_lookup(source, FIELD_ALIASES['link']))
+    if isinstance(link, dict):
+        link = link.get('href') or link.get('url')
+    row['link'] = urljoin(page_url, link) if isinstance(link, str) else page_url
+
+    # A listing needs at least a price and a size/room count to be useful as a comparable.
+    if row['valor_aluguel'] is None or (row['area'] is None and row['quartos'] is None):
+        return None
+    for field in ('quartos', 'banheiros', 'vagas'):
+        row[field] = int(row[field]) if row[field] is not None else 0
+    try:
+        return ImovelConsiderado(**row).model_dump(exclude_none=True)
+    except ValidationError as e:
+        logger.debug(f"Discarded listing candidate from {page_url}: {e}")
+        return None
+
+
+def _walk(value, depth=0):
+    """Every dict inside a JSON value, parents first."""
+    if depth > MAX_DEPTH:
+        return
+    if isinstance(value, dict):
+        yield value
+        for child in value.values():
+            yield from _walk(child, depth + 1)
+    elif isinstance(value, list):
+        for child in value:
+            yield from _walk(child, depth + 1)
+
+
+def _is_listing_type(node):
+    types = node.get('@type')
+    types = types if isinstance(types, list) else [types]
+    return any(isinstance(kind, str) and kind.lower() in LISTING_TYPES for kind in types)
+
+
+def _json_scripts(soup, **attrs):
+    for script in soup.find_all('script', attrs=attrs):
+        raw = script.string or script.get_text()
+        if not raw or not raw.strip():
+            continue
+        try:
+            yield json.loads(raw)
+        except ValueError:
+            continue
+
+
+def parse_json_ld(url, soup):
+    rows = []
+    for data in _json_scripts(soup, type='application/ld+json'):
+        for node in _walk(data):
+            if _is_listing_type(node):
+                row = _listing_from_node(node, url)
+                if row:
+                    rows.append(row)
+    return rows
+
+
+def parse_next_data(url, soup):
+    """Listing-like objects of a Next.js page state (or a similar inline state blob)."""
+    rows = []
+    for data in _json_scripts(soup, id='__NEXT_DATA__'):
+        for node in _walk(data):
+            # Search results wrap each listing as {"listing": {...}, "link": {...}}.
+            if isinstance(node.get('listing'), dict) and 'link' in node and 'link' not in node['listing']:
+                node['listing']['link'] = node['link']
+            # Cheap pre-check before mapping: a price container plus a size or room count.
+            has_price = any(key in node for key in PRICE_KEYS + FIELD_ALIASES['valor_aluguel'])
+            has_size = any(key in node for key in FIELD_ALIASES['area'] + FIELD_ALIASES['quartos'])
+            if has_price and has_size:
+                row = _listing_from_node(node, url)
+                if row:
+                    rows.append(row)
+    return rows
+
+
+def _microdata_value(tag):
+    if tag.has_attr('itemscope'):
+        return _microdata_item(tag)
+    for attr in ('content', 'href', 'src', 'value'):
+        if tag.has_attr(attr):
+            return tag[attr]
+    return tag.get_text(' ', strip=True)
+
+
+def _microdata_item(scope):
+    item = {'@type': (scope.get('itemtype') or '').rstrip('/').rsplit('/', 1)[-1]}
+    for prop in scope.find_all(attrs={'itemprop': True}):
+        # Properties of nested items belong to them, not to this scope.
+        owner = prop.find_parent(attrs={'itemscope': True})
+        if owner is not scope:
+            continue
+        for name in prop['itemprop'].split():
+            item.setdefault(name, _microdata_value(prop))
+    return item
+
+
+def parse_microdata(url, soup):
+    rows = []
+    for scope in soup.find_all(attrs={'itemscope': True, 'itemtype': True}):
+        if scope.find_parent(attrs={'itemscope': True}) is not None:
+            continue
+        item = _microdata_item(scope)
+        for node in _walk(item):
+            if _is_listing_type(node):
+                row = _listing_from_node(node, url)
+                if row:
+                    rows.append(row)
+                    break
+    return rows
+
+
+GENERIC_PARSERS = (parse_json_ld, parse_next_data, parse_microdata)
+
+
+def extract_listings(url, soup):
+    """
+    Listings embedded in the page (JSON-LD, __NEXT_DATA__, microdata) as
+    ImovelConsiderado-shaped dicts. Call before the soup is reduced, since the
+    data lives in <script> tags. Returns [] when nothing structured is found.
+    """
+    parsers = list(GENERIC_PARSERS)
+    domain_parser = _parser_for(url)
+    if domain_parser is not None:
+        parsers.insert(0, domain_parser)
+
+    rows = []
+    seen = set()
+    for parser in parsers:
+        try:
+            found = parser(url, soup)
+        except Exception as e:
+            logger.warning(f"Listing parser {getattr(parser, '__name__', parser)} failed for {url}: {e}")
+            continue
+        for row in found:
+            key = (row.get('link'), row.get('endereco'), row.get('area'), row.get('valor_aluguel'))
+            if key in seen:
+                continue
+            seen.add(key)
+            rows.append(row)
+        if len(rows) >= MAX_ROWS:
+            break
+    return rows[:MAX_ROWS]
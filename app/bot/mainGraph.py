@@ -2,11 +2,10 @@ import os
 from dotenv import load_dotenv
 from langgraph.graph import StateGraph, START, END
 from customTypes import State
-from mainNodes import responder
+from mainNodes import responder, cancelled, route_after_responder, route_after_tools
 from langgraph.checkpoint.postgres import PostgresSaver
 from psycopg import Connection
 from psycopg.rows import dict_row
-from langgraph.prebuilt import tools_condition
 from mainTools import tools_node
 
 load_dotenv()
@@ -21,10 +20,12 @@ graph_builder = StateGraph(State)
 
 graph_builder.add_node("responder", responder)
 graph_builder.add_node("tools", tools_node)
+graph_builder.add_node("cancelled", cancelled)
 
 graph_builder.add_edge(START, "responder")
-graph_builder.add_conditional_edges("responder", tools_condition, {"tools": "tools", END: END})
-graph_builder.add_edge("tools", "responder")
-graph_builder.add_edge("responder", END)
+# A cancelled run stops before the next tool step and again before the next LLM call.
+graph_builder.add_conditional_edges("responder", route_after_responder, {"tools": "tools", "cancelled": "cancelled", END: END})
+graph_builder.add_conditional_edges("tools", route_after_tools, {"responder": "responder", END: END})
+graph_builder.add_edge("cancelled", END)
 
 graph = graph_builder.compile(checkpointer=checkpointer)
\ No newline at end of file
@@ -1,7 +1,35 @@
+from langchain_core.messages import ToolMessage
+from langgraph.graph import END
+from langgraph.prebuilt import tools_condition
 from llms import llm_main
 from customTypes import State
 from mainTools import toolsList
+from app.services.ai_cancel import is_current_run_canceled
+
+CANCELLED_TOOL_RESULT = "Operacao cancelada pelo usuario."
 
 def responder(state: State):
     response = llm_main.bind_tools(toolsList).invoke(state['messages'])
-    return {'messages': response}
\ No newline at end of file
+    return {'messages': response}
+
+def cancelled(state: State):
+    """
+    Closes the pending tool calls of the last AI message without running them, so the
+    conversation history stays valid (every tool call answered) for the next turn.
+    """
+    last_message = state['messages'][-1]
+    return {'messages': [
+        ToolMessage(content=CANCELLED_TOOL_RESULT, tool_call_id=tool_call['id'], name=tool_call['name'])
+        for tool_call in getattr(last_message, 'tool_calls', None) or []
+    ]}
+
+def route_after_responder(state: State):
+    route = tools_condition(state)
+    if route == "tools" and is_current_run_canceled():
+        return "cancelled"
+    return route
+
+def route_after_tools(state: State):
+    if is_current_run_canceled():
+        return END
+    return "responder"
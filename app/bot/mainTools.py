@@ -1,18 +1,66 @@
 from langchain_core.tools import tool
 from langgraph.prebuilt import ToolNode
 from app.bot.graphEvaluator import graph as evaluator_graph
-from app.bot.evaluatorTools import ler_conteudo_site, pesquisar_sites
+from app.bot.evaluatorTools import ler_conteudo_site, ler_conteudos_sites, pesquisar_sites, pesquisar_sites_variacoes
 from app.controllers.evaluation_controller import (
     create_evaluation, get_evaluation, get_evaluations, update_evaluation, delete_evaluation,
-    create_base_listing, get_base_listing, update_base_listing, delete_base_listing
+    get_base_listing, update_base_listing, delete_base_listing, get_comparables,
+    get_evaluation_statistics, update_base_listings_bulk, create_base_listings_bulk
 )
 import json
 from datetime import datetime
 from typing import List, Dict, Any
+from werkzeug.exceptions import NotFound
 from app.bot.customTypes import SalvarAvaliacaoInput
 from app.services.ai_cancel import is_evaluation_canceled
 from app.services.sse import publish_event
 
+
+def _get_attr(obj, *attrs):
+    """First non-empty value among `attrs` (PT and EN keys) of a dict or object."""
+    for attr in attrs:
+        value = obj.get(attr) if isinstance(obj, dict) else getattr(obj, attr, None)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def _listing_payload(imovel, collected_at):
+    """
+    create_base_listings_bulk item for one comparable; sample_number is assigned by the
+    server when missing, and `collected_at` only fills in comparables without their own.
+    """
+    return {
+        "sample_number": _get_attr(imovel, 'numero_amostra', 'sample_number'),
+        "address": _get_attr(imovel, 'endereco', 'address'),
+        "neighborhood": _get_attr(imovel, 'bairro', 'neighborhood'),
+        "city": _get_attr(imovel, 'cidade', 'city'),
+        "state": _get_attr(imovel, 'estado', 'state'),
+        "link": _get_attr(imovel, 'link', 'url'),
+        "area": _get_attr(imovel, 'area'),
+        "bedrooms": _get_attr(imovel, 'quartos', 'bedrooms') or 0,
+        "bathrooms": _get_attr(imovel, 'banheiros', 'bathrooms') or 0,
+        "parking_spaces": _get_attr(imovel, 'vagas', 'parking_spaces') or 0,
+        "rent_value": _get_attr(imovel, 'valor_aluguel', 'rent_value', 'valor_total', 'price', 'sale_value'),
+        "condo_fee": _get_attr(imovel, 'valor_condominio', 'condo_fee'),
+        "type": _get_attr(imovel, 'tipo', 'type'),
+        "purpose": _get_attr(imovel, 'finalidade', 'purpose'),
+        "collected_at": _get_attr(imovel, 'coletado_em', 'collected_at') or collected_at
+    }
+
+
+def _saved_comparable(item):
+    """adicionar_imoveis_base item for a listing of another evaluation, keeping when it was collected."""
+    payload = _listing_payload(item, None)
+    del payload["sample_number"]
+    payload["similarity"] = item.get("similarity")
+    return payload
+
+def _skipped_message(skipped):
+    """Tells the model which comparables create_base_listings_bulk rejected (1-based positions)."""
+    details = "; ".join(f"imóvel {item['index'] + 1}: {item['error']}" for item in skipped)
+    return f"{len(skipped)} imóveis ignorados por dados inválidos ({details})."
+
 @tool
 def ler_instrucoes_para_nova_avaliacao():
     """
@@ -28,13 +76,13 @@ def ler_instrucoes_para_nova_avaliacao():
 
 2. **Pesquisar Comparáveis**:
    - Busque 15-25 imóveis no **mesmo bairro e cidade**
-   - Use `pesquisar_sites` para encontrar anúncios semelhantes
-   - Acesse 2-3 links com `ler_conteudo_site` para extrair detalhes precisos
+   - Use `pesquisar_sites_variacoes` com várias variações da busca de uma vez para encontrar anúncios semelhantes
+   - Leia os links candidatos de uma vez com `ler_conteudos_sites` para extrair detalhes precisos
 
 3. **Extrair Dados** (para cada imóvel):
    - Link, Endereço, Área (m²), Valor Total, Quartos, Banheiros, Vagas, Condomínio
    - Calcule: Valor/m² = Valor Total ÷ Área
-    - Se estiver adicionando a uma avaliação existente, adicione um imóvel por vez assim que validar
+    - Se estiver adicionando a uma avaliação existente, adicione os imóveis validados juntos em uma única chamada de `adicionar_imoveis_base`
 
 4. **🚨 FILTRAR IMÓVEIS (CRÍTICO)**:
    - **REMOVA** imóveis com diferenças grandes em relação ao imóvel avaliado:
@@ -43,6 +91,7 @@ def ler_instrucoes_para_nova_avaliacao():
      - Valor/m²: outliers (valores muito acima/abaixo da média)
    - Mantenha apenas 10-20 imóveis **REALMENTE SEMELHANTES**
    - Justifique brevemente quais foram removidos e por quê
+   - Depois de salvar, confirme os outliers de Valor/m² com `analisar_outliers(id, desativar=True)`
 
 5. **Calcular Avaliação**:
    - **Média do Valor/m²** da amostra filtrada
@@ -81,18 +130,21 @@ def ler_instrucoes_para_atualizar_uma_avaliacao_existente():
     - `description`, `classification` (Venda/Aluguel), `purpose` (Residencial/Comercial), `property_type`
    - `bedrooms`, `bathrooms`, `parking_spaces`
    - `area` → ⚠️ recalcula métricas automaticamente
+   - `value_statistic` (mean/median/trimmed_mean) → estatística do Valor/m²; mediana ou média aparada resistem a outliers
 
    **B) Adicionar Imóveis Comparativos**:
-   - Pesquise com `pesquisar_sites` + `ler_conteudo_site`
+   - Comece por `buscar_comparaveis_salvos` (imóveis já coletados pela unidade)
+   - Para o que faltar, pesquise com `pesquisar_sites_variacoes` + `ler_conteudos_sites`
    - **🚨 FILTRE** antes de adicionar:
      - Área: ±30% do imóvel avaliado
      - Quartos/Banheiros/Vagas: ±3 unidade
-     - Remova outliers de Valor/m²
-     - Use `adicionar_imoveis_base(evaluation_id, imoveis)` e adicione um imóvel por vez conforme validar
+     - Outliers de Valor/m²: depois de adicionar, use `analisar_outliers(evaluation_id, desativar=True)` (uma chamada, sem analisar imóvel por imóvel)
+     - Use `adicionar_imoveis_base(evaluation_id, imoveis)` com todos os imóveis validados de uma vez (uma única chamada)
    - Métricas recalculam automaticamente
 
    **C) Remover Imóveis** (outliers, dados incorretos):
-   - Identifique IDs em `ler_avaliacao`
+   - Outliers de Valor/m²: `analisar_outliers(evaluation_id)` retorna os IDs sinalizados; `desativar=True` já os desativa
+   - Dados incorretos: identifique IDs em `ler_avaliacao`
    - Use `deletar_imoveis_base([id1, id2, ...])`
    - Confirme com usuário antes de deletar
    - Mantenha 10-20 imóveis semelhantes na amostra
@@ -211,43 +263,18 @@ def salvar_avaliacao_db(
         nova_avaliacao = response.get_json()
         evaluation_id = nova_avaliacao['id']
 
-        # Create BaseListings
-        for idx, imovel in enumerate(imoveis_considerados, start=1):
-            # Helper to support PT/EN keys when extracting listing data
-            def get_attr(obj, *attrs):
-                if isinstance(obj, dict):
-                    for attr in attrs:
-                        value = obj.get(attr)
-                        if value not in (None, ""):
-                            return value
-                else:
-                    for attr in attrs:
-                        value = getattr(obj, attr, None)
-                        if value not in (None, ""):
-                            return value
-                return None
-
-            listing_data = {
-                "sample_number": get_attr(imovel, 'numero_amostra', 'sample_number') or idx,
-                "address": get_attr(imovel, 'endereco', 'address'),
-                "neighborhood": get_attr(imovel, 'bairro', 'neighborhood'),
-                "city": get_attr(imovel, 'cidade', 'city'),
-                "state": get_attr(imovel, 'estado', 'state'),
-                "link": get_attr(imovel, 'link', 'url'),
-                "area": get_attr(imovel, 'area'),
-                "bedrooms": get_attr(imovel, 'quartos', 'bedrooms') or 0,
-                "bathrooms": get_attr(imovel, 'banheiros', 'bathrooms') or 0,
-                "parking_spaces": get_attr(imovel, 'vagas', 'parking_spaces') or 0,
-                "rent_value": get_attr(imovel, 'valor_aluguel', 'valor_total', 'rent_value', 'price', 'sale_value'),
-                "condo_fee": get_attr(imovel, 'valor_condominio', 'condo_fee'),
-                "type": get_attr(imovel, 'tipo', 'type'),
-                "purpose": get_attr(imovel, 'finalidade', 'purpose'),
-                "collected_at": datetime.utcnow().isoformat()
-            }
-            
-            resp_listing, status_listing = create_base_listing(evaluation_id, listing_data)
-            if status_listing != 201:
-                return f"Erro ao salvar imóvel comparativo: {resp_listing.get_json().get('error')}"
+        # Create BaseListings in one request
+        if imoveis_considerados:
+            collected_at = datetime.utcnow().isoformat()
+            listings = [_listing_payload(imovel, collected_at) for imovel in imoveis_considerados]
+            resp_listings, status_listings = create_base_listings_bulk(
+                evaluation_id, {"listings": listings, "skip_invalid": True}
+            )
+            if status_listings != 201:
+                return f"Erro ao salvar imóveis comparativos: {resp_listings.get_json().get('error')}"
+            skipped = resp_listings.get_json()['skipped']
+            if skipped:
+                return f"Avaliação salva com sucesso! ID: {evaluation_id}. {_skipped_message(skipped)}"
 
         return f"Avaliação salva com sucesso! ID: {evaluation_id}"
 
@@ -299,7 +326,8 @@ def listar_avaliacoes():
 def alterar_avaliacao(id: int, campo: str, novo_valor: str):
     """
     Atualiza um campo específico de uma avaliação.
-    Campos permitidos: owner_name, appraiser_name, estimated_price, rounded_price, description, classification, purpose, property_type, bedrooms, bathrooms, parking_spaces, area.
+    Campos permitidos: owner_name, appraiser_name, estimated_price, rounded_price, description, classification, purpose, property_type, bedrooms, bathrooms, parking_spaces, area, value_statistic.
+    value_statistic define a estatística do Valor/m² da região: mean (média), median (mediana) ou trimmed_mean (média aparada).
     """
     try:
         data = {}
@@ -309,8 +337,10 @@ def alterar_avaliacao(id: int, campo: str, novo_valor: str):
             data[campo] = int(novo_valor)
         elif campo in ['owner_name', 'appraiser_name', 'description', 'classification', 'purpose', 'property_type']:
             data[campo] = novo_valor
+        elif campo == 'value_statistic':
+            data[campo] = (novo_valor or "").strip().lower()
         else:
-            return "Campo inválido. Use: owner_name, appraiser_name, estimated_price, rounded_price, description, classification, purpose, property_type, bedrooms, bathrooms, parking_spaces, area."
+            return "Campo inválido. Use: owner_name, appraiser_name, estimated_price, rounded_price, description, classification, purpose, property_type, bedrooms, bathrooms, parking_spaces, area, value_statistic."
             
         response, status = update_evaluation(id, data)
         if status != 200:
@@ -407,6 +437,59 @@ def deletar_imoveis_base(ids: List[int]):
     except Exception as e:
         return f"Erro ao deletar imóveis base: {str(e)}"
 
+@tool
+def buscar_comparaveis_salvos(evaluation_id: int, limite: int = 20, escopo: str = "neighborhood", max_dias: int = 90):
+    """
+    Busca imóveis semelhantes já coletados em outras avaliações da unidade (mesma cidade e bairro,
+    área ±30%, quartos/banheiros/vagas ±1, coletados nos últimos `max_dias` dias), ordenados por
+    semelhança. Use ANTES de pesquisar na web e pesquise só o que faltar para completar a amostra.
+    escopo: "neighborhood" (mesmo bairro) ou "city" (cidade toda).
+    Os resultados já vêm no formato de `adicionar_imoveis_base` (sem numero_amostra, que o servidor
+    atribui, e com a data original da coleta em collected_at).
+    """
+    try:
+        response, status = get_comparables(evaluation_id, {'limit': limite, 'scope': escopo, 'max_age_days': max_dias})
+        if status != 200:
+            return f"Não foi possível buscar comparáveis: {response.get_json().get('error')}"
+        items = response.get_json()['items']
+        if not items:
+            return "Nenhum imóvel semelhante salvo encontrado; pesquise na web."
+        return json.dumps([_saved_comparable(item) for item in items], indent=2, ensure_ascii=False)
+    except Exception as e:
+        return f"Erro ao buscar comparáveis salvos: {str(e)}"
+
+@tool
+def analisar_outliers(evaluation_id: int, metodo: str = "iqr", desativar: bool = False):
+    """
+    Calcula no servidor as estatísticas do Valor/m² dos imóveis ativos da avaliação (média,
+    mediana, média aparada, intervalos de confiança de 95%) e aponta os outliers de forma
+    determinística. Use no lugar de procurar outliers manualmente.
+    metodo: "iqr" (cercas de Tukey, padrão) ou "mad" (desvio absoluto da mediana).
+    desativar: se True, desativa os outliers encontrados (com o motivo) em uma única operação.
+    Retorna as estatísticas e os IDs dos imóveis sinalizados.
+    """
+    try:
+        response, status = get_evaluation_statistics(evaluation_id, {'outlier_method': metodo})
+        if status != 200:
+            return f"Não foi possível analisar a avaliação: {response.get_json().get('error')}"
+        result = response.get_json()
+        outlier_ids = [item['id'] for item in result['statistics']['outliers']]
+        result['outlier_ids'] = outlier_ids
+
+        if desativar and outlier_ids:
+            updates = [
+                {'id': listing_id, 'is_active': False, 'deactivation_reason': f"Outlier de Valor/m² ({metodo.upper()})"}
+                for listing_id in outlier_ids
+            ]
+            response, status = update_base_listings_bulk(evaluation_id, {'persist': True, 'updates': updates})
+            if status != 200:
+                return f"Erro ao desativar outliers: {response.get_json().get('error')}"
+            result['desativados'] = outlier_ids
+            result['avaliacao_atualizada'] = response.get_json()['evaluation']
+        return json.dumps(result, indent=2, ensure_ascii=False)
+    except Exception as e:
+        return f"Erro ao analisar outliers: {str(e)}"
+
 @tool
 def adicionar_imoveis_base(evaluation_id: int, imoveis: List[Dict[str, Any]]):
     """
@@ -421,71 +504,28 @@ def adicionar_imoveis_base(evaluation_id: int, imoveis: List[Dict[str, Any]]):
     - valor_aluguel/rent_value, valor_condominio/condo_fee (float)
     - tipo/type (str): ex: Apartamento
     - finalidade/purpose (str): ex: Residencial
+    - coletado_em/collected_at (str ISO, opcional): data da coleta; padrão agora
     """
     try:
         if is_evaluation_canceled(evaluation_id):
             publish_event(f"evaluation:{evaluation_id}", "cancelled", {"reason": "user_requested"})
             return f"Operacao cancelada pelo usuario para avaliacao {evaluation_id}."
-        # Check if evaluation exists
-        response, status = get_evaluation(evaluation_id)
-        if status != 200:
-            return f"Avaliação com ID {evaluation_id} não encontrada."
-
-        evaluation_data = response.get_json()
-        existing_listings = evaluation_data.get('base_listings', [])
-        
-        next_sample_number = max([l.get('sample_number') for l in existing_listings if l.get('sample_number')], default=0) + 1
-        
-        count = 0
-        for imovel in imoveis:
-            if is_evaluation_canceled(evaluation_id):
-                publish_event(f"evaluation:{evaluation_id}", "cancelled", {"reason": "user_requested"})
-                return f"Operacao cancelada pelo usuario para avaliacao {evaluation_id}."
-            # Helper function to get value from dict (supports both PT and EN keys)
-            def get_attr(obj, attr_pt, attr_en=None, *extra_aliases):
-                if isinstance(obj, dict):
-                    # Try Portuguese first, then English
-                    for key in (attr_pt, attr_en, *extra_aliases):
-                        if not key:
-                            continue
-                        value = obj.get(key)
-                        if value not in (None, ""):
-                            return value
-                    return None
-                for key in (attr_pt, attr_en, *extra_aliases):
-                    if not key:
-                        continue
-                    value = getattr(obj, key, None)
-                    if value not in (None, ""):
-                        return value
-                return None
-
-            listing_data = {
-                "sample_number": get_attr(imovel, 'numero_amostra', 'sample_number') or next_sample_number,
-                "address": get_attr(imovel, 'endereco', 'address'),
-                "neighborhood": get_attr(imovel, 'bairro', 'neighborhood'),
-                "city": get_attr(imovel, 'cidade', 'city'),
-                "state": get_attr(imovel, 'estado', 'state'),
-                "link": get_attr(imovel, 'link', None, 'url'),
-                "area": get_attr(imovel, 'area'),
-                "bedrooms": get_attr(imovel, 'quartos', 'bedrooms') or 0,
-                "bathrooms": get_attr(imovel, 'banheiros', 'bathrooms') or 0,
-                "parking_spaces": get_attr(imovel, 'vagas', 'parking_spaces') or 0,
-                "rent_value": get_attr(imovel, 'valor_aluguel', 'rent_value', 'valor_total', 'price', 'sale_value'),
-                "condo_fee": get_attr(imovel, 'valor_condominio', 'condo_fee'),
-                "type": get_attr(imovel, 'tipo', 'type'),
-                "purpose": get_attr(imovel, 'finalidade', 'purpose'),
-                "collected_at": datetime.utcnow().isoformat()
-            }
-            
-            resp_l, status_l = create_base_listing(evaluation_id, listing_data)
-            if status_l == 201:
-                count += 1
-                next_sample_number += 1
-        
-        return f"{count} imóveis base adicionados com sucesso à avaliação {evaluation_id}."
+        collected_at = datetime.utcnow().isoformat()
+        listings = [_listing_payload(imovel, collected_at) for imovel in imoveis]
+        # Like adding one by one: a bad comparable is skipped instead of losing the whole batch.
+        response, status = create_base_listings_bulk(evaluation_id, {"listings": listings, "skip_invalid": True})
+        if status != 201:
+            return f"Erro ao adicionar imóveis base: {response.get_json().get('error')}"
+
+        result = response.get_json()
+        message = f"{len(result['listings'])} imóveis base adicionados com sucesso à avaliação {evaluation_id}."
+        if result['skipped']:
+            message += f" {_skipped_message(result['skipped'])}"
+        return message
+    except NotFound:
+        return f"Avaliação com ID {evaluation_id} não encontrada."
     except Exception as e:
         return f"Erro ao adicionar imóveis base: {str(e)}"
 
-toolsList = [salvar_avaliacao_db, ler_instrucoes_para_nova_avaliacao, ler_instrucoes_para_atualizar_uma_avaliacao_existente, ler_avaliacao, listar_avaliacoes, alterar_avaliacao, deletar_avaliacao, ler_imovel_base, alterar_imovel_base, deletar_imoveis_base, adicionar_imoveis_base, ler_conteudo_site, pesquisar_sites]
+toolsList = [salvar_avaliacao_db, ler_instrucoes_para_nova_avaliacao, ler_instrucoes_para_atualizar_uma_avaliacao_existente, ler_avaliacao, listar_avaliacoes, alterar_avaliacao, deletar_avaliacao, ler_imovel_base, alterar_imovel_base, deletar_imoveis_base, buscar_comparaveis_salvos, analisar_outliers, adicionar_imoveis_base, ler_conteudo_site, ler_conteudos_sites, pesquisar_sites, pesquisar_sites_variacoes]
 tools_node = ToolNode(toolsList)
\ No newline at end of file
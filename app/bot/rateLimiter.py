@@ -0,0 +1,164 @@
+"""
+Per-domain / per-API-key throttling for the scraper and the web search.
+
+Every key (a portal host, a search API key) gets a token bucket that spaces out
+requests and a circuit breaker that fails fast once the key keeps erroring
+(429s, captchas, timeouts), instead of spending an LLM turn on a doomed
+request. State is per process; size the rates for one worker.
+"""
+
+import json
+import logging
+import os
+import time
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+WAIT_STEP = 0.1
+
+# Defaults per kind of key: sustained requests per second, burst and breaker settings.
+# RATE_LIMIT_RULES overrides single keys, e.g. {"www.zapimoveis.com.br": {"rate": 0.5, "burst": 2}}.
+DEFAULT_RULES = {
+    'domain': {
+        'rate': float(os.environ.get("SCRAPER_DOMAIN_RATE", 1)),
+        'burst': int(os.environ.get("SCRAPER_DOMAIN_BURST", 3)),
+    },
+    'api': {
+        'rate': float(os.environ.get("WEB_SEARCH_RATE", 2)),
+        'burst': int(os.environ.get("WEB_SEARCH_BURST", 5)),
+    },
+}
+KEY_RULES = json.loads(os.environ.get("RATE_LIMIT_RULES") or "{}")
+# Consecutive failures that open the circuit, and how long it stays open before a probe.
+FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", 5))
+RESET_AFTER = float(os.environ.get("CIRCUIT_RESET_SECONDS", 60))
+# Longest a caller waits for a token before giving up.
+MAX_WAIT = float(os.environ.get("RATE_LIMIT_MAX_WAIT", 30))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class Throttle:
+    """Token bucket plus circuit breaker for one key."""
+
+    def __init__(self, key, rate, burst, failure_threshold=FAILURE_THRESHOLD, reset_after=RESET_AFTER):
+        self.key = key
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._probe_started = None
+        self._lock = Lock()
+        self.counters = {
+            'requests': 0,
+            'throttled': 0,
+            'waited_seconds': 0.0,
+            'rejected': 0,
+            'successes': 0,
+            'failures': 0,
+            'opened': 0,
+        }
+
+    def allow(self):
+        """False while the circuit is open; lets a single probe through once it is due."""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_after:
+                self._state = HALF_OPEN
+                self._probing = False
+            if self._state == CLOSED:
+                return True
+            # A probe that never reported back (cancelled, timed out) is replaced after reset_after.
+            if self._state == HALF_OPEN and (not self._probing or time.monotonic() - self._probe_started >= self.reset_after):
+                self._probing = True
+                self._probe_started = time.monotonic()
+                return True
+            self.counters['rejected'] += 1
+            return False
+
+    def _take_token(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate if self.rate > 0 else WAIT_STEP
+
+    def wait(self, timeout=MAX_WAIT, should_cancel=None):
+        """Blocks until a token is available. False when cancelled or after `timeout` seconds."""
+        started = time.monotonic()
+        throttled = False
+        while True:
+            with self._lock:
+                missing = self._take_token()
+                if missing == 0:
+                    self.counters['requests'] += 1
+                    if throttled:
+                        self.counters['throttled'] += 1
+                        self.counters['waited_seconds'] += time.monotonic() - started
+                    return True
+            throttled = True
+            if should_cancel is not None and should_cancel():
+                return False
+            if time.monotonic() - started + min(missing, WAIT_STEP) > timeout:
+                logger.warning(f"Rate limit wait for {self.key} exceeded {timeout}s")
+                return False
+            time.sleep(min(missing, WAIT_STEP))
+
+    def success(self):
+        with self._lock:
+            self.counters['successes'] += 1
+            self._failures = 0
+            if self._state != CLOSED:
+                logger.info(f"Circuit for {self.key} closed again")
+            self._state = CLOSED
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self.counters['failures'] += 1
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+                self.counters['opened'] += 1
+                logger.warning(f"Circuit for {self.key} opened after {self._failures} consecutive failures")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'tokens': round(self._tokens, 2),
+                **{name: round(value, 3) if isinstance(value, float) else value for name, value in self.counters.items()}
+            }
+
+
+_throttles = {}
+_throttles_lock = Lock()
+
+
+def get_throttle(key, kind='domain'):
+    with _throttles_lock:
+        throttle = _throttles.get(key)
+        if throttle is None:
+            rule = {**DEFAULT_RULES[kind], **KEY_RULES.get(key, {})}
+            throttle = _throttles[key] = Throttle(key, rule['rate'], rule['burst'])
+        return throttle
+
+
+def get_throttle_stats():
+    """Counters and breaker state of every key used in this process."""
+    with _throttles_lock:
+        throttles = list(_throttles.values())
+    return {throttle.key: throttle.stats() for throttle in throttles}
@@ -2,35 +2,683 @@ from selenium import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
 from webdriver_manager.chrome import ChromeDriverManager
 from bs4 import BeautifulSoup
+from contentExtractor import reduce_page
+from listingExtractor import extract_listings
+from rateLimiter import get_throttle
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Lock, Semaphore
+import atexit
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import re
+import requests
+import tempfile
 import time
+import zstandard
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
 
-def extract_content(url):
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+# Polling step of the waits below, so a cancelled run does not hold the browser.
+WAIT_STEP = 0.1
+
+# Readiness after driver.get(): Chrome returns at DOMContentLoaded ('eager') and the
+# page is considered ready by one of these strategies, bounded by SCRAPER_READY_TIMEOUT:
+# - 'ready_state': document.readyState is 'complete'
+# - 'network_idle': ready_state plus no new resource requests for NETWORK_IDLE_WINDOW seconds
+# - 'selector': ready_state plus a CSS selector present (listing cards of a portal)
+READY_STRATEGIES = ('ready_state', 'network_idle', 'selector')
+READY_STRATEGY = os.environ.get("SCRAPER_READY_STRATEGY", "network_idle")
+READY_TIMEOUT = float(os.environ.get("SCRAPER_READY_TIMEOUT", 10))
+NETWORK_IDLE_WINDOW = float(os.environ.get("SCRAPER_NETWORK_IDLE_WINDOW", 0.5))
+
+# Per-portal rules, matched on the host name suffix. Extra rules can be given as JSON in
+# SCRAPER_READY_RULES, e.g. {"example.com.br": {"strategy": "selector", "selector": ".card"}}.
+DOMAIN_READY_RULES = {
+    'zapimoveis.com.br': {'strategy': 'selector', 'selector': '[data-cy="rp-property-cd"], [data-cy="ldp-propertyInfo-address"]'},
+    'vivareal.com.br': {'strategy': 'selector', 'selector': '[data-cy="rp-property-cd"], [data-cy="ldp-propertyInfo-address"]'},
+}
+DOMAIN_READY_RULES.update(json.loads(os.environ.get("SCRAPER_READY_RULES") or "{}"))
+if READY_STRATEGY not in READY_STRATEGIES or READY_STRATEGY == 'selector':
+    # 'selector' needs a per-domain selector, so it cannot be the default.
+    READY_STRATEGY = 'network_idle'
+
+# Tier 1 (plain HTTP) settings. A page is escalated to the browser when the request
+# fails, the portal requires JS, its listing selector is missing from the server HTML
+# or the main-content text is shorter than SCRAPER_HTTP_MIN_TEXT_CHARS. Client errors
+# (4xx other than 403/429) and non-HTML responses are final and never reach the browser.
+HTTP_TIMEOUT = float(os.environ.get("SCRAPER_HTTP_TIMEOUT", 10))
+HTTP_MIN_TEXT_CHARS = int(os.environ.get("SCRAPER_HTTP_MIN_TEXT_CHARS", 500))
+# Per-portal overrides, e.g. {"portal.com.br": {"requires_js": true}} to always use the
+# browser, or {"selector": ".card"} for the markup the server HTML must contain.
+DOMAIN_FETCH_RULES = {}
+DOMAIN_FETCH_RULES.update(json.loads(os.environ.get("SCRAPER_FETCH_RULES") or "{}"))
+
+_http_session = requests.Session()
+_http_session.headers.update({
+    'User-Agent': USER_AGENT,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8'
+})
+_http_session.mount('https://', HTTPAdapter(pool_connections=20, pool_maxsize=20))
+_http_session.mount('http://', HTTPAdapter(pool_connections=20, pool_maxsize=20))
+
+# Batch reads (extract_contents): pages fetched at once per call, and at most
+# SCRAPER_DOMAIN_CONCURRENCY of them hitting the same portal at a time per process.
+BATCH_WORKERS = int(os.environ.get("SCRAPER_BATCH_WORKERS", 5))
+BATCH_MAX_URLS = int(os.environ.get("SCRAPER_BATCH_MAX_URLS", 10))
+DOMAIN_CONCURRENCY = int(os.environ.get("SCRAPER_DOMAIN_CONCURRENCY", 2))
+
+# Page text kept alongside structured listings (JSON-LD, __NEXT_DATA__, microdata).
+STRUCTURED_CONTENT_CHARS = int(os.environ.get("SCRAPER_STRUCTURED_CONTENT_CHARS", 3000))
+
+_fetch_stats = {'http': 0, 'browser': 0, 'cache': 0}
+_fetch_stats_lock = Lock()
+
+_domain_slots = {}
+_domain_slots_lock = Lock()
+
+# Responses that count as a failure for the portal's circuit breaker (see rateLimiter).
+BLOCKING_STATUS_CODES = {403, 429, 500, 502, 503, 504}
+BLOCKED_TITLE_PATTERN = re.compile(r'captcha|access denied|acesso negado|attention required|just a moment', re.IGNORECASE)
+
+# On-disk cache of extracted pages, keyed by normalized URL and zstd-compressed.
+# Entries older than SCRAPER_CACHE_TTL seconds are ignored; when the directory grows
+# past SCRAPER_CACHE_MAX_BYTES the least recently used entries are deleted.
+CACHE_DIR = os.environ.get("SCRAPER_CACHE_DIR") or os.path.join(tempfile.gettempdir(), 'precifica_page_cache')
+CACHE_TTL = float(os.environ.get("SCRAPER_CACHE_TTL", 6 * 60 * 60))
+CACHE_MAX_BYTES = int(os.environ.get("SCRAPER_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+CACHE_ENABLED = CACHE_TTL > 0 and CACHE_MAX_BYTES > 0
+# Query parameters that do not change the page content.
+TRACKING_PARAMS = ('utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content', 'gclid', 'fbclid')
+
+# Warm browsers shared by every run of this process. A browser is recycled after
+# SCRAPER_BROWSER_MAX_PAGES pages or SCRAPER_BROWSER_MAX_IDLE seconds without use.
+POOL_SIZE = int(os.environ.get("SCRAPER_POOL_SIZE", 2))
+BROWSER_MAX_PAGES = int(os.environ.get("SCRAPER_BROWSER_MAX_PAGES", 20))
+BROWSER_MAX_IDLE = float(os.environ.get("SCRAPER_BROWSER_MAX_IDLE", 300))
+ACQUIRE_TIMEOUT = float(os.environ.get("SCRAPER_ACQUIRE_TIMEOUT", 120))
+
+_driver_path = None
+_driver_path_lock = Lock()
+
+
+def get_driver_path():
+    """Resolves the chromedriver binary once per process (CHROMEDRIVER_PATH skips the download check)."""
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is None:
+            _driver_path = os.environ.get("CHROMEDRIVER_PATH") or ChromeDriverManager().install()
+        return _driver_path
+
+
+def _chrome_options():
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless')  # Run in background without opening a window
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument(f"user-agent={USER_AGENT}")
+    # driver.get() returns at DOMContentLoaded; wait_until_ready decides when the page is usable.
+    options.page_load_strategy = 'eager'
+    return options
+
+
+class PooledBrowser:
+    """A live Chrome instance handed out by BrowserPool."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.created_at = time.monotonic()
+        self.released_at = self.created_at
+
+    def is_healthy(self):
+        try:
+            self.driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def reset(self):
+        """
+        Leaves a single fresh tab with no cookies, cache or site storage, so portal
+        sessions and anti-bot state do not carry over to the next page.
+        """
+        old_handles = list(self.driver.window_handles)
+        origins = set()
+        self.driver.switch_to.new_window('tab')
+        fresh_handle = self.driver.current_window_handle
+        for handle in old_handles:
+            self.driver.switch_to.window(handle)
+            parsed = urlparse(self.driver.current_url or '')
+            if parsed.scheme in ('http', 'https'):
+                origins.add(f"{parsed.scheme}://{parsed.netloc}")
+            self.driver.close()
+        self.driver.switch_to.window(fresh_handle)
+        # delete_all_cookies() only reaches the current page's domain (about:blank here),
+        # so clear through DevTools for the whole browser.
+        self.driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+        self.driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+        for origin in origins:
+            self.driver.execute_cdp_cmd('Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'})
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+
+class BrowserPool:
+    """
+    Bounded pool of warm headless Chrome instances.
+
+    acquire() hands out an idle browser (health checked) or launches a new one
+    while fewer than `size` exist; release() resets it and keeps it for the
+    next page, or quits it once it served `max_pages` pages.
+    """
+
+    def __init__(self, size=POOL_SIZE, max_pages=BROWSER_MAX_PAGES, max_idle=BROWSER_MAX_IDLE, driver_factory=None):
+        self.size = size
+        self.max_pages = max_pages
+        self.max_idle = max_idle
+        self._driver_factory = driver_factory or self._launch
+        self._slots = Semaphore(size)
+        self._idle = []
+        self._lock = Lock()
+        self.stats = {'launched': 0, 'reused': 0, 'recycled': 0, 'unhealthy': 0}
+
+    def _launch(self):
+        return webdriver.Chrome(service=ChromeService(get_driver_path()), options=_chrome_options())
+
+    def _take_idle(self):
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                browser = self._idle.pop()
+            if now - browser.released_at > self.max_idle:
+                self.stats['recycled'] += 1
+                browser.quit()
+                continue
+            if not browser.is_healthy():
+                self.stats['unhealthy'] += 1
+                browser.quit()
+                continue
+            self.stats['reused'] += 1
+            return browser
+
+    def acquire(self, timeout=ACQUIRE_TIMEOUT, should_cancel=None):
+        """Returns a PooledBrowser, or None on timeout or when should_cancel() becomes true."""
+        deadline = time.monotonic() + timeout
+        while not self._slots.acquire(timeout=min(WAIT_STEP, max(deadline - time.monotonic(), 0))):
+            if (should_cancel is not None and should_cancel()) or time.monotonic() >= deadline:
+                return None
+
+        try:
+            browser = self._take_idle()
+            if browser is None:
+                browser = PooledBrowser(self._driver_factory())
+                self.stats['launched'] += 1
+            return browser
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, browser, discard=False):
+        try:
+            browser.pages += 1
+            if discard or browser.pages >= self.max_pages:
+                self.stats['recycled'] += 1
+                browser.quit()
+                return
+            try:
+                browser.reset()
+            except Exception as e:
+                logger.warning(f"Discarding browser that failed to reset: {e}")
+                self.stats['unhealthy'] += 1
+                browser.quit()
+                return
+            browser.released_at = time.monotonic()
+            with self._lock:
+                self._idle.append(browser)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for browser in idle:
+            browser.quit()
+
+
+browser_pool = BrowserPool()
+atexit.register(browser_pool.close)
+
+
+def acquire_browser(timeout=ACQUIRE_TIMEOUT, should_cancel=None):
+    return browser_pool.acquire(timeout=timeout, should_cancel=should_cancel)
+
+
+def release_browser(browser, discard=False):
+    browser_pool.release(browser, discard=discard)
+
+
+@contextmanager
+def browser_session(timeout=ACQUIRE_TIMEOUT, should_cancel=None):
+    """Acquire/release around a block; yields None when no browser could be acquired."""
+    browser = acquire_browser(timeout=timeout, should_cancel=should_cancel)
+    if browser is None:
+        yield None
+        return
+    failed = False
+    try:
+        yield browser
+    except Exception:
+        failed = True
+        raise
+    finally:
+        release_browser(browser, discard=failed)
+
+
+def _domain_rule(rules, url, default=None):
+    host = (urlparse(url).hostname or '').lower()
+    for domain, rule in rules.items():
+        if host == domain or host.endswith('.' + domain):
+            return rule
+    return default
+
+
+def ready_rule_for(url):
+    return _domain_rule(DOMAIN_READY_RULES, url, {'strategy': READY_STRATEGY})
+
+
+def _is_ready(driver, rule, state):
+    if driver.execute_script("return document.readyState") != 'complete':
+        return False
+    strategy = rule.get('strategy')
+    if strategy == 'selector':
+        return bool(driver.execute_script("return document.querySelector(arguments[0]) !== null", rule['selector']))
+    if strategy == 'network_idle':
+        count = driver.execute_script("return performance.getEntriesByType('resource').length")
+        now = time.monotonic()
+        if count != state.get('resources'):
+            state['resources'] = count
+            state['since'] = now
+            return False
+        return now - state['since'] >= NETWORK_IDLE_WINDOW
+    return True
+
+
+def wait_until_ready(driver, url, should_cancel=None, timeout=None):
+    """
+    Polls the page until the rule for its domain is met, the timeout expires or
+    should_cancel() is true. Returns a report with the time actually waited.
+    """
+    rule = ready_rule_for(url)
+    timeout = READY_TIMEOUT if timeout is None else timeout
+    started = time.monotonic()
+    state = {}
+    report = {'strategy': rule.get('strategy'), 'ready': False, 'cancelled': False}
+    while True:
+        if should_cancel is not None and should_cancel():
+            report['cancelled'] = True
+            break
+        try:
+            if _is_ready(driver, rule, state):
+                report['ready'] = True
+                break
+        except Exception as e:
+            logger.debug(f"Readiness check failed for {url}: {e}")
+        if time.monotonic() - started >= timeout:
+            break
+        time.sleep(WAIT_STEP)
+    report['waited'] = round(time.monotonic() - started, 3)
+    return report
+
+
+def _page_from_soup(url, soup):
+    """
+    Page dict with the listings embedded in `soup` (see listingExtractor) and its
+    main-content text (see contentExtractor.reduce_page). When structured listings
+    are found the text is only context, so it is capped at STRUCTURED_CONTENT_CHARS.
+    """
+    title = soup.title.string if soup.title else 'No title'
+    listings = extract_listings(url, soup)
+    content, size = reduce_page(soup, STRUCTURED_CONTENT_CHARS) if listings else reduce_page(soup)
+    logger.info(f"Reduced {url} from {size['original_bytes']} to {size['reduced_bytes']} bytes, {len(listings)} structured listings")
+    page = {
+        'url': url,
+        'title': title,
+        'content': content,
+        'size': size
+    }
+    if listings:
+        page['imoveis'] = listings
+    return page
+
+
+def _record_tier(url, tier):
+    with _fetch_stats_lock:
+        _fetch_stats[tier] += 1
+    logger.info(f"Scraper tier '{tier}' served {url}")
+
+
+def get_fetch_stats():
+    """How many pages each tier served in this process ('http' and 'cache' ones avoided a browser)."""
+    with _fetch_stats_lock:
+        return dict(_fetch_stats)
+
+
+def _host(url):
+    return (urlparse(url).hostname or '').lower()
+
+
+def _is_blocked(soup):
+    title = soup.title.string if soup.title and soup.title.string else ''
+    return bool(BLOCKED_TITLE_PATTERN.search(title))
+
+
+def fetch_http(url, should_cancel=None, throttle=None):
+    """
+    Tier 1: plain HTTP GET with the browser's user agent. Returns the page dict, or
+    None when the page has to be rendered by the browser. Pages the browser would not
+    render usefully either (4xx other than 403/429, non-HTML content) return a final
+    {'url', 'error', 'status'} without 'content'.
+
+    Pass the domain's `throttle` when the caller already took its token. Only results
+    that settle the URL are reported to the breaker; a block or error that escalates
+    to the browser is left for the browser tier to report.
+    """
+    rule = _domain_rule(DOMAIN_FETCH_RULES, url, {})
+    if rule.get('requires_js'):
+        return None
+
+    if throttle is None:
+        throttle = get_throttle(_host(url))
+        if not throttle.wait(should_cancel=should_cancel):
+            return None
+    started = time.monotonic()
+    try:
+        response = _http_session.get(url, timeout=HTTP_TIMEOUT)
+    except requests.RequestException as e:
+        logger.info(f"HTTP fetch failed for {url}, falling back to the browser: {e}")
+        return None
+    load_seconds = round(time.monotonic() - started, 3)
+
+    if response.status_code in BLOCKING_STATUS_CODES:
+        return None
+    content_type = response.headers.get('Content-Type', '')
+    if 400 <= response.status_code < 500:
+        # Not found, gone, etc.: the server answered and a browser would get the same answer.
+        throttle.success()
+        return {'url': url, 'error': f'HTTP {response.status_code}', 'status': response.status_code}
+    if response.status_code != 200:
+        return None
+    if content_type and 'html' not in content_type:
+        throttle.success()
+        return {'url': url, 'error': f'Not an HTML page ({content_type})', 'status': response.status_code}
+
+    soup = BeautifulSoup(response.text, 'html.parser')
+    if _is_blocked(soup):
+        return None
+    # The portal's listing markup must be in the server HTML, otherwise it is rendered by JS.
+    expected_selector = rule.get('selector') or _domain_rule(DOMAIN_READY_RULES, url, {}).get('selector')
+    if expected_selector and soup.select_one(expected_selector) is None:
+        return None
+    page = _page_from_soup(url, soup)
+    if len(page['content']) < HTTP_MIN_TEXT_CHARS:
+        return None
+
+    throttle.success()
+    page['timing'] = {'load': load_seconds}
+    return page
+
+
+def extract_with_browser(url, should_cancel=None, browser=None, throttle=None):
+    """
+    Tier 2: loads `url` in a headless Chrome and returns its title and text. Uses the
+    given PooledBrowser, or borrows one from the pool for the duration of the call.
+    Pass the domain's `throttle` when the caller already took its token.
+    """
+    if browser is None:
+        try:
+            with browser_session(should_cancel=should_cancel) as pooled:
+                if pooled is None:
+                    if should_cancel is not None and should_cancel():
+                        return {'url': url, 'cancelled': True}
+                    return {'url': url, 'error': 'No browser available'}
+                return extract_with_browser(url, should_cancel=should_cancel, browser=pooled, throttle=throttle)
+        except Exception as e:
+            return {'error': str(e)}
+
+    if should_cancel is not None and should_cancel():
+        return {'url': url, 'cancelled': True}
+
+    if throttle is None:
+        throttle = get_throttle(_host(url))
+        if not throttle.wait(should_cancel=should_cancel):
+            if should_cancel is not None and should_cancel():
+                return {'url': url, 'cancelled': True}
+            return {'url': url, 'error': 'Rate limit wait timed out'}
+
+    driver = browser.driver
+    started = time.monotonic()
     try:
-        options = webdriver.ChromeOptions()
-        options.add_argument('--headless')  # Run in background without opening a window
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-        options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-
-        driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
-        
         driver.get(url)
-        time.sleep(5)  # Wait for the page to load completely (including JS)
-        
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        driver.quit()
-
-        # Example: extract page title
-        title = soup.title.string if soup.title else 'No title'
-        return {
-            'url': url,
-            'title': title,
-            'content': soup.get_text()
-        }
+    except Exception:
+        throttle.failure()
+        raise
+    load_seconds = round(time.monotonic() - started, 3)
+    wait = wait_until_ready(driver, url, should_cancel=should_cancel)
+    if wait['cancelled']:
+        return {'url': url, 'cancelled': True}
+    if not wait['ready']:
+        logger.info(f"Page not ready after {wait['waited']}s ({wait['strategy']}), extracting anyway: {url}")
+
+    soup = BeautifulSoup(driver.page_source, 'html.parser')
+    if _is_blocked(soup):
+        throttle.failure()
+        return {'url': url, 'error': 'Blocked by the portal (captcha)'}
+    throttle.success()
+    page = _page_from_soup(url, soup)
+    page['timing'] = {'load': load_seconds, **wait}
+    return page
+
+
+def normalize_url(url):
+    """Lowercases scheme/host, drops the fragment and tracking params, sorts the query."""
+    parsed = urlparse(url.strip())
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS
+    )
+    path = parsed.path or '/'
+    return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), path, parsed.params, urlencode(query), ''))
+
+
+class PageCache:
+    """Compressed extracted pages on disk; safe to share between worker processes."""
+
+    def __init__(self, directory=CACHE_DIR, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        # Bytes written since the last scan; a full scan only happens when this may exceed the cap.
+        self._approx_bytes = None
+
+    def _path(self, url):
+        key = hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key[:2], key + '.zst')
+
+    def get(self, url):
+        path = self._path(url)
+        try:
+            with open(path, 'rb') as handle:
+                entry = json.loads(zstandard.ZstdDecompressor().decompress(handle.read()))
+        except (OSError, ValueError, zstandard.ZstdError):
+            return None
+        if time.time() - entry['stored_at'] > self.ttl:
+            return None
+        try:
+            # mtime tracks the last use for LRU eviction.
+            os.utime(path)
+        except OSError:
+            pass
+        return entry['page']
+
+    def set(self, url, page):
+        path = self._path(url)
+        data = zstandard.ZstdCompressor(level=6).compress(
+            json.dumps({'stored_at': time.time(), 'page': page}, ensure_ascii=False).encode('utf-8')
+        )
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as handle:
+                handle.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write page cache entry for {url}: {e}")
+            return
+
+        with self._lock:
+            if self._approx_bytes is None:
+                self._approx_bytes = self._scan_size()
+            else:
+                self._approx_bytes += len(data)
+            if self._approx_bytes > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                file_path = os.path.join(root, name)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, file_path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Deletes least recently used entries until the cache is under 90% of the cap."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, file_path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(file_path)
+                total -= size
+            except OSError:
+                pass
+        self._approx_bytes = total
+
+
+page_cache = PageCache()
+
+
+def extract_content(url, should_cancel=None, browser=None, use_cache=True):
+    """
+    Returns the title and text of `url`, from the page cache when fresh, else trying
+    a plain HTTP fetch first and rendering it in the browser pool only when that is
+    not enough. The result carries the tier that served it ('http' or 'browser') and
+    'cached': True on a cache hit. use_cache=False bypasses (and refreshes) the cache.
+    """
+    if should_cancel is not None and should_cancel():
+        return {'url': url, 'cancelled': True}
+
+    if use_cache and CACHE_ENABLED:
+        started = time.monotonic()
+        page = page_cache.get(url)
+        if page is not None:
+            page['cached'] = True
+            page['timing'] = {'cache': round(time.monotonic() - started, 4)}
+            _record_tier(url, 'cache')
+            return page
+
+    # Fail fast while the portal keeps erroring instead of spending a browser on it.
+    throttle = get_throttle(_host(url))
+    if not throttle.allow():
+        return {'url': url, 'error': f"{_host(url)} is failing repeatedly; try again later"}
+    # One token per URL, whichever tier ends up serving it.
+    if not throttle.wait(should_cancel=should_cancel):
+        if should_cancel is not None and should_cancel():
+            return {'url': url, 'cancelled': True}
+        return {'url': url, 'error': 'Rate limit wait timed out'}
+
+    page = fetch_http(url, should_cancel=should_cancel, throttle=throttle)
+    if page is not None and 'content' not in page:
+        return page
+    if page is not None:
+        page['tier'] = 'http'
+        _record_tier(url, 'http')
+    else:
+        page = extract_with_browser(url, should_cancel=should_cancel, browser=browser, throttle=throttle)
+        if 'content' not in page:
+            return page
+        page['tier'] = 'browser'
+        _record_tier(url, 'browser')
+
+    if CACHE_ENABLED:
+        page_cache.set(url, {key: value for key, value in page.items() if key != 'timing'})
+    return page
+
+def _domain_slot(url):
+    host = _host(url)
+    with _domain_slots_lock:
+        slot = _domain_slots.get(host)
+        if slot is None:
+            slot = _domain_slots[host] = Semaphore(DOMAIN_CONCURRENCY)
+    return slot
+
+
+def _read_one(url, should_cancel, use_cache):
+    started = time.monotonic()
+    try:
+        with _domain_slot(url):
+            page = extract_content(url, should_cancel=should_cancel, use_cache=use_cache)
     except Exception as e:
-        return {'error': str(e)}
+        logger.warning(f"Batch read failed for {url}: {e}")
+        page = {'error': str(e)}
+    page.setdefault('url', url)
+    page['elapsed'] = round(time.monotonic() - started, 3)
+    return page
+
+
+def extract_contents(urls, should_cancel=None, use_cache=True, max_workers=BATCH_WORKERS):
+    """
+    extract_content for several URLs at once, on up to `max_workers` threads and
+    DOMAIN_CONCURRENCY per portal. Returns one page per URL in input order; failed
+    ones carry 'error' instead of 'content', and every page has its 'elapsed' seconds.
+    """
+    if not urls:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(urls))), thread_name_prefix='scraper-batch') as executor:
+        # Each read runs in a copy of the caller's context, so context variables
+        # (the AI run being cancelled, the app context) are visible to it.
+        futures = [
+            executor.submit(contextvars.copy_context().run, _read_one, url, should_cancel, use_cache)
+            for url in urls
+        ]
+        return [future.result() for future in futures]
 
 if __name__ == '__main__':
     url = 'https://www.zapimoveis.com.br/aluguel/apartamentos/ce+fortaleza/?transacao=aluguel&onde=%2CCear%C3%A1%2CFortaleza%2C%2C%2C%2C%2Ccity%2CBR%3ECeara%3ENULL%3EFortaleza%2C-3.73272%2C-38.527013%2C&tipos=apartamento_residencial&precoMaximo=1000'
     result = extract_content(url)
-    print(result)
\ No newline at end of file
+    print(result)
@@ -1,24 +1,162 @@
-
 import requests
 from bs4 import BeautifulSoup
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from threading import Lock
+from urllib3.util.retry import Retry
+import contextvars
+import hashlib
+import json
+import logging
 import os
+import time
 from dotenv import load_dotenv
+from rateLimiter import get_throttle
+from scraper import normalize_url
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SEARCH_URL = "https://www.googleapis.com/customsearch/v1"
+SEARCH_TIMEOUT = float(os.environ.get("WEB_SEARCH_TIMEOUT", 10))
+# Identical searches repeat across evaluations; results are reused for WEB_SEARCH_CACHE_TTL
+# seconds from memory and, when WEB_SEARCH_CACHE_DIR is set, from disk across restarts.
+CACHE_TTL = float(os.environ.get("WEB_SEARCH_CACHE_TTL", 24 * 60 * 60))
+CACHE_MAX_ENTRIES = int(os.environ.get("WEB_SEARCH_CACHE_MAX_ENTRIES", 2000))
+CACHE_DIR = os.environ.get("WEB_SEARCH_CACHE_DIR") or None
+# Fan-out searches (multi_search): parallel requests, and the API's page size and last start index.
+FANOUT_WORKERS = int(os.environ.get("WEB_SEARCH_FANOUT_WORKERS", 4))
+PAGE_SIZE = 10
+MAX_START = 91
+
+_session = requests.Session()
+# Connection errors and 5xx are retried with exponential backoff (0.5s, 1s, 2s); 429 honours Retry-After.
+_retry = Retry(
+    total=3,
+    backoff_factor=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=('GET',),
+    respect_retry_after_header=True,
+    raise_on_status=False
+)
+_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=_retry))
+
+_cache = OrderedDict()
+_cache_lock = Lock()
+_stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'api_calls': 0, 'errors': 0}
+
+
+class SearchUnavailableError(Exception):
+    """The search API is rate limited or failing repeatedly; retry later."""
+
+
+def _api_throttle(api_key):
+    # Keyed per API key (quota is per key) without putting the key itself in logs and stats.
+    return get_throttle(f"google-cse:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:8]}", kind='api')
+
+
+def _count(name):
+    with _cache_lock:
+        _stats[name] += 1
+
+
+def get_search_stats():
+    """Cache hits/misses and API calls of this process."""
+    with _cache_lock:
+        return {**_stats, 'cached_queries': len(_cache)}
+
+
+def _cache_key(query, cx, num_results, start):
+    normalized = " ".join(query.lower().split())
+    return hashlib.sha256(json.dumps([normalized, cx, num_results, start]).encode('utf-8')).hexdigest()
+
 
-def web_search(query, num_results=10, cx=None):
-    load_dotenv()
+def _disk_path(key):
+    return os.path.join(CACHE_DIR, key[:2], key + '.json')
+
+
+def _cache_get(key):
+    now = time.time()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and now - entry[0] <= CACHE_TTL:
+            _cache.move_to_end(key)
+            _stats['hits'] += 1
+            return entry[1]
+    if CACHE_DIR:
+        try:
+            with open(_disk_path(key), encoding='utf-8') as handle:
+                stored_at, results = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        if now - stored_at <= CACHE_TTL:
+            _cache_put(key, results, stored_at, persist=False)
+            _count('disk_hits')
+            return results
+    return None
+
+
+def _cache_put(key, results, stored_at=None, persist=True):
+    stored_at = stored_at or time.time()
+    with _cache_lock:
+        _cache[key] = (stored_at, results)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    if persist and CACHE_DIR:
+        path = _disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as handle:
+                json.dump([stored_at, results], handle, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write search cache entry: {e}")
+
+
+def web_search(query, num_results=10, cx=None, use_cache=True, start=1):
     api_key = os.getenv("GOOGLE_API_WEB_SEARCH_KEY")
     if not cx:
         raise ValueError("É necessário fornecer o parâmetro 'cx' (ID do mecanismo de busca personalizado do Google)")
     if not api_key:
         raise ValueError("Chave de API do Google não encontrada no .env (GOOGLE_API_WEB_SEARCH_KEY)")
-    search_url = "https://www.googleapis.com/customsearch/v1"
+
+    key = _cache_key(query, cx, num_results, start)
+    if use_cache and CACHE_TTL > 0:
+        cached = _cache_get(key)
+        if cached is not None:
+            # Copies, so a caller editing its results does not change the cached ones.
+            return [dict(result) for result in cached]
+    _count('misses')
+
     params = {
         "key": api_key,
         "cx": cx,
         "q": query,
         "num": num_results
     }
-    response = requests.get(search_url, params=params)
+    if start > 1:
+        params["start"] = start
+    throttle = _api_throttle(api_key)
+    if not throttle.allow():
+        raise SearchUnavailableError("A pesquisa está falhando repetidamente; tente novamente em instantes")
+    if not throttle.wait():
+        raise SearchUnavailableError("Limite de pesquisas por segundo atingido; tente novamente em instantes")
+    _count('api_calls')
+    try:
+        response = _session.get(SEARCH_URL, params=params, timeout=SEARCH_TIMEOUT)
+    except requests.RequestException:
+        throttle.failure()
+        _count('errors')
+        raise
+    if response.status_code == 429 or response.status_code >= 500:
+        throttle.failure()
+        _count('errors')
+        raise SearchUnavailableError(f"A pesquisa retornou {response.status_code}; tente novamente em instantes")
+    throttle.success()
     data = response.json()
     results = []
     for item in data.get("items", []):
@@ -27,8 +165,71 @@ def web_search(query, num_results=10, cx=None):
             "link": item.get("link", ""),
             "snippet": item.get("snippet", "")
         })
+    # Errors (bad key, quota) come back as 4xx without items and are not cached.
+    if response.status_code == 200 and CACHE_TTL > 0:
+        _cache_put(key, [dict(result) for result in results])
     return results
 
+def _search_pages(query, cx, results_per_query, use_cache):
+    """Up to `results_per_query` results of one query, paging with `start` past the first 10."""
+    results = []
+    start = 1
+    while len(results) < results_per_query and start <= MAX_START:
+        page = web_search(query, min(PAGE_SIZE, results_per_query - len(results)), cx, use_cache=use_cache, start=start)
+        results.extend(page)
+        if len(page) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+    return results
+
+
+def multi_search(queries, cx, results_per_query=10, exclude_links=(), use_cache=True, max_workers=FANOUT_WORKERS):
+    """
+    Runs several query variants in parallel and merges them into one candidate list:
+    links are deduped by normalized URL, those in `exclude_links` are dropped, and the
+    rest are ranked by how many queries found them, then by their best position.
+    Failed queries are reported in 'errors' instead of failing the whole search.
+    """
+    queries = list(dict.fromkeys(query.strip() for query in queries if query and query.strip()))
+    if not queries:
+        return {'results': [], 'errors': []}
+    excluded = {normalize_url(link) for link in exclude_links if link}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(queries))), thread_name_prefix='web-search') as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, _search_pages, query, cx, results_per_query, use_cache)
+            for query in queries
+        ]
+        outcomes = []
+        for query, future in zip(queries, futures):
+            try:
+                outcomes.append((query, future.result(), None))
+            except Exception as e:
+                logger.warning(f"Search variant failed ({query}): {e}")
+                outcomes.append((query, [], str(e)))
+
+    candidates = {}
+    for query, results, _ in outcomes:
+        for position, result in enumerate(results, start=1):
+            link = result.get('link')
+            if not link:
+                continue
+            key = normalize_url(link)
+            if key in excluded:
+                continue
+            candidate = candidates.get(key)
+            if candidate is None:
+                candidate = candidates[key] = {**result, 'queries': [], 'best_position': position}
+            if query not in candidate['queries']:
+                candidate['queries'].append(query)
+            candidate['best_position'] = min(candidate['best_position'], position)
+
+    ranked = sorted(candidates.values(), key=lambda candidate: (-len(candidate['queries']), candidate['best_position']))
+    return {
+        'results': ranked,
+        'errors': [{'query': query, 'error': error} for query, _, error in outcomes if error]
+    }
+
 # Exemplo de uso:
 if __name__ == "__main__":
     print("Executando")
@@ -37,4 +238,4 @@ if __name__ == "__main__":
     search_results = web_search(query, cx=cx)
     print("Result: ", search_results)
     for result in search_results:
-        print(result)
\ No newline at end of file
+        print(result)
@@ -10,5 +10,6 @@ from . import (
     conversation_controller,
     dashboard_controller,
     evaluation_controller,
-    main_controller
+    main_controller,
+    stream_controller
 )
@@ -1,7 +1,6 @@
 import sys
 import os
 import logging
-from threading import Thread
 from flask import request, jsonify, current_app
 
 logger = logging.getLogger(__name__)
@@ -20,11 +19,13 @@ from app.bot.llms import llm_main
 from app.models.chat import Conversation, Message
 from app.models.evaluation import Evaluation
 from app.models.user import User
-from app.extensions import db, bot_user_id_var
+from app.models.ai_job import AIJob
+from app.extensions import db, bot_user_id_var, bot_evaluation_id_var
 from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
 from datetime import datetime
 from app.services.sse import publish_event
 from app.services.ai_cancel import is_evaluation_canceled, clear_evaluation_cancel
+from app.services.ai_jobs import enqueue_job, get_queue_position
 
 def generate_conversation_title(user_message):
     try:
@@ -157,102 +158,144 @@ def _extract_ai_message(ai_message_content):
     return str(ai_message_content)
 
 def _start_background_response(app, conversation_id, full_input, channel_key, use_tuple_list, evaluation_id=None, user_id=None):
-    def run():
-        # Set bot user context so evaluation controller tools work without a request context
-        if user_id is not None:
-            bot_user_id_var.set(user_id)
-        with app.app_context():
-            def publish_cancel_message(conversation):
-                cancel_text = (
-                    "Pesquisa cancelada pelo usuario. "
-                    "As amostras coletadas ate aqui foram mantidas."
-                )
-                bot_msg = Message(conversation_id=conversation.id, sender='bot', content=cancel_text)
-                db.session.add(bot_msg)
-                conversation.updated_at = datetime.utcnow()
-                db.session.commit()
-                publish_event(
-                    channel_key,
-                    "ai_message",
-                    {
-                        "message": bot_msg.to_dict(),
-                        "conversation": conversation.to_dict()
-                    }
-                )
-
-            if evaluation_id is not None and is_evaluation_canceled(evaluation_id):
-                conversation = Conversation.query.get(conversation_id)
-                if conversation:
-                    publish_cancel_message(conversation)
-                publish_event(
-                    f"evaluation:{evaluation_id}",
-                    "cancelled",
-                    {"reason": "user_requested"}
-                )
-                return
-
-            conversation = Conversation.query.get(conversation_id)
-            if not conversation:
-                publish_event(channel_key, "error", {"error": "Conversation not found"})
-                if evaluation_id is not None:
-                    publish_event(f"evaluation:{evaluation_id}", "error", {"error": "Conversation not found"})
-                return
-
-            config = {
-                "configurable": {"thread_id": str(conversation.id)},
-                "recursion_limit": 100
+    """Queue the AI run in the durable job queue (app.services.ai_jobs) and return the job."""
+    conversation = Conversation.query.get(conversation_id)
+    return enqueue_job(
+        app,
+        conversation_id,
+        full_input,
+        channel_key,
+        use_tuple_list,
+        evaluation_id=evaluation_id,
+        user_id=user_id,
+        unit_id=conversation.unit_id if conversation else None
+    )
+
+def _invoke_graph_for_job(job, config):
+    """
+    Invoke the graph for a job. A job that is being retried after its worker died
+    resumes from the LangGraph checkpoint instead of sending the input again.
+    """
+    if job.use_tuple_list:
+        graph_input = {"messages": [("user", job.input)]}
+    else:
+        graph_input = {"messages": job.input}
+
+    state = graph.get_state(config)
+    current_checkpoint_id = state.config["configurable"].get("checkpoint_id") or ""
+    if job.attempts > 1 and job.checkpoint_id is not None and current_checkpoint_id != job.checkpoint_id:
+        if state.next:
+            logger.info(f"Resuming AI job {job.id} from checkpoint {current_checkpoint_id}")
+            return graph.invoke(None, config)
+        logger.info(f"AI job {job.id} had already finished in the graph; reusing its final state")
+        return state.values
+
+    job.checkpoint_id = current_checkpoint_id
+    db.session.commit()
+    return graph.invoke(graph_input, config)
+
+def run_ai_job(job, finish):
+    """
+    Executes one queued AI run inside an app context (called by the AI job pool).
+    Records the final status with finish(status, error=None), which commits it with the
+    pending bot message; results are only published when it returns True, i.e. while
+    this worker still owns the job.
+    """
+    conversation_id = job.conversation_id
+    channel_key = job.channel_key
+    evaluation_id = job.evaluation_id
+    # Set bot user context so evaluation controller tools work without a request context
+    bot_user_id_var.set(job.user_id)
+    # Lets graph nodes and tools stop early when this evaluation's run is cancelled
+    bot_evaluation_id_var.set(evaluation_id)
+
+    def finish_cancelled(conversation):
+        cancel_text = (
+            "Pesquisa cancelada pelo usuario. "
+            "As amostras coletadas ate aqui foram mantidas."
+        )
+        bot_msg = None
+        if conversation:
+            bot_msg = Message(conversation_id=conversation.id, sender='bot', content=cancel_text)
+            db.session.add(bot_msg)
+            conversation.updated_at = datetime.utcnow()
+        if not finish(AIJob.STATUS_CANCELLED):
+            return
+        if bot_msg is not None:
+            publish_event(
+                channel_key,
+                "ai_message",
+                {
+                    "message": bot_msg.to_dict(),
+                    "conversation": conversation.to_dict()
+                }
+            )
+        publish_event(
+            f"evaluation:{evaluation_id}",
+            "cancelled",
+            {"reason": "user_requested"}
+        )
+
+    def finish_failed(error):
+        if not finish(AIJob.STATUS_FAILED, error):
+            return
+        publish_event(channel_key, "error", {"error": error})
+        if evaluation_id is not None:
+            publish_event(f"evaluation:{evaluation_id}", "error", {"error": error})
+
+    if evaluation_id is not None and is_evaluation_canceled(evaluation_id):
+        finish_cancelled(Conversation.query.get(conversation_id))
+        return
+
+    conversation = Conversation.query.get(conversation_id)
+    if not conversation:
+        finish_failed("Conversation not found")
+        return
+
+    config = {
+        "configurable": {"thread_id": str(conversation.id)},
+        "recursion_limit": 100
+    }
+    try:
+        response = _invoke_graph_for_job(job, config)
+
+        ai_message_content = response["messages"][-1].content
+        ai_message = _extract_ai_message(ai_message_content)
+
+        if evaluation_id is not None and is_evaluation_canceled(evaluation_id):
+            finish_cancelled(conversation)
+            return
+
+        bot_msg = Message(conversation_id=conversation.id, sender='bot', content=ai_message)
+        db.session.add(bot_msg)
+        conversation.updated_at = datetime.utcnow()
+        if not finish(AIJob.STATUS_DONE):
+            return
+
+        publish_event(
+            channel_key,
+            "ai_message",
+            {
+                "message": bot_msg.to_dict(),
+                "conversation": conversation.to_dict()
             }
-            try:
-                if use_tuple_list:
-                    response = graph.invoke({"messages": [("user", full_input)]}, config)
-                else:
-                    response = graph.invoke({"messages": full_input}, config)
-
-                ai_message_content = response["messages"][-1].content
-                ai_message = _extract_ai_message(ai_message_content)
-
-                if evaluation_id is not None and is_evaluation_canceled(evaluation_id):
-                    publish_cancel_message(conversation)
-                    publish_event(
-                        f"evaluation:{evaluation_id}",
-                        "cancelled",
-                        {"reason": "user_requested"}
-                    )
-                    return
-
-                bot_msg = Message(conversation_id=conversation.id, sender='bot', content=ai_message)
-                db.session.add(bot_msg)
-                conversation.updated_at = datetime.utcnow()
-                db.session.commit()
-
-                publish_event(
-                    channel_key,
-                    "ai_message",
-                    {
-                        "message": bot_msg.to_dict(),
-                        "conversation": conversation.to_dict()
-                    }
-                )
-
-                if evaluation_id is not None:
-                    publish_event(
-                        f"evaluation:{evaluation_id}",
-                        "done",
-                        {
-                            "conversation_id": conversation.id,
-                            "message_id": bot_msg.id
-                        }
-                    )
-                    clear_evaluation_cancel(evaluation_id)
-
-            except Exception as e:
-                logger.error(f"Error in background bot chat: {e}", exc_info=True)
-                publish_event(channel_key, "error", {"error": str(e)})
-                if evaluation_id is not None:
-                    publish_event(f"evaluation:{evaluation_id}", "error", {"error": str(e)})
-
-    thread = Thread(target=run, daemon=True)
-    thread.start()
+        )
+
+        if evaluation_id is not None:
+            publish_event(
+                f"evaluation:{evaluation_id}",
+                "done",
+                {
+                    "conversation_id": conversation.id,
+                    "message_id": bot_msg.id
+                }
+            )
+            clear_evaluation_cancel(evaluation_id)
+
+    except Exception as e:
+        logger.error(f"Error in background bot chat: {e}", exc_info=True)
+        db.session.rollback()
+        finish_failed(str(e))
 
 def chat_async():
     logger.info("Starting async chat request processing")
@@ -317,12 +360,14 @@ def chat_async():
                 _bot_uid = int(_jwt_id)
         except Exception:
             pass
-    _start_background_response(app, conversation.id, user_input, channel_key, use_tuple_list=False, user_id=_bot_uid)
+    job = _start_background_response(app, conversation.id, user_input, channel_key, use_tuple_list=False, user_id=_bot_uid)
 
     return jsonify({
         'status': 'queued',
         'conversation_id': conversation.id,
-        'message_id': user_msg.id
+        'message_id': user_msg.id,
+        'job_id': job.id,
+        'queue_position': get_queue_position(job)
     }), 202
 
 def run_evaluation_chat(evaluation_id, user_input, force_new_chat=False, user_id=None):
@@ -510,7 +555,7 @@ def chat_evaluation_async(evaluation_id):
                 _bot_uid = int(_jwt_id)
         except Exception:
             pass
-    _start_background_response(
+    job = _start_background_response(
         app,
         conversation.id,
         full_input,
@@ -522,6 +567,8 @@ def chat_evaluation_async(evaluation_id):
 
     return jsonify({
         'status': 'queued',
+        'job_id': job.id,
+        'queue_position': get_queue_position(job),
         'conversation_id': conversation.id,
         'message_id': user_msg.id
     }), 202
@@ -535,7 +582,7 @@ def enqueue_evaluation_chat(evaluation_id, user_input, force_new_chat=False, use
         user_id=user_id
     )
     if error_response:
-        return None, None, error_response, status_code
+        return None, None, None, error_response, status_code
 
     user_msg = Message(conversation_id=conversation.id, sender='user', content=user_input)
     db.session.add(user_msg)
@@ -555,7 +602,7 @@ def enqueue_evaluation_chat(evaluation_id, user_input, force_new_chat=False, use
     app = current_app._get_current_object()
     # Resolve user_id for bot context (prefer passed-in user_id, then conversation record)
     _bot_uid = user_id or (conversation.user_id if conversation.user_id else None)
-    _start_background_response(
+    job = _start_background_response(
         app,
         conversation.id,
         full_input,
@@ -565,4 +612,16 @@ def enqueue_evaluation_chat(evaluation_id, user_input, force_new_chat=False, use
         user_id=_bot_uid
     )
 
-    return conversation, user_msg, None, 200
+    return conversation, user_msg, job, None, 200
+
+def get_scraper_stats():
+    """Scraper tier counters, web search cache counters and per-domain/API throttle state of this worker process."""
+    # Bare imports: the bot modules are loaded from app/bot (see sys.path above).
+    from scraper import get_fetch_stats
+    from rateLimiter import get_throttle_stats
+    from webSearch import get_search_stats
+    return {
+        'fetch': get_fetch_stats(),
+        'search': get_search_stats(),
+        'throttles': get_throttle_stats()
+    }
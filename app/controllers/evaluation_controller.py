@@ -1,14 +1,33 @@
-from flask import jsonify, request
+from flask import current_app, jsonify, request
 from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
 from app.models.evaluation import Evaluation, BaseListing
 from app.models.user import User
 from app.extensions import db, bot_user_id_var
 from app.services.sse import publish_event
+from app.services.comparables import (
+    find_comparables, DEFAULT_LIMIT, DEFAULT_MAX_AGE_DAYS, DEFAULT_AREA_TOLERANCE, DEFAULT_ROOM_TOLERANCE
+)
+from app.services import what_if
+from app.utils.listing_statistics import STATISTICS, OUTLIER_METHODS, describe
 from datetime import datetime
+from sqlalchemy import insert
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Listings accepted by one bulk-create request, and the numeric fields it validates.
+BULK_CREATE_MAX_LISTINGS = 200
+NUMERIC_LISTING_FIELDS = {
+    'sample_number': int,
+    'bedrooms': int,
+    'bathrooms': int,
+    'living_rooms': int,
+    'parking_spaces': int,
+    'rent_value': float,
+    'condo_fee': float,
+    'area': float
+}
+
 
 def _get_current_user_id():
     """Return the current user_id from the JWT token or the bot context variable.
@@ -102,51 +121,27 @@ def normalize_classification(value):
     return normalized
 
 
-def _calculate_evaluation_metrics_for_states(evaluation, listings_state, excluded_listing_ids=None):
+def _calculate_evaluation_metrics_for_states(evaluation, listings_state, excluded_listing_ids=None, engine=None):
     """
     Calculate evaluation metrics using a custom active/inactive state map.
     This is used for preview mode (without persisting to the database).
+    Listings missing from the map keep their stored state, so passing only the
+    touched listings is enough; see Evaluation.compute_listing_aggregates for `engine`.
     """
-    excluded_listing_ids = set(excluded_listing_ids or [])
-    listings = [
-        listing
-        for listing in evaluation.base_listings
-        if listing.id not in excluded_listing_ids
-        and listings_state.get(listing.id, {}).get('is_active', listing.is_active)
-    ]
-
-    analyzed_properties_count = len(listings)
-    total_sqm_value = 0.0
-    valid_listings_count = 0
-
-    for listing in listings:
-        if listing.rent_value and listing.area and listing.area > 0:
-            sqm_value = listing.rent_value / listing.area
-            total_sqm_value += sqm_value
-            valid_listings_count += 1
-
-    region_value_sqm = (total_sqm_value / valid_listings_count) if valid_listings_count > 0 else 0.0
-
-    if evaluation.area:
-        estimated_price = evaluation.area * region_value_sqm
-        rounded_price = evaluation.calculate_rounded_price(estimated_price)
-    else:
-        estimated_price = 0.0
-        rounded_price = 0.0
-
-    total_listings_count = len([listing for listing in evaluation.base_listings if listing.id not in excluded_listing_ids])
-    active_listings_count = analyzed_properties_count
-    inactive_listings_count = total_listings_count - active_listings_count
-
-    return {
-        'region_value_sqm': region_value_sqm,
-        'estimated_price': estimated_price,
-        'rounded_price': rounded_price,
-        'analyzed_properties_count': analyzed_properties_count,
-        'active_listings_count': active_listings_count,
-        'inactive_listings_count': inactive_listings_count,
-        'total_listings_count': total_listings_count
+    active_overrides = {
+        listing_id: state.get('is_active')
+        for listing_id, state in listings_state.items()
+        if 'is_active' in state
     }
+    aggregates = evaluation.compute_listing_aggregates(
+        engine=engine,
+        active_overrides=active_overrides,
+        excluded_ids=excluded_listing_ids
+    )
+    sqm_values = None
+    if evaluation.value_statistic not in (None, 'mean'):
+        sqm_values = evaluation.active_sqm_values(engine, active_overrides, excluded_listing_ids)
+    return evaluation.metrics_from_aggregates(aggregates, sqm_values)
 
 
 def _build_listing_state_map(evaluation):
@@ -159,6 +154,26 @@ def _build_listing_state_map(evaluation):
     }
 
 
+def _build_evaluation_event_data(evaluation, previous_metrics, **data):
+    """
+    Build the SSE payload for an evaluation channel.
+    In 'delta' mode (SSE_EVALUATION_EVENT_MODE) only the metric fields that changed
+    are sent; otherwise the full evaluation is included. Call before commit so the
+    already loaded state is serialized without reloading the evaluation.
+    """
+    if current_app.config.get('SSE_EVALUATION_EVENT_MODE', 'full') == 'delta':
+        current_metrics = evaluation.get_metrics()
+        data['evaluation_id'] = evaluation.id
+        data['changes'] = {
+            field: value
+            for field, value in current_metrics.items()
+            if previous_metrics.get(field) != value
+        }
+    else:
+        data['evaluation'] = evaluation.to_dict()
+    return data
+
+
 def _get_current_user_with_active_unit():
     user_id = _get_current_user_id()
     if user_id is None:
@@ -171,17 +186,39 @@ def _get_current_user_with_active_unit():
     return user, None
 
 
-def _get_evaluation_for_user_or_error(evaluation_id, user):
-    evaluation = Evaluation.query.get_or_404(evaluation_id)
+def _lock_evaluation(evaluation_id):
+    """
+    Loads the evaluation with its row locked (SELECT ... FOR UPDATE) until the
+    transaction ends. Every request that changes listings takes it before reading
+    the aggregates or sample numbers, so concurrent changes to the same
+    evaluation are applied one after the other instead of losing a delta.
+    """
+    return (
+        Evaluation.query.filter_by(id=evaluation_id)
+        .with_for_update()
+        .populate_existing()
+        .first_or_404()
+    )
+
+
+def _get_evaluation_for_user_or_error(evaluation_id, user, for_update=False):
+    if for_update:
+        evaluation = _lock_evaluation(evaluation_id)
+    else:
+        evaluation = Evaluation.query.get_or_404(evaluation_id)
     if evaluation.unit_id != user.active_unit_id:
         return None, (jsonify({'error': 'Access denied'}), 403)
     return evaluation, None
 
 
-def _get_listing_for_user_or_error(listing_id, user):
+def _get_listing_for_user_or_error(listing_id, user, for_update=False):
     listing = BaseListing.query.get_or_404(listing_id)
     if not listing.evaluation or listing.evaluation.unit_id != user.active_unit_id:
         return None, (jsonify({'error': 'Access denied'}), 403)
+    if for_update:
+        _lock_evaluation(listing.evaluation_id)
+        # Read again under the lock: a concurrent request may have changed or deleted it.
+        listing = BaseListing.query.filter_by(id=listing_id).populate_existing().first_or_404()
     return listing, None
 
 # --- Evaluation CRUD ---
@@ -202,6 +239,9 @@ def create_evaluation(data=None):
         purpose = normalize_purpose(data.get('purpose'))
         property_type = normalize_property_type(data.get('property_type'))
         classification = normalize_classification(data.get('classification'))
+        value_statistic = data.get('value_statistic') or 'mean'
+        if value_statistic not in STATISTICS:
+            return jsonify({'error': f"value_statistic must be one of {', '.join(STATISTICS)}"}), 400
         new_evaluation = Evaluation(
             unit_id=user.active_unit_id,
             address=data.get('address'),
@@ -223,7 +263,8 @@ def create_evaluation(data=None):
             bathrooms=data.get('bathrooms', 0),
             parking_spaces=data.get('parking_spaces', 0),
             analyzed_properties_count=data.get('analyzed_properties_count', 0),
-            depreciation=data.get('depreciation', 0.0)
+            depreciation=data.get('depreciation', 0.0),
+            value_statistic=value_statistic
         )
 
         if new_evaluation.estimated_price is None and new_evaluation.area and new_evaluation.region_value_sqm:
@@ -365,7 +406,8 @@ def update_evaluation(evaluation_id, data=None):
     if not user or not user.active_unit_id:
         return jsonify({'error': 'No active unit selected'}), 400
     
-    evaluation = Evaluation.query.get_or_404(evaluation_id)
+    # Locked so refresh_metrics() derives prices from aggregates no listing change is updating.
+    evaluation = _lock_evaluation(evaluation_id)
     
     # Check if evaluation belongs to user's active unit
     if evaluation.unit_id != user.active_unit_id:
@@ -378,6 +420,8 @@ def update_evaluation(evaluation_id, data=None):
         normalized_purpose = normalize_purpose(data.get('purpose')) if 'purpose' in data else None
         normalized_property_type = normalize_property_type(data.get('property_type')) if 'property_type' in data else None
         normalized_classification = normalize_classification(data.get('classification')) if 'classification' in data else None
+        if 'value_statistic' in data and data.get('value_statistic') not in STATISTICS:
+            return jsonify({'error': f"value_statistic must be one of {', '.join(STATISTICS)}"}), 400
         evaluation.address = data.get('address', evaluation.address)
         evaluation.neighborhood = data.get('neighborhood', evaluation.neighborhood)
         evaluation.city = data.get('city', evaluation.city)
@@ -401,11 +445,12 @@ def update_evaluation(evaluation_id, data=None):
         evaluation.parking_spaces = data.get('parking_spaces', evaluation.parking_spaces)
         evaluation.analyzed_properties_count = data.get('analyzed_properties_count', evaluation.analyzed_properties_count)
         evaluation.depreciation = data.get('depreciation', evaluation.depreciation)
+        evaluation.value_statistic = data.get('value_statistic', evaluation.value_statistic)
 
-        should_recalculate_metrics = any(field in data for field in ('area', 'depreciation', 'classification'))
+        should_recalculate_metrics = any(field in data for field in ('area', 'depreciation', 'classification', 'value_statistic'))
 
-        if should_recalculate_metrics and evaluation.base_listings:
-            evaluation.recalculate_metrics()
+        if should_recalculate_metrics and evaluation.get_total_listings_count():
+            evaluation.refresh_metrics()
         else:
             evaluation.recalculate_rounded_price()
 
@@ -444,15 +489,107 @@ def delete_evaluation(evaluation_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+def get_comparables(evaluation_id, params=None):
+    """Saved listings of other evaluations of the unit that resemble this one (see app.services.comparables)."""
+    logger.info(f"Fetching comparables for evaluation: {evaluation_id}")
+    user, error = _get_current_user_with_active_unit()
+    if error:
+        return error
+
+    evaluation, error = _get_evaluation_for_user_or_error(evaluation_id, user)
+    if error:
+        return error
+
+    if params is None:
+        params = request.args
+    try:
+        criteria = {
+            'limit': int(params.get('limit', DEFAULT_LIMIT)),
+            'scope': params.get('scope', 'neighborhood'),
+            'max_age_days': int(params.get('max_age_days', DEFAULT_MAX_AGE_DAYS)),
+            'area_tolerance': float(params.get('area_tolerance', DEFAULT_AREA_TOLERANCE)),
+            'room_tolerance': int(params.get('room_tolerance', DEFAULT_ROOM_TOLERANCE))
+        }
+        if criteria['limit'] < 1 or criteria['max_age_days'] < 0 or criteria['area_tolerance'] < 0 or criteria['room_tolerance'] < 0:
+            raise ValueError("limit must be >= 1 and max_age_days, area_tolerance, room_tolerance >= 0")
+        ranked = find_comparables(evaluation, **criteria)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    items = []
+    for listing, similarity in ranked:
+        item = listing.to_dict()
+        item['similarity'] = similarity
+        items.append(item)
+    return jsonify({'items': items, 'meta': {'total': len(items), **criteria}}), 200
+
+def get_evaluation_statistics(evaluation_id, params=None):
+    """
+    Robust statistics of the R$/m² of the active listings (see app.utils.listing_statistics):
+    mean, median, trimmed mean, spread, 95% confidence intervals and outliers
+    flagged by outlier_method ('iqr' or 'mad').
+    """
+    logger.info(f"Computing listing statistics for evaluation: {evaluation_id}")
+    user, error = _get_current_user_with_active_unit()
+    if error:
+        return error
+
+    evaluation, error = _get_evaluation_for_user_or_error(evaluation_id, user)
+    if error:
+        return error
+
+    if params is None:
+        params = request.args
+    method = params.get('outlier_method', 'iqr')
+    if method not in OUTLIER_METHODS:
+        return jsonify({'error': f"outlier_method must be one of {', '.join(OUTLIER_METHODS)}"}), 400
+
+    sqm_values = evaluation.active_sqm_values()
+    statistics = describe(
+        [value for _, value in sqm_values],
+        ids=[listing_id for listing_id, _ in sqm_values],
+        method=method
+    )
+    return jsonify({
+        'evaluation_id': evaluation.id,
+        'value_statistic': evaluation.value_statistic or 'mean',
+        'region_value_sqm': evaluation.region_value_sqm,
+        'statistics': statistics
+    }), 200
+
 # --- BaseListing CRUD ---
 
+def _listing_fields(data):
+    """BaseListing column values from a request payload, with the create defaults."""
+    collected_at_str = data.get('collected_at')
+    return {
+        'sample_number': data.get('sample_number'),
+        'address': data.get('address'),
+        'neighborhood': data.get('neighborhood'),
+        'city': data.get('city'),
+        'state': data.get('state'),
+        'link': data.get('link'),
+        'bedrooms': data.get('bedrooms', 0),
+        'bathrooms': data.get('bathrooms', 0),
+        'living_rooms': data.get('living_rooms', 0),
+        'parking_spaces': data.get('parking_spaces', 0),
+        'collected_at': datetime.fromisoformat(collected_at_str) if collected_at_str else datetime.utcnow(),
+        'rent_value': data.get('rent_value'),
+        'condo_fee': data.get('condo_fee'),
+        'purpose': normalize_purpose(data.get('purpose')),
+        'type': normalize_property_type(data.get('type')),
+        'area': data.get('area'),
+        'is_active': data.get('is_active', True),
+        'deactivation_reason': data.get('deactivation_reason')
+    }
+
 def create_base_listing(evaluation_id, data=None):
     logger.info(f"Creating base listing for evaluation: {evaluation_id}")
     user, error = _get_current_user_with_active_unit()
     if error:
         return error
 
-    evaluation, error = _get_evaluation_for_user_or_error(evaluation_id, user)
+    evaluation, error = _get_evaluation_for_user_or_error(evaluation_id, user, for_update=True)
     if error:
         return error
 
@@ -460,50 +597,127 @@ def create_base_listing(evaluation_id, data=None):
         data = request.get_json()
     
     try:
-        collected_at_str = data.get('collected_at')
-        collected_at = datetime.fromisoformat(collected_at_str) if collected_at_str else datetime.utcnow()
-
-        purpose = normalize_purpose(data.get('purpose'))
-        normalized_type = normalize_property_type(data.get('type'))
-        new_listing = BaseListing(
-            evaluation_id=evaluation_id,
-            sample_number=data.get('sample_number'),
-            address=data.get('address'),
-            neighborhood=data.get('neighborhood'),
-            city=data.get('city'),
-            state=data.get('state'),
-            link=data.get('link'),
-            bedrooms=data.get('bedrooms', 0),
-            bathrooms=data.get('bathrooms', 0),
-            living_rooms=data.get('living_rooms', 0),
-            parking_spaces=data.get('parking_spaces', 0),
-            collected_at=collected_at,
-            rent_value=data.get('rent_value'),
-            condo_fee=data.get('condo_fee'),
-            purpose=purpose,
-            type=normalized_type,
-            area=data.get('area'),
-            is_active=data.get('is_active', True),
-            deactivation_reason=data.get('deactivation_reason')
-        )
+        previous_metrics = evaluation.get_metrics()
+        new_listing = BaseListing(evaluation_id=evaluation_id, **_listing_fields(data))
+        # Added through the session, not evaluation.base_listings, so the other listings are not loaded.
         db.session.add(new_listing)
+        evaluation.apply_listing_delta(None, Evaluation.listing_snapshot(new_listing))
+        db.session.flush()
+
+        listing_data = new_listing.to_dict()
+        event_data = _build_evaluation_event_data(evaluation, previous_metrics, listing=listing_data)
+        db.session.commit()
+
+        publish_event(f"evaluation:{evaluation_id}", "listing_added", event_data)
+        return jsonify(listing_data), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+def _normalize_bulk_listing(data):
+    """Validated _listing_fields() of one bulk-create item; raises ValueError."""
+    if not isinstance(data, dict):
+        raise ValueError('must be an object')
+    try:
+        fields = _listing_fields(data)
+    except (TypeError, ValueError):
+        raise ValueError('collected_at must be an ISO date')
+    for field, cast in NUMERIC_LISTING_FIELDS.items():
+        value = fields[field]
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            raise ValueError(f'{field} must be a number')
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{field} must be a number')
+        # int() would silently truncate 2.7 bedrooms to 2.
+        if cast is int and not number.is_integer():
+            raise ValueError(f'{field} must be a whole number')
+        fields[field] = cast(number)
+    if not isinstance(fields['is_active'], bool):
+        raise ValueError('is_active must be a boolean')
+    return fields
+
+def create_base_listings_bulk(evaluation_id, data=None):
+    """
+    Adds many listings to an evaluation in one transaction: one executemany
+    INSERT ... RETURNING, one metrics refresh, one commit and one listings_added event.
+    Body: {'listings': [...], 'skip_invalid': bool} with the fields of create_base_listing.
+    Listings without sample_number are numbered after the evaluation's highest one.
+    Invalid listings are reported by index; by default nothing is saved when any is
+    invalid, with skip_invalid=true the valid ones are saved and the rest returned in 'skipped'.
+    """
+    logger.info(f"Bulk creating base listings for evaluation: {evaluation_id}")
+    user, error = _get_current_user_with_active_unit()
+    if error:
+        return error
 
-        evaluation.recalculate_metrics()
+    # Locked: the sample numbers and aggregate deltas below read the current row.
+    evaluation, error = _get_evaluation_for_user_or_error(evaluation_id, user, for_update=True)
+    if error:
+        return error
 
+    if data is None:
+        data = request.get_json(silent=True) or {}
+
+    items = data.get('listings') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'listings must be a non-empty list'}), 400
+    if len(items) > BULK_CREATE_MAX_LISTINGS:
+        return jsonify({'error': f'At most {BULK_CREATE_MAX_LISTINGS} listings per request'}), 400
+    skip_invalid = data.get('skip_invalid', False) if isinstance(data, dict) else False
+    if not isinstance(skip_invalid, bool):
+        return jsonify({'error': 'skip_invalid must be a boolean'}), 400
+
+    rows = []
+    invalid = []
+    for index, item in enumerate(items):
+        try:
+            rows.append({'evaluation_id': evaluation_id, **_normalize_bulk_listing(item)})
+        except ValueError as e:
+            invalid.append({'index': index, 'error': str(e)})
+    if invalid and (not skip_invalid or not rows):
+        first = invalid[0]
+        return jsonify({'error': f"Listing {first['index']}: {first['error']}", 'errors': invalid}), 400
+
+    try:
+        if any(row['sample_number'] is None for row in rows):
+            next_sample_number = (
+                db.session.query(db.func.max(BaseListing.sample_number))
+                .filter(BaseListing.evaluation_id == evaluation_id)
+                .scalar() or 0
+            ) + 1
+            for row in rows:
+                if row['sample_number'] is None:
+                    row['sample_number'] = next_sample_number
+                    next_sample_number += 1
+
+        previous_metrics = evaluation.get_metrics()
+        # Inserted as one batch; the new rows come back as ORM objects without loading the other listings.
+        new_listings = db.session.scalars(
+            insert(BaseListing).returning(BaseListing, sort_by_parameter_order=True),
+            rows
+        ).all()
+        for listing in new_listings:
+            evaluation.apply_listing_delta(None, Evaluation.listing_snapshot(listing), refresh=False)
+        evaluation.refresh_metrics()
+        db.session.flush()
+
+        listings_data = [listing.to_dict() for listing in new_listings]
+        payload = {
+            'listings': listings_data,
+            'skipped': invalid,
+            'evaluation': evaluation.to_dict()
+        }
+        event_data = _build_evaluation_event_data(evaluation, previous_metrics, listings=listings_data)
         db.session.commit()
-        
-        # Refresh evaluation from database after commit
-        evaluation_refreshed = Evaluation.query.get(evaluation_id)
-        publish_event(
-            f"evaluation:{evaluation_id}",
-            "listing_added",
-            {
-                "listing": new_listing.to_dict(),
-                "evaluation": evaluation_refreshed.to_dict() if evaluation_refreshed else evaluation.to_dict()
-            }
-        )
-        return jsonify(new_listing.to_dict()), 201
+
+        publish_event(f"evaluation:{evaluation_id}", "listings_added", event_data)
+        return jsonify(payload), 201
     except Exception as e:
+        logger.error(f"Error bulk creating listings for evaluation {evaluation_id}: {e}", exc_info=True)
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
@@ -534,7 +748,7 @@ def update_base_listing(listing_id, data=None):
     if error:
         return error
 
-    listing, error = _get_listing_for_user_or_error(listing_id, user)
+    listing, error = _get_listing_for_user_or_error(listing_id, user, for_update=True)
     if error:
         return error
 
@@ -542,6 +756,8 @@ def update_base_listing(listing_id, data=None):
         data = request.get_json()
     
     try:
+        previous_metrics = listing.evaluation.get_metrics() if listing.evaluation else None
+        previous_snapshot = Evaluation.listing_snapshot(listing)
         normalized_purpose = normalize_purpose(data.get('purpose')) if 'purpose' in data else None
         normalized_type = normalize_property_type(data.get('type')) if 'type' in data else None
         listing.sample_number = data.get('sample_number', listing.sample_number)
@@ -573,24 +789,19 @@ def update_base_listing(listing_id, data=None):
         if 'deactivation_reason' in data:
             listing.deactivation_reason = data.get('deactivation_reason')
         
+        listing_data = listing.to_dict()
+        evaluation_id = listing.evaluation_id
+        event_data = None
         if listing.evaluation:
-            listing.evaluation.recalculate_metrics()
+            listing.evaluation.apply_listing_delta(previous_snapshot, Evaluation.listing_snapshot(listing))
+            event_data = _build_evaluation_event_data(listing.evaluation, previous_metrics, listing=listing_data)
 
         db.session.commit()
-        
-        # Refresh evaluation from database after commit
-        evaluation_refreshed = Evaluation.query.get(listing.evaluation_id) if listing.evaluation_id else None
-        if evaluation_refreshed:
-            publish_event(
-                f"evaluation:{listing.evaluation_id}",
-                "listing_updated",
-                {
-                    "listing": listing.to_dict(),
-                    "evaluation": evaluation_refreshed.to_dict()
-                }
-            )
-        
-        return jsonify(listing.to_dict()), 200
+
+        if event_data is not None:
+            publish_event(f"evaluation:{evaluation_id}", "listing_updated", event_data)
+
+        return jsonify(listing_data), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
@@ -643,6 +854,9 @@ def update_base_listings_bulk(evaluation_id, data=None):
 
     if not isinstance(persist, bool):
         return jsonify({'error': 'persist must be a boolean'}), 400
+    if persist:
+        # Previews only read; persisted changes lock the row before loading the listings.
+        evaluation = _lock_evaluation(evaluation_id)
 
     deleted_ids = data.get('delete_ids')
     if deleted_ids is None:
@@ -664,6 +878,7 @@ def update_base_listings_bulk(evaluation_id, data=None):
         return jsonify({'error': 'updates or delete_ids must be provided'}), 400
 
     listings_by_id = {listing.id: listing for listing in evaluation.base_listings}
+    previous_metrics = evaluation.get_metrics()
     state_map = _build_listing_state_map(evaluation)
     touched_listing_ids = []
 
@@ -704,42 +919,53 @@ def update_base_listings_bulk(evaluation_id, data=None):
 
         if persist:
             listing = listings_by_id[listing_id]
+            previous_snapshot = Evaluation.listing_snapshot(listing)
             if 'is_active' in update:
                 listing.is_active = update.get('is_active')
             if 'deactivation_reason' in update:
                 listing.deactivation_reason = update.get('deactivation_reason')
+            evaluation.apply_listing_delta(previous_snapshot, Evaluation.listing_snapshot(listing), refresh=False)
 
-    deleted_listing_objects = []
     if persist and deleted_set:
+        # Removing from the loaded collection (delete-orphan) deletes the listings.
         for deleted_id in normalized_deleted_ids:
-            deleted_listing_objects.append(listings_by_id[deleted_id])
-        for listing in deleted_listing_objects:
-            db.session.delete(listing)
+            listing = listings_by_id[deleted_id]
+            evaluation.base_listings.remove(listing)
+            evaluation.apply_listing_delta(Evaluation.listing_snapshot(listing), None, refresh=False)
+
+    if persist:
+        evaluation.refresh_metrics()
 
     try:
         if persist:
-            if deleted_listing_objects:
-                db.session.flush()
-            evaluation.recalculate_metrics()
-            db.session.commit()
+            db.session.flush()
 
-            refreshed_evaluation = Evaluation.query.get(evaluation_id)
+            updated_listings = [listings_by_id[listing_id].to_dict() for listing_id in touched_listing_ids]
             payload = {
                 'persisted': True,
-                'updated_listings': [listings_by_id[listing_id].to_dict() for listing_id in touched_listing_ids],
+                'updated_listings': updated_listings,
                 'deleted_listing_ids': normalized_deleted_ids,
-                'evaluation': refreshed_evaluation.to_dict() if refreshed_evaluation else evaluation.to_dict()
+                'evaluation': evaluation.to_dict()
             }
+            event_data = _build_evaluation_event_data(
+                evaluation,
+                previous_metrics,
+                persisted=True,
+                updated_listings=updated_listings,
+                deleted_listing_ids=normalized_deleted_ids
+            )
+            db.session.commit()
 
             publish_event(
                 f"evaluation:{evaluation_id}",
                 "listings_bulk_updated",
-                payload
+                event_data
             )
             return jsonify(payload), 200
 
         evaluation_preview = evaluation.to_dict()
-        evaluation_preview.update(_calculate_evaluation_metrics_for_states(evaluation, state_map, normalized_deleted_ids))
+        touched_states = {listing_id: state_map[listing_id] for listing_id in touched_listing_ids}
+        evaluation_preview.update(_calculate_evaluation_metrics_for_states(evaluation, touched_states, normalized_deleted_ids))
 
         preview_listings = []
         for listing_id in touched_listing_ids:
@@ -758,22 +984,75 @@ def update_base_listings_bulk(evaluation_id, data=None):
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+def preview_listing_scenarios(evaluation_id, data=None):
+    """
+    What-if metrics for many listing selections in one call (see app.services.what_if).
+    - scenarios: list of {'label', 'updates': [{'id', 'is_active'}], 'deleted_ids'},
+      each applied on top of the stored listing states.
+    - leave_one_out=True: metrics with each active listing left out in turn.
+    Nothing is persisted.
+    """
+    logger.info(f"Previewing listing scenarios for evaluation: {evaluation_id}")
+
+    user, error = _get_current_user_with_active_unit()
+    if error:
+        return error
+
+    evaluation, error = _get_evaluation_for_user_or_error(evaluation_id, user)
+    if error:
+        return error
+
+    if data is None:
+        data = request.get_json(silent=True) or {}
+
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+
+    scenarios = data.get('scenarios') or []
+    if not isinstance(scenarios, list):
+        return jsonify({'error': 'scenarios must be a list'}), 400
+
+    arrays = what_if.ListingArrays.load(evaluation)
+    try:
+        active, present = what_if.scenario_masks(arrays, scenarios)
+        scenario_metrics = what_if.evaluate_masks(evaluation, arrays, active, present) if scenarios else []
+    except what_if.UnknownListingError as e:
+        return jsonify({'error': f'Listing {e.listing_id} does not belong to evaluation {evaluation_id}'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    payload = {
+        'evaluation_id': evaluation.id,
+        'baseline': what_if.baseline(evaluation, arrays),
+        'scenarios': [
+            {'label': scenario.get('label', index), 'metrics': metrics}
+            for index, (scenario, metrics) in enumerate(zip(scenarios, scenario_metrics))
+        ]
+    }
+    if data.get('leave_one_out'):
+        payload['leave_one_out'] = [
+            {'listing_id': listing_id, 'metrics': metrics}
+            for listing_id, metrics in what_if.leave_one_out(evaluation, arrays)
+        ]
+    return jsonify(payload), 200
+
 def delete_base_listing(listing_id):
     user, error = _get_current_user_with_active_unit()
     if error:
         return error
 
-    listing, error = _get_listing_for_user_or_error(listing_id, user)
+    listing, error = _get_listing_for_user_or_error(listing_id, user, for_update=True)
     if error:
         return error
 
     try:
         evaluation = listing.evaluation
+        previous_snapshot = Evaluation.listing_snapshot(listing)
         db.session.delete(listing)
         db.session.flush()
         
         if evaluation:
-            evaluation.recalculate_metrics()
+            evaluation.apply_listing_delta(previous_snapshot, None)
             
         db.session.commit()
         return jsonify({'message': 'Base listing deleted successfully'}), 200
@@ -0,0 +1,112 @@
+import re
+import uuid
+from flask import jsonify, request, current_app, Response, stream_with_context
+from app.models.evaluation import Evaluation
+from app.models.chat import Conversation
+from app.services.sse import parse_event_id, stream_channels, request_subscription_change
+from app.utils.unit_helpers import get_user_with_active_unit
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_KEY_PATTERN = re.compile(r'^(evaluation|conversation):(\d+)$')
+
+
+def _parse_channel_keys(raw):
+    """Accepts a comma separated string or a list; returns (keys, error_response)."""
+    if raw is None:
+        return [], None
+    if isinstance(raw, str):
+        raw = raw.split(',')
+    if not isinstance(raw, list):
+        return None, (jsonify({'error': 'Channels must be a list or a comma separated string'}), 400)
+
+    keys = []
+    for item in raw:
+        key = str(item).strip()
+        if not key:
+            continue
+        if not CHANNEL_KEY_PATTERN.match(key):
+            return None, (jsonify({'error': f'Invalid channel: {key}'}), 400)
+        if key not in keys:
+            keys.append(key)
+    return keys, None
+
+
+def _authorize_channels(user, keys):
+    """Evaluations and conversations must belong to the user's active unit."""
+    for key in keys:
+        kind, object_id = CHANNEL_KEY_PATTERN.match(key).groups()
+        if kind == 'evaluation':
+            evaluation = Evaluation.query.get(int(object_id))
+            allowed = evaluation is not None and evaluation.unit_id == user.active_unit_id
+        else:
+            conversation = Conversation.query.get(int(object_id))
+            allowed = (
+                conversation is not None
+                and conversation.unit_id == user.active_unit_id
+                and conversation.user_id in (None, user.id)
+            )
+        if not allowed:
+            logger.warning(f"User {user.id} denied access to channel {key}")
+            return jsonify({'error': f'Channel not found: {key}'}), 404
+    return None
+
+
+def open_stream():
+    user, error = get_user_with_active_unit()
+    if error:
+        return error
+
+    keys, error = _parse_channel_keys(request.args.get('channels'))
+    if error:
+        return error
+    max_channels = current_app.config.get('SSE_MAX_STREAM_CHANNELS', 50)
+    if len(keys) > max_channels:
+        return jsonify({'error': f'At most {max_channels} channels per stream'}), 400
+    error = _authorize_channels(user, keys)
+    if error:
+        return error
+
+    stream_id = uuid.uuid4().hex
+    logger.info(f"Opening multiplexed stream {stream_id} for user {user.id} with {len(keys)} channels")
+    # Browsers send Last-Event-ID on automatic reconnects; manual reconnects can use the query param.
+    last_event_id = parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    event_stream = stream_channels(
+        stream_id,
+        user.id,
+        keys,
+        last_event_id=last_event_id,
+        coalesce_window=current_app.config.get('SSE_COALESCE_WINDOW', 0),
+        max_channels=max_channels
+    )
+    return Response(stream_with_context(event_stream), mimetype='text/event-stream')
+
+
+def update_stream_subscriptions(stream_id):
+    user, error = get_user_with_active_unit()
+    if error:
+        return error
+
+    data = request.get_json() or {}
+    add, error = _parse_channel_keys(data.get('add'))
+    if error:
+        return error
+    remove, error = _parse_channel_keys(data.get('remove'))
+    if error:
+        return error
+    if not add and not remove:
+        return jsonify({'error': 'Nothing to add or remove'}), 400
+    # Only the stream knows its current channels, so it enforces the total; this rejects
+    # requests that could never fit.
+    max_channels = current_app.config.get('SSE_MAX_STREAM_CHANNELS', 50)
+    if len(add) > max_channels:
+        return jsonify({'error': f'At most {max_channels} channels per stream'}), 400
+    error = _authorize_channels(user, add)
+    if error:
+        return error
+
+    # The stream may live in another worker, so the change travels through the broker
+    # and is only applied by the stream owned by this user.
+    request_subscription_change(stream_id, user.id, add=add, remove=remove)
+    return jsonify({'status': 'accepted', 'stream_id': stream_id, 'add': add, 'remove': remove}), 202
@@ -11,6 +11,9 @@ db = SQLAlchemy()
 # Context variable used to pass the authenticated user_id to bot tools
 # that run outside of a Flask request context (background threads, etc.)
 bot_user_id_var: ContextVar[Optional[int]] = ContextVar('bot_user_id', default=None)
+# Evaluation whose AI run is executing in the current context; lets graph nodes
+# and tools notice a cancel request while the run is in progress.
+bot_evaluation_id_var: ContextVar[Optional[int]] = ContextVar('bot_evaluation_id', default=None)
 bcrypt = Bcrypt()
 login_manager = LoginManager()
 cors = CORS()
@@ -2,3 +2,4 @@ from .user import User
 from .unit import Unit, user_units
 from .evaluation import Evaluation, BaseListing
 from .chat import Conversation, Message
+from .ai_job import AIJob, AICancellation
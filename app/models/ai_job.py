@@ -0,0 +1,54 @@
+from app.extensions import db
+from datetime import datetime
+
+class AIJob(db.Model):
+    """A queued/running AI chat run, executed by the worker pool in app.services.ai_jobs."""
+    __tablename__ = 'ai_jobs'
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'
+
+    id = db.Column(db.Integer, primary_key=True)
+    unit_id = db.Column(db.Integer, db.ForeignKey('units.id'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id', ondelete='CASCADE'), nullable=False)
+    evaluation_id = db.Column(db.Integer, db.ForeignKey('evaluations.id', ondelete='CASCADE'), nullable=True)
+    channel_key = db.Column(db.String(100), nullable=False)
+    input = db.Column(db.Text, nullable=False)
+    use_tuple_list = db.Column(db.Boolean, default=False, nullable=False)
+    status = db.Column(db.String(20), default=STATUS_QUEUED, nullable=False, index=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    # LangGraph checkpoint of the thread when the run started; used to resume after a crash.
+    checkpoint_id = db.Column(db.String(64), nullable=True)
+    worker_id = db.Column(db.String(100), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'unit_id': self.unit_id,
+            'user_id': self.user_id,
+            'conversation_id': self.conversation_id,
+            'evaluation_id': self.evaluation_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class AICancellation(db.Model):
+    """Cancel flag of an evaluation's AI run, shared by every worker process (see app.services.ai_cancel)."""
+    __tablename__ = 'ai_cancellations'
+
+    evaluation_id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
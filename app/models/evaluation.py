@@ -1,5 +1,11 @@
 from app.extensions import db
 from datetime import datetime
+from flask import current_app, has_app_context
+from app.utils.listing_statistics import central_value
+
+# Full recomputes either aggregate base_listings in one SQL query ('sql') or
+# iterate the loaded ORM objects ('python'); see Config.METRICS_ENGINE.
+METRICS_ENGINES = ('python', 'sql')
 
 class Evaluation(db.Model):
     __tablename__ = 'evaluations'
@@ -26,6 +32,14 @@ class Evaluation(db.Model):
     parking_spaces = db.Column(db.Integer, default=0)
     analyzed_properties_count = db.Column(db.Integer, default=0)
     depreciation = db.Column(db.Float, default=0.0, nullable=False)  # Percentage (0-100)
+    # Statistic of R$/m² used for region_value_sqm: mean, median or trimmed_mean (app.utils.listing_statistics).
+    value_statistic = db.Column(db.String(20), default='mean', nullable=False)
+    # Running aggregates of base_listings, kept up to date with apply_listing_delta()
+    # so metrics never need to load every listing (recalculate_metrics() rebuilds them).
+    active_listings_count = db.Column(db.Integer, default=0, nullable=False)
+    inactive_listings_count = db.Column(db.Integer, default=0, nullable=False)
+    sqm_value_sum = db.Column(db.Float, default=0.0, nullable=False)  # Sum of rent_value/area of valid active listings
+    valid_listings_count = db.Column(db.Integer, default=0, nullable=False)  # Active listings with rent_value and area > 0
     last_chat_id = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -44,6 +58,18 @@ class Evaluation(db.Model):
             return False
         return "venda" in classification_lower or "sale" in classification_lower
 
+    def _get_depreciation_factor(self):
+        try:
+            depreciation = float(self.depreciation or 0.0)
+        except (TypeError, ValueError):
+            depreciation = 0.0
+
+        depreciation = max(0.0, min(depreciation, 100.0))
+        return 1 - depreciation / 100
+
+    def _get_rounding_step(self):
+        return 10000 if self._is_sale_classification() else 10
+
     def _get_price_after_depreciation(self, estimated_price=None):
         if estimated_price is None:
             estimated_price = self.estimated_price
@@ -53,53 +79,59 @@ class Evaluation(db.Model):
         except (TypeError, ValueError):
             base_price = 0.0
 
-        try:
-            depreciation = float(self.depreciation or 0.0)
-        except (TypeError, ValueError):
-            depreciation = 0.0
-
-        depreciation = max(0.0, min(depreciation, 100.0))
-        return base_price * (1 - depreciation / 100)
+        return base_price * self._get_depreciation_factor()
 
     def calculate_rounded_price(self, estimated_price=None):
         """Calculates rounded price using current classification and depreciation."""
         price_after_depreciation = self._get_price_after_depreciation(estimated_price)
-        if self._is_sale_classification():
-            return round(price_after_depreciation / 10000) * 10000
-        return round(price_after_depreciation / 10) * 10
+        step = self._get_rounding_step()
+        return round(price_after_depreciation / step) * step
 
     def recalculate_rounded_price(self):
         self.rounded_price = self.calculate_rounded_price(self.estimated_price)
 
-    def recalculate_metrics(self):
-        """
-        Recalculates region_value_sqm, estimated_price, rounded_price, and analyzed_properties_count
-        based on the associated base_listings.
-        """
-        # Only consider active listings
-        listings = [listing for listing in self.base_listings if listing.is_active]
-        self.analyzed_properties_count = len(listings)
-        
-        if not listings:
+    @staticmethod
+    def listing_snapshot(listing):
+        """The listing fields the metrics depend on; pass to apply_listing_delta()."""
+        return {
+            'is_active': listing.is_active if listing.is_active is not None else True,
+            'rent_value': listing.rent_value,
+            'area': listing.area
+        }
+
+    @staticmethod
+    def _listing_contribution(snapshot):
+        """(active, inactive, sqm value, valid) added to the aggregates by one listing."""
+        if snapshot is None:
+            return 0, 0, 0.0, 0
+        if not snapshot['is_active']:
+            return 0, 1, 0.0, 0
+        rent_value, area = snapshot['rent_value'], snapshot['area']
+        if rent_value and area and area > 0:
+            return 1, 0, rent_value / area, 1
+        return 1, 0, 0.0, 0
+
+    def _apply_aggregates(self, engine=None):
+        """Derives region_value_sqm, estimated/rounded price and analyzed count from the aggregates."""
+        self.analyzed_properties_count = self.active_listings_count
+
+        if not self.active_listings_count:
             self.region_value_sqm = 0.0
             self.estimated_price = 0.0
             self.rounded_price = 0.0
             return
 
-        total_sqm_value = 0.0
-        valid_listings_count = 0
-
-        for listing in listings:
-            if listing.rent_value and listing.area and listing.area > 0:
-                sqm_value = listing.rent_value / listing.area
-                total_sqm_value += sqm_value
-                valid_listings_count += 1
-        
-        if valid_listings_count > 0:
-            self.region_value_sqm = total_sqm_value / valid_listings_count
-        else:
+        if not (self.valid_listings_count or 0) > 0:
             self.region_value_sqm = 0.0
-            
+        elif self._uses_mean():
+            self.region_value_sqm = (self.sqm_value_sum or 0.0) / self.valid_listings_count
+        else:
+            # Median/trimmed mean cannot be kept by delta; one query over the active values.
+            self.region_value_sqm = central_value(
+                [value for _, value in self.active_sqm_values(engine)],
+                self.value_statistic
+            )
+
         if self.area:
             self.estimated_price = self.area * self.region_value_sqm
             self.recalculate_rounded_price()
@@ -107,17 +139,219 @@ class Evaluation(db.Model):
             self.estimated_price = 0.0
             self.rounded_price = 0.0
 
+    def apply_listing_delta(self, before, after, refresh=True):
+        """
+        Updates the aggregates and metrics in O(1) for one listing change, given its
+        listing_snapshot() before and after it: before=None for an insert,
+        after=None for a delete. Pass refresh=False when applying several changes
+        and call refresh_metrics() once at the end. This is a read-modify-write of
+        the evaluation row: load it locked (with_for_update) before taking the
+        snapshots, or concurrent changes lose their deltas.
+        """
+        old = self._listing_contribution(before)
+        new = self._listing_contribution(after)
+        self.active_listings_count = (self.active_listings_count or 0) + new[0] - old[0]
+        self.inactive_listings_count = (self.inactive_listings_count or 0) + new[1] - old[1]
+        self.valid_listings_count = (self.valid_listings_count or 0) + new[3] - old[3]
+        if self.valid_listings_count:
+            self.sqm_value_sum = (self.sqm_value_sum or 0.0) + new[2] - old[2]
+        else:
+            # Drop the float residue left by additions and subtractions.
+            self.sqm_value_sum = 0.0
+        if refresh:
+            self._apply_aggregates()
+
+    def refresh_metrics(self):
+        """Re-derives price metrics from the aggregates, e.g. after area/depreciation/classification changes."""
+        self._apply_aggregates()
+
+    def _metrics_engine(self, engine=None):
+        if engine is None:
+            engine = current_app.config.get('METRICS_ENGINE', 'sql') if has_app_context() else 'python'
+        if engine not in METRICS_ENGINES:
+            raise ValueError(f"engine must be one of {', '.join(METRICS_ENGINES)}")
+        # An evaluation that was never flushed has no rows to aggregate yet.
+        if engine == 'sql' and self.id is None:
+            return 'python'
+        return engine
+
+    def _uses_mean(self):
+        return (self.value_statistic or 'mean') == 'mean'
+
+    @staticmethod
+    def _active_expression(active_overrides):
+        is_active = db.func.coalesce(BaseListing.is_active, True)
+        activated = [listing_id for listing_id, value in active_overrides.items() if value]
+        deactivated = [listing_id for listing_id, value in active_overrides.items() if not value]
+        whens = []
+        if activated:
+            whens.append((BaseListing.id.in_(activated), True))
+        if deactivated:
+            whens.append((BaseListing.id.in_(deactivated), False))
+        if whens:
+            is_active = db.case(*whens, else_=is_active)
+        return is_active
+
+    def _compute_aggregates_python(self, active_overrides, excluded_ids):
+        active = inactive = valid = 0
+        sqm_value_sum = 0.0
+        for listing in self.base_listings:
+            if listing.id in excluded_ids:
+                continue
+            snapshot = self.listing_snapshot(listing)
+            if listing.id in active_overrides:
+                snapshot['is_active'] = bool(active_overrides[listing.id])
+            contribution = self._listing_contribution(snapshot)
+            active += contribution[0]
+            inactive += contribution[1]
+            sqm_value_sum += contribution[2]
+            valid += contribution[3]
+        return active, inactive, sqm_value_sum, valid
+
+    def _compute_aggregates_sql(self, active_overrides, excluded_ids):
+        is_active = self._active_expression(active_overrides)
+        valid = db.and_(is_active, BaseListing.rent_value != 0, BaseListing.area > 0)
+
+        # Runs after the session autoflush, so pending listing changes are counted.
+        query = db.session.query(
+            db.func.count().filter(is_active),
+            db.func.count().filter(db.not_(is_active)),
+            db.func.coalesce(db.func.sum(BaseListing.rent_value / BaseListing.area).filter(valid), 0.0),
+            db.func.count().filter(valid)
+        ).filter(BaseListing.evaluation_id == self.id)
+        if excluded_ids:
+            query = query.filter(BaseListing.id.notin_(excluded_ids))
+        active, inactive, sqm_value_sum, valid_count = query.one()
+        return active, inactive, float(sqm_value_sum), valid_count
+
+    def compute_listing_aggregates(self, engine=None, active_overrides=None, excluded_ids=None):
+        """
+        Aggregates of base_listings as stored in the aggregate columns. active_overrides
+        ({listing_id: is_active}) and excluded_ids let previews aggregate a hypothetical
+        state without touching the listings. engine is 'sql' (one aggregate query) or
+        'python' (iterates base_listings); defaults to Config.METRICS_ENGINE.
+        """
+        active_overrides = active_overrides or {}
+        excluded_ids = set(excluded_ids or ())
+        if self._metrics_engine(engine) == 'sql':
+            active, inactive, sqm_value_sum, valid = self._compute_aggregates_sql(active_overrides, excluded_ids)
+        else:
+            active, inactive, sqm_value_sum, valid = self._compute_aggregates_python(active_overrides, excluded_ids)
+        return {
+            'active_listings_count': active,
+            'inactive_listings_count': inactive,
+            'sqm_value_sum': sqm_value_sum if valid else 0.0,
+            'valid_listings_count': valid
+        }
+
+    def active_sqm_values(self, engine=None, active_overrides=None, excluded_ids=None):
+        """
+        (listing_id, rent_value / area) of the active listings with both values, by id,
+        with the same overrides and engines as compute_listing_aggregates().
+        """
+        active_overrides = active_overrides or {}
+        excluded_ids = set(excluded_ids or ())
+        if self._metrics_engine(engine) == 'sql':
+            is_active = self._active_expression(active_overrides)
+            query = db.session.query(BaseListing.id, BaseListing.rent_value / BaseListing.area).filter(
+                BaseListing.evaluation_id == self.id,
+                is_active,
+                BaseListing.rent_value != 0,
+                BaseListing.area > 0
+            )
+            if excluded_ids:
+                query = query.filter(BaseListing.id.notin_(excluded_ids))
+            return [(listing_id, float(value)) for listing_id, value in query.order_by(BaseListing.id)]
+
+        values = []
+        for listing in sorted(self.base_listings, key=lambda listing: listing.id or 0):
+            if listing.id in excluded_ids:
+                continue
+            snapshot = self.listing_snapshot(listing)
+            if listing.id in active_overrides:
+                snapshot['is_active'] = bool(active_overrides[listing.id])
+            contribution = self._listing_contribution(snapshot)
+            if contribution[3]:
+                values.append((listing.id, contribution[2]))
+        return values
+
+    def metrics_from_aggregates(self, aggregates, sqm_values=None):
+        """
+        The get_metrics() fields for the given aggregates, without changing the evaluation.
+        With a median/trimmed_mean value_statistic, region_value_sqm comes from
+        `sqm_values` (see active_sqm_values()), or from the stored listings when omitted.
+        """
+        active = aggregates['active_listings_count']
+        valid = aggregates['valid_listings_count']
+        if not (active and valid):
+            region_value_sqm = 0.0
+        elif self._uses_mean():
+            region_value_sqm = aggregates['sqm_value_sum'] / valid
+        else:
+            if sqm_values is None:
+                sqm_values = self.active_sqm_values()
+            region_value_sqm = central_value([value for _, value in sqm_values], self.value_statistic)
+        if active and self.area:
+            estimated_price = self.area * region_value_sqm
+            rounded_price = self.calculate_rounded_price(estimated_price)
+        else:
+            estimated_price = 0.0
+            rounded_price = 0.0
+        return {
+            'region_value_sqm': region_value_sqm,
+            'estimated_price': estimated_price,
+            'rounded_price': rounded_price,
+            'analyzed_properties_count': active,
+            'active_listings_count': active,
+            'inactive_listings_count': aggregates['inactive_listings_count'],
+            'total_listings_count': active + aggregates['inactive_listings_count']
+        }
+
+    def recalculate_metrics(self, engine=None):
+        """
+        Full recompute: rebuilds the aggregates from every associated base_listing, then
+        region_value_sqm, estimated_price, rounded_price and analyzed_properties_count.
+        Prefer apply_listing_delta() for single listing changes.
+        """
+        for field, value in self.compute_listing_aggregates(engine).items():
+            setattr(self, field, value)
+        self._apply_aggregates(engine)
+
+    def check_metrics_consistency(self, tolerance=1e-6, engine=None):
+        """
+        Compares the stored aggregates with a recompute from base_listings.
+        Returns {field: {'stored': ..., 'actual': ...}} for each mismatch; empty when consistent.
+        """
+        mismatches = {}
+        for field, actual in self.compute_listing_aggregates(engine).items():
+            stored = getattr(self, field) or 0
+            if abs(stored - actual) > tolerance * max(1.0, abs(actual)):
+                mismatches[field] = {'stored': stored, 'actual': actual}
+        return mismatches
+
     def get_active_listings_count(self):
         """Returns the count of active listings."""
-        return sum(1 for listing in self.base_listings if listing.is_active)
+        return self.active_listings_count or 0
     
     def get_inactive_listings_count(self):
         """Returns the count of inactive listings."""
-        return sum(1 for listing in self.base_listings if not listing.is_active)
+        return self.inactive_listings_count or 0
     
     def get_total_listings_count(self):
         """Returns the total count of all listings (active + inactive)."""
-        return len(self.base_listings)
+        return self.get_active_listings_count() + self.get_inactive_listings_count()
+
+    def get_metrics(self):
+        """Returns the calculated metric fields exposed by to_dict()."""
+        return {
+            'region_value_sqm': self.region_value_sqm,
+            'estimated_price': self.estimated_price,
+            'rounded_price': self.rounded_price,
+            'analyzed_properties_count': self.analyzed_properties_count,
+            'active_listings_count': self.get_active_listings_count(),
+            'inactive_listings_count': self.get_inactive_listings_count(),
+            'total_listings_count': self.get_total_listings_count()
+        }
 
     def to_dict(self, include_listings=False):
         data = {
@@ -143,6 +377,7 @@ class Evaluation(db.Model):
             'parking_spaces': self.parking_spaces,
             'analyzed_properties_count': self.analyzed_properties_count,
             'depreciation': self.depreciation,
+            'value_statistic': self.value_statistic or 'mean',
             'active_listings_count': self.get_active_listings_count(),
             'inactive_listings_count': self.get_inactive_listings_count(),
             'total_listings_count': self.get_total_listings_count(),
@@ -163,14 +398,14 @@ class BaseListing(db.Model):
     __tablename__ = 'base_listings'
 
     id = db.Column(db.Integer, primary_key=True)
-    evaluation_id = db.Column(db.Integer, db.ForeignKey('evaluations.id'), nullable=False)
+    evaluation_id = db.Column(db.Integer, db.ForeignKey('evaluations.id'), nullable=False, index=True)
     sample_number = db.Column(db.Integer, nullable=True)
     
     address = db.Column(db.String(255), nullable=True)
     neighborhood = db.Column(db.String(100), nullable=True)
     city = db.Column(db.String(100), nullable=True)
     state = db.Column(db.String(50), nullable=True)
-    link = db.Column(db.String(500), nullable=True)
+    link = db.Column(db.String(500), nullable=True, index=True)
     bedrooms = db.Column(db.Integer, default=0)
     bathrooms = db.Column(db.Integer, default=0)
     living_rooms = db.Column(db.Integer, default=0)
@@ -210,3 +445,12 @@ class BaseListing(db.Model):
 
     def __repr__(self):
         return f"<BaseListing {self.id} - {self.address}>"
+
+
+# Comparables lookup (app.services.comparables) filters on lower(city)/lower(neighborhood) and recency.
+db.Index(
+    'ix_base_listings_location_collected',
+    db.func.lower(BaseListing.city),
+    db.func.lower(BaseListing.neighborhood),
+    BaseListing.collected_at
+)
@@ -3,6 +3,8 @@ from app.controllers.admin_controller import get_all_users, get_user_by_id, crea
 from app.utils.decorators import admin_required
 from flask_jwt_extended import jwt_required
 from app.models.user import User
+from app.services.sse import get_channel_stats
+from app.controllers.bot_controller import get_scraper_stats
 import logging
 
 logger = logging.getLogger(__name__)
@@ -72,3 +74,18 @@ def delete_user(user_id):
     delete_user_admin(user)
     logger.info(f"User {user_id} deleted by admin")
     return jsonify({'message': 'User deleted successfully'}), 200
+
+@admin_bp.route("/sse/stats", methods=['GET'])
+@jwt_required()
+@admin_required
+def sse_stats():
+    channel_key = request.args.get('channel')
+    logger.info("Admin accessing SSE channel stats")
+    return jsonify(get_channel_stats(channel_key)), 200
+
+@admin_bp.route("/scraper/stats", methods=['GET'])
+@jwt_required()
+@admin_required
+def scraper_stats():
+    logger.info("Admin accessing scraper stats")
+    return jsonify(get_scraper_stats()), 200
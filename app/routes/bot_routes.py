@@ -1,9 +1,8 @@
-from flask import Blueprint, Response, stream_with_context, jsonify
+from flask import Blueprint, Response, request, stream_with_context, jsonify
 from flask_jwt_extended import jwt_required
 from app.controllers.bot_controller import chat, chat_evaluation, chat_async, chat_evaluation_async
 from app.models.chat import Conversation
-from app.services.sse import register_listener, remove_listener, format_sse
-from queue import Empty
+from app.services.sse import parse_event_id, stream_channel
 import logging
 
 logger = logging.getLogger(__name__)
@@ -38,22 +37,11 @@ def stream_conversation_events(conversation_id):
     if not conversation:
         return jsonify({'error': 'Conversation not found'}), 404
 
-    def event_stream():
-        channel_key = f"conversation:{conversation_id}"
-        queue = register_listener(channel_key)
-        try:
-            yield format_sse("connected", {"conversation_id": conversation_id})
-            while True:
-                try:
-                    payload = queue.get(timeout=15)
-                except Empty:
-                    yield ": ping\n\n"
-                    continue
-
-                yield format_sse(payload["event"], payload["data"])
-        except GeneratorExit:
-            pass
-        finally:
-            remove_listener(channel_key, queue)
-
-    return Response(stream_with_context(event_stream()), mimetype='text/event-stream')
+    # Browsers send Last-Event-ID on automatic reconnects; manual reconnects can use the query param.
+    last_event_id = parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    event_stream = stream_channel(
+        f"conversation:{conversation_id}",
+        {"conversation_id": conversation_id},
+        last_event_id=last_event_id
+    )
+    return Response(stream_with_context(event_stream), mimetype='text/event-stream')
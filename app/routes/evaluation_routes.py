@@ -1,15 +1,16 @@
-from flask import Blueprint, request, jsonify, Response, stream_with_context
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.controllers.evaluation_controller import (
     create_evaluation, get_evaluations, get_evaluation, update_evaluation, delete_evaluation,
     create_base_listing, get_base_listings, get_base_listing, update_base_listing, delete_base_listing,
-    update_base_listings_bulk
+    update_base_listings_bulk, get_comparables, preview_listing_scenarios,
+    get_evaluation_statistics, create_base_listings_bulk
 )
 from app.controllers.bot_controller import run_evaluation_chat, enqueue_evaluation_chat
-from app.services.sse import register_listener, remove_listener, publish_event, format_sse
+from app.services.sse import publish_event, parse_event_id, stream_channel
 from app.services.ai_cancel import cancel_evaluation, clear_evaluation_cancel
+from app.services.ai_jobs import cancel_queued_jobs, get_queue_position
 from app.utils.unit_helpers import get_user_with_active_unit
-from queue import Empty
 import logging
 
 logger = logging.getLogger(__name__)
@@ -144,7 +145,7 @@ def create_evaluation_with_ai_async_route():
     except Exception:
         user_id = None
 
-    conversation, user_msg, error_response, error_status = enqueue_evaluation_chat(
+    conversation, user_msg, job, error_response, error_status = enqueue_evaluation_chat(
         evaluation_id,
         ai_prompt,
         force_new_chat=ai_force_new_chat,
@@ -166,31 +167,23 @@ def create_evaluation_with_ai_async_route():
         'status': 'queued',
         'evaluation': evaluation_data,
         'conversation_id': conversation.id,
-        'message_id': user_msg.id
+        'message_id': user_msg.id,
+        'job_id': job.id,
+        'queue_position': get_queue_position(job)
     }), 202
 
 @evaluation_bp.route('/<int:evaluation_id>/ai/stream', methods=['GET'])
 @jwt_required()
 def stream_evaluation_ai_events(evaluation_id):
-    def event_stream():
-        channel_key = f"evaluation:{evaluation_id}"
-        queue = register_listener(channel_key)
-        try:
-            yield format_sse("connected", {"evaluation_id": evaluation_id})
-            while True:
-                try:
-                    payload = queue.get(timeout=15)
-                except Empty:
-                    yield ": ping\n\n"
-                    continue
-
-                yield format_sse(payload["event"], payload["data"])
-        except GeneratorExit:
-            pass
-        finally:
-            remove_listener(channel_key, queue)
-
-    return Response(stream_with_context(event_stream()), mimetype='text/event-stream')
+    # Browsers send Last-Event-ID on automatic reconnects; manual reconnects can use the query param.
+    last_event_id = parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    event_stream = stream_channel(
+        f"evaluation:{evaluation_id}",
+        {"evaluation_id": evaluation_id},
+        last_event_id=last_event_id,
+        coalesce_window=current_app.config.get('SSE_COALESCE_WINDOW', 0)
+    )
+    return Response(stream_with_context(event_stream), mimetype='text/event-stream')
 
 @evaluation_bp.route('/<int:evaluation_id>/ai/cancel', methods=['POST'])
 @jwt_required()
@@ -199,6 +192,8 @@ def cancel_evaluation_ai_route(evaluation_id):
     if error:
         return error
     cancel_evaluation(evaluation_id)
+    # Jobs still waiting in the queue never start.
+    cancel_queued_jobs(evaluation_id)
     publish_event(f"evaluation:{evaluation_id}", "cancelled", {"reason": "user_requested"})
     return jsonify({'status': 'cancelled', 'evaluation_id': evaluation_id}), 200
 
@@ -248,6 +243,15 @@ def create_base_listing_route(evaluation_id):
         return error
     return create_base_listing(evaluation_id)
 
+@evaluation_bp.route('/<int:evaluation_id>/listings/bulk-create', methods=['POST'])
+@jwt_required()
+def create_base_listings_bulk_route(evaluation_id):
+    logger.info(f"Bulk create base listings route accessed for evaluation: {evaluation_id}")
+    user, error = get_user_with_active_unit()
+    if error:
+        return error
+    return create_base_listings_bulk(evaluation_id)
+
 @evaluation_bp.route('/<int:evaluation_id>/listings', methods=['GET'])
 @jwt_required()
 def get_base_listings_route(evaluation_id):
@@ -257,6 +261,24 @@ def get_base_listings_route(evaluation_id):
         return error
     return get_base_listings(evaluation_id)
 
+@evaluation_bp.route('/<int:evaluation_id>/comparables', methods=['GET'])
+@jwt_required()
+def get_comparables_route(evaluation_id):
+    logger.info(f"Get comparables route accessed for evaluation: {evaluation_id}")
+    user, error = get_user_with_active_unit()
+    if error:
+        return error
+    return get_comparables(evaluation_id)
+
+@evaluation_bp.route('/<int:evaluation_id>/statistics', methods=['GET'])
+@jwt_required()
+def get_evaluation_statistics_route(evaluation_id):
+    logger.info(f"Get statistics route accessed for evaluation: {evaluation_id}")
+    user, error = get_user_with_active_unit()
+    if error:
+        return error
+    return get_evaluation_statistics(evaluation_id)
+
 # Base Listing Routes (Direct access for update/delete/get single)
 @evaluation_bp.route('/listings/<int:listing_id>', methods=['GET'])
 @jwt_required()
@@ -286,6 +308,15 @@ def update_base_listings_bulk_route(evaluation_id):
         return error
     return update_base_listings_bulk(evaluation_id)
 
+@evaluation_bp.route('/<int:evaluation_id>/listings/what-if', methods=['POST'])
+@jwt_required()
+def preview_listing_scenarios_route(evaluation_id):
+    logger.info(f"Listing what-if route accessed for evaluation: {evaluation_id}")
+    user, error = get_user_with_active_unit()
+    if error:
+        return error
+    return preview_listing_scenarios(evaluation_id)
+
 @evaluation_bp.route('/listings/<int:listing_id>', methods=['DELETE'])
 @jwt_required()
 def delete_base_listing_route(listing_id):
@@ -0,0 +1,20 @@
+from flask import Blueprint
+from flask_jwt_extended import jwt_required
+from app.controllers.stream_controller import open_stream, update_stream_subscriptions
+import logging
+
+logger = logging.getLogger(__name__)
+
+stream_bp = Blueprint('stream', __name__, url_prefix='/api/streams')
+
+@stream_bp.route('', methods=['GET'])
+@jwt_required()
+def open_stream_route():
+    logger.info("Open multiplexed stream route accessed")
+    return open_stream()
+
+@stream_bp.route('/<string:stream_id>/subscriptions', methods=['POST'])
+@jwt_required()
+def update_stream_subscriptions_route(stream_id):
+    logger.info(f"Update stream subscriptions route accessed for stream_id: {stream_id}")
+    return update_stream_subscriptions(stream_id)
@@ -1,19 +1,150 @@
+"""
+Cancellation flags for AI evaluation runs.
+
+Flags live in the ai_cancellations table, so a cancel request handled by any
+gunicorn worker reaches the worker running the job. Each process caches the
+set of active flags for AI_CANCEL_CACHE_SECONDS (1s by default), which keeps
+the frequent checks made by the bot cheap. Flags expire after
+AI_CANCEL_TTL_SECONDS even if clear_evaluation_cancel is never reached.
+Code running outside a Flask app context (threads spawned by the graph or the
+scraper) still reads the table through the app registered with init_app().
+"""
+
+import logging
+import time
+from contextlib import nullcontext
+from datetime import datetime, timedelta
 from threading import Lock
 
-_canceled_evaluations = set()
+from flask import current_app, has_app_context
+from sqlalchemy import text
+
+from app.extensions import db, bot_evaluation_id_var
+
+logger = logging.getLogger(__name__)
+
+# Expired rows are deleted at most this often (seconds).
+PURGE_INTERVAL = 300
+
+_cache = {
+    'ids': frozenset(),
+    'loaded_at': 0.0,
+    'purged_at': 0.0
+}
+# Flags that could not be written to the database: evaluation_id -> expiry (epoch seconds).
+_local_flags = {}
 _lock = Lock()
+_app = None
+
+
+def init_app(app):
+    """Registers the app whose database holds the flags, for checks made outside its context."""
+    global _app
+    _app = app
+
+
+def _app_context():
+    """The current app context, a new one of the registered app, or None without either."""
+    if has_app_context():
+        return nullcontext()
+    if _app is not None:
+        return _app.app_context()
+    return None
+
+
+def _setting(name, default):
+    if has_app_context():
+        return current_app.config.get(name, default)
+    if _app is not None:
+        return _app.config.get(name, default)
+    return default
 
 
 def cancel_evaluation(evaluation_id):
+    ttl = float(_setting('AI_CANCEL_TTL_SECONDS', 21600))
     with _lock:
-        _canceled_evaluations.add(evaluation_id)
+        _cache['ids'] = _cache['ids'] | {evaluation_id}
+
+    context = _app_context()
+    if context is not None:
+        now = datetime.utcnow()
+        try:
+            with context, db.engine.begin() as conn:
+                conn.execute(text(
+                    "INSERT INTO ai_cancellations (evaluation_id, created_at, expires_at) "
+                    "VALUES (:evaluation_id, :now, :expires_at) "
+                    "ON CONFLICT (evaluation_id) DO UPDATE "
+                    "SET created_at = EXCLUDED.created_at, expires_at = EXCLUDED.expires_at"
+                ), {'evaluation_id': evaluation_id, 'now': now, 'expires_at': now + timedelta(seconds=ttl)})
+            return
+        except Exception as e:
+            logger.warning(f"Could not store cancel flag for evaluation {evaluation_id}, keeping it local: {e}")
+
+    with _lock:
+        _local_flags[evaluation_id] = time.time() + ttl
 
 
 def clear_evaluation_cancel(evaluation_id):
     with _lock:
-        _canceled_evaluations.discard(evaluation_id)
+        _cache['ids'] = _cache['ids'] - {evaluation_id}
+        _local_flags.pop(evaluation_id, None)
+
+    context = _app_context()
+    if context is not None:
+        try:
+            with context, db.engine.begin() as conn:
+                conn.execute(
+                    text("DELETE FROM ai_cancellations WHERE evaluation_id = :evaluation_id"),
+                    {'evaluation_id': evaluation_id}
+                )
+        except Exception as e:
+            logger.warning(f"Could not clear cancel flag for evaluation {evaluation_id}: {e}")
+
+
+def _refresh_cache(now, context):
+    utcnow = datetime.utcnow()
+    try:
+        with context, db.engine.begin() as conn:
+            if now - _cache['purged_at'] >= PURGE_INTERVAL:
+                conn.execute(text("DELETE FROM ai_cancellations WHERE expires_at <= :now"), {'now': utcnow})
+                _cache['purged_at'] = now
+            ids = conn.execute(
+                text("SELECT evaluation_id FROM ai_cancellations WHERE expires_at > :now"),
+                {'now': utcnow}
+            ).scalars().all()
+    except Exception as e:
+        # Keep the last known flags and retry after the next cache period.
+        logger.warning(f"Could not refresh AI cancel flags: {e}")
+        with _lock:
+            _cache['loaded_at'] = now
+        return
+
+    with _lock:
+        _cache['ids'] = frozenset(ids)
+        _cache['loaded_at'] = now
 
 
 def is_evaluation_canceled(evaluation_id):
+    now = time.time()
+    with _lock:
+        stale = now - _cache['loaded_at'] >= float(_setting('AI_CANCEL_CACHE_SECONDS', 1.0))
+    context = _app_context() if stale else None
+    if context is not None:
+        _refresh_cache(now, context)
+
     with _lock:
-        return evaluation_id in _canceled_evaluations
+        if evaluation_id in _cache['ids']:
+            return True
+        expires = _local_flags.get(evaluation_id)
+        if expires is None:
+            return False
+        if expires <= now:
+            _local_flags.pop(evaluation_id, None)
+            return False
+        return True
+
+
+def is_current_run_canceled():
+    """True when the AI run executing in this context (bot_evaluation_id_var) was cancelled."""
+    evaluation_id = bot_evaluation_id_var.get()
+    return evaluation_id is not None and is_evaluation_canceled(evaluation_id)
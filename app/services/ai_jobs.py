@@ -0,0 +1,324 @@
+"""
+Durable queue for background AI runs.
+
+Jobs are rows of the ai_jobs table, so a deploy or worker recycle does not lose
+them. Every process runs a small pool of worker threads (greenlets under the
+gevent worker) that claim queued jobs oldest first, honouring a global and a
+per-unit cap on running jobs across all processes. Running jobs heartbeat;
+jobs whose worker stopped heartbeating are requeued and resume from their
+LangGraph checkpoint.
+"""
+
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+
+from sqlalchemy import text
+
+from app.extensions import db
+from app.models.ai_job import AIJob
+from app.services.sse import publish_event
+
+logger = logging.getLogger(__name__)
+
+# Advisory lock serializing claims, so the running-job caps hold across workers.
+CLAIM_LOCK_KEY = 7426010
+# Queue positions are published for at most this many waiting jobs.
+MAX_POSITION_UPDATES = 100
+
+_pool = None
+_pool_lock = Lock()
+
+
+def _job_channels(job):
+    channels = [job.channel_key]
+    if job.evaluation_id is not None:
+        channels.append(f"evaluation:{job.evaluation_id}")
+    return channels
+
+
+def _publish_job_event(job, event, data):
+    for channel_key in _job_channels(job):
+        publish_event(channel_key, event, data)
+
+
+def _publish_position(job, position):
+    _publish_job_event(job, "queue_position", {
+        "job_id": job.id,
+        "status": job.status,
+        "position": position,
+        "conversation_id": job.conversation_id,
+        "evaluation_id": job.evaluation_id
+    })
+
+
+def get_queue_position(job):
+    """1-based position among queued jobs; 0 once the job is running or finished."""
+    if job.status != AIJob.STATUS_QUEUED:
+        return 0
+    ahead = AIJob.query.filter(
+        AIJob.status == AIJob.STATUS_QUEUED,
+        db.or_(
+            AIJob.created_at < job.created_at,
+            db.and_(AIJob.created_at == job.created_at, AIJob.id < job.id)
+        )
+    ).count()
+    return ahead + 1
+
+
+def publish_queue_positions():
+    """Tell every waiting job (up to MAX_POSITION_UPDATES) where it is in the queue."""
+    queued = (
+        AIJob.query.filter_by(status=AIJob.STATUS_QUEUED)
+        .order_by(AIJob.created_at, AIJob.id)
+        .limit(MAX_POSITION_UPDATES)
+        .all()
+    )
+    for position, job in enumerate(queued, start=1):
+        _publish_position(job, position)
+
+
+def enqueue_job(app, conversation_id, full_input, channel_key, use_tuple_list, evaluation_id=None, user_id=None, unit_id=None):
+    job = AIJob(
+        unit_id=unit_id,
+        user_id=user_id,
+        conversation_id=conversation_id,
+        evaluation_id=evaluation_id,
+        channel_key=channel_key,
+        input=full_input,
+        use_tuple_list=use_tuple_list,
+        status=AIJob.STATUS_QUEUED
+    )
+    db.session.add(job)
+    db.session.commit()
+    logger.info(f"AI job {job.id} queued for conversation {conversation_id}")
+
+    _publish_position(job, get_queue_position(job))
+    get_pool(app).wake()
+    return job
+
+
+def cancel_queued_jobs(evaluation_id):
+    """Cancel jobs of an evaluation that have not started yet. Returns how many were cancelled."""
+    count = AIJob.query.filter_by(evaluation_id=evaluation_id, status=AIJob.STATUS_QUEUED).update(
+        {'status': AIJob.STATUS_CANCELLED, 'finished_at': datetime.utcnow()},
+        synchronize_session=False
+    )
+    db.session.commit()
+    return count
+
+
+class AIJobPool:
+    """Per-process worker pool executing ai_jobs rows."""
+
+    def __init__(self, app):
+        self.app = app
+        config = app.config
+        self.size = int(config.get('AI_JOB_WORKERS', 2))
+        self.global_limit = int(config.get('AI_JOB_GLOBAL_CONCURRENCY', 4))
+        self.unit_limit = int(config.get('AI_JOB_UNIT_CONCURRENCY', 2))
+        self.poll_interval = float(config.get('AI_JOB_POLL_INTERVAL', 2))
+        self.heartbeat_interval = float(config.get('AI_JOB_HEARTBEAT_INTERVAL', 30))
+        self.stale_after = float(config.get('AI_JOB_STALE_AFTER', 120))
+        self.max_attempts = int(config.get('AI_JOB_MAX_ATTEMPTS', 3))
+        self.worker_id = None
+        self._wake = Event()
+        self._running = set()
+        self._lock = Lock()
+        self._threads = []
+        self._pid = None
+        self._last_recovery = None
+
+    def start(self):
+        # Threads do not survive a fork; start them once per process.
+        with self._lock:
+            if self._pid == os.getpid() or self.size <= 0:
+                return
+            self._pid = os.getpid()
+            self.worker_id = f"{socket.gethostname()}:{self._pid}"
+            self._threads = [
+                Thread(target=self._work_forever, name=f'ai-job-worker-{index}', daemon=True)
+                for index in range(self.size)
+            ]
+            self._threads.append(Thread(target=self._heartbeat_forever, name='ai-job-heartbeat', daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"AI job pool started with {self.size} workers ({self.worker_id})")
+
+    def wake(self):
+        self.start()
+        self._wake.set()
+
+    def _work_forever(self):
+        while True:
+            job_id = None
+            try:
+                with self.app.app_context():
+                    job_id = self._claim_next()
+                    if job_id is not None:
+                        self._execute(job_id)
+            except Exception as e:
+                logger.error(f"AI job worker error: {e}", exc_info=True)
+            if job_id is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _heartbeat_forever(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            with self._lock:
+                running = list(self._running)
+            if not running:
+                continue
+            try:
+                with self.app.app_context():
+                    AIJob.query.filter(AIJob.id.in_(running)).update(
+                        {'heartbeat_at': datetime.utcnow()},
+                        synchronize_session=False
+                    )
+                    db.session.commit()
+            except Exception as e:
+                logger.warning(f"AI job heartbeat failed: {e}")
+
+    def _recover_stale_jobs(self, now):
+        """Requeue running jobs whose worker died; give up after max_attempts."""
+        stale_before = now - timedelta(seconds=self.stale_after)
+        failed = db.session.execute(text(
+            "UPDATE ai_jobs SET status = :failed, error = 'Worker lost', finished_at = :now "
+            "WHERE status = :running AND heartbeat_at < :stale_before AND attempts >= :max_attempts "
+            "RETURNING id"
+        ), {
+            'failed': AIJob.STATUS_FAILED,
+            'running': AIJob.STATUS_RUNNING,
+            'now': now,
+            'stale_before': stale_before,
+            'max_attempts': self.max_attempts
+        }).scalars().all()
+        requeued = db.session.execute(text(
+            "UPDATE ai_jobs SET status = :queued, worker_id = NULL "
+            "WHERE status = :running AND heartbeat_at < :stale_before RETURNING id"
+        ), {
+            'queued': AIJob.STATUS_QUEUED,
+            'running': AIJob.STATUS_RUNNING,
+            'stale_before': stale_before
+        }).scalars().all()
+        if requeued:
+            logger.warning(f"Requeued AI jobs left running by a lost worker: {requeued}")
+        return failed
+
+    def _claim_next(self):
+        now = datetime.utcnow()
+        db.session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': CLAIM_LOCK_KEY})
+
+        failed = []
+        if self._last_recovery is None or (now - self._last_recovery).total_seconds() >= self.heartbeat_interval:
+            failed = self._recover_stale_jobs(now)
+            self._last_recovery = now
+
+        row = db.session.execute(text(
+            "WITH running AS ("
+            "  SELECT unit_id, count(*) AS total FROM ai_jobs WHERE status = :running GROUP BY unit_id"
+            ") "
+            "SELECT j.id FROM ai_jobs j "
+            "WHERE j.status = :queued "
+            "AND (SELECT coalesce(sum(total), 0) FROM running) < :global_limit "
+            "AND coalesce((SELECT total FROM running r WHERE r.unit_id IS NOT DISTINCT FROM j.unit_id), 0) < :unit_limit "
+            "ORDER BY j.created_at, j.id LIMIT 1 FOR UPDATE SKIP LOCKED"
+        ), {
+            'running': AIJob.STATUS_RUNNING,
+            'queued': AIJob.STATUS_QUEUED,
+            'global_limit': self.global_limit,
+            'unit_limit': self.unit_limit
+        }).first()
+
+        job_id = None
+        if row is not None:
+            job_id = row[0]
+            db.session.execute(text(
+                "UPDATE ai_jobs SET status = :running, worker_id = :worker_id, attempts = attempts + 1, "
+                "started_at = :now, heartbeat_at = :now WHERE id = :id"
+            ), {'running': AIJob.STATUS_RUNNING, 'worker_id': self.worker_id, 'now': now, 'id': job_id})
+            with self._lock:
+                self._running.add(job_id)
+        db.session.commit()
+
+        for failed_id in failed:
+            job = AIJob.query.get(failed_id)
+            if job:
+                _publish_job_event(job, "error", {"error": "AI job failed after repeated worker losses", "job_id": job.id})
+        return job_id
+
+    def _finish(self, job_id, attempt, status, error=None):
+        """
+        Records the final status, committing it together with whatever the run left in
+        the session, only while this worker still runs this attempt of the job. Returns
+        False, rolling the session back, when the job was requeued as stale (and maybe
+        claimed again) meanwhile; the run's result is then discarded.
+        """
+        updated = db.session.execute(text(
+            "UPDATE ai_jobs SET status = :status, error = :error, finished_at = :now "
+            "WHERE id = :id AND worker_id = :worker_id AND status = :running AND attempts = :attempts"
+        ), {
+            'status': status,
+            'error': error,
+            'now': datetime.utcnow(),
+            'id': job_id,
+            'worker_id': self.worker_id,
+            'running': AIJob.STATUS_RUNNING,
+            'attempts': attempt
+        }).rowcount
+        if not updated:
+            db.session.rollback()
+            logger.warning(f"AI job {job_id} is no longer owned by this worker; discarding its {status} result")
+            return False
+        db.session.commit()
+        return True
+
+    def _execute(self, job_id):
+        # Imported here: bot_controller enqueues through this module.
+        from app.controllers.bot_controller import run_ai_job
+
+        attempt = None
+        finished = []
+
+        def finish(status, error=None):
+            finished.append(status)
+            return self._finish(job_id, attempt, status, error)
+
+        try:
+            job = AIJob.query.get(job_id)
+            if job is None:
+                return
+            attempt = job.attempts
+            _publish_position(job, 0)
+            publish_queue_positions()
+            logger.info(f"AI job {job_id} started (attempt {attempt})")
+            run_ai_job(job, finish)
+        except Exception as e:
+            logger.error(f"AI job {job_id} failed: {e}", exc_info=True)
+            db.session.rollback()
+            if attempt is not None and not finished:
+                finish(AIJob.STATUS_FAILED, str(e))
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+
+        logger.info(f"AI job {job_id} finished with status {finished[-1] if finished else None}")
+        # A slot is free again; let the idle workers of this process look for work.
+        self._wake.set()
+
+
+def get_pool(app):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = AIJobPool(app)
+    return _pool
+
+
+def start_pool(app):
+    """Start this process' workers right away, e.g. from gunicorn's post_worker_init, so jobs are resumed after a deploy."""
+    get_pool(app).start()
@@ -0,0 +1,133 @@
+"""
+Comparables lookup over BaseListings already collected by the unit.
+
+Listings gathered for earlier evaluations are reused as candidates for a new
+one: SQL narrows them down by location, size, rooms and recency (see the
+base_listings indexes), and the survivors are ranked by similarity to the
+target evaluation, so the bot only has to search the web for the gap.
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_
+
+from app.extensions import db
+from app.models.evaluation import Evaluation, BaseListing
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+DEFAULT_MAX_AGE_DAYS = 90
+DEFAULT_AREA_TOLERANCE = 0.3
+DEFAULT_ROOM_TOLERANCE = 1
+# Rows ranked in Python per lookup; the SQL filters keep this far above what is returned.
+CANDIDATE_POOL = 500
+
+SCOPES = ('neighborhood', 'city')
+
+# Relative weight of each difference in the distance (lower distance = more similar).
+WEIGHTS = {
+    'area': 3.0,
+    'bedrooms': 1.0,
+    'bathrooms': 0.5,
+    'parking_spaces': 0.5,
+    'age': 0.5,
+    'other_neighborhood': 1.0,
+}
+
+
+def _normalized(value):
+    return (value or '').strip().lower()
+
+
+def _rent_filter():
+    classification = func.lower(func.coalesce(Evaluation.classification, ''))
+    return or_(classification.like('%aluguel%'), classification.like('%rent%'))
+
+
+def _distance(evaluation, listing, max_age_days, now):
+    area = evaluation.area or 0
+    distance = WEIGHTS['area'] * (abs((listing.area or 0) - area) / area if area else 0)
+    for field in ('bedrooms', 'bathrooms', 'parking_spaces'):
+        distance += WEIGHTS[field] * abs((getattr(listing, field) or 0) - (getattr(evaluation, field) or 0))
+    if listing.collected_at and max_age_days:
+        distance += WEIGHTS['age'] * min((now - listing.collected_at).days / max_age_days, 1)
+    if _normalized(listing.neighborhood) != _normalized(evaluation.neighborhood):
+        distance += WEIGHTS['other_neighborhood']
+    return distance
+
+
+def find_comparables(
+    evaluation,
+    limit=DEFAULT_LIMIT,
+    scope='neighborhood',
+    max_age_days=DEFAULT_MAX_AGE_DAYS,
+    area_tolerance=DEFAULT_AREA_TOLERANCE,
+    room_tolerance=DEFAULT_ROOM_TOLERANCE,
+):
+    """
+    Active listings of other evaluations of the same unit that resemble `evaluation`:
+    same city (and neighborhood unless scope='city'), same rent/sale classification,
+    property type and purpose when the evaluation has them, area within
+    ±area_tolerance, bedrooms/bathrooms/parking within ±room_tolerance and collected
+    in the last max_age_days. Links already in the evaluation are skipped and a link
+    collected several times is returned once (newest). Returns a list of
+    (listing, similarity) with similarity in (0, 1], most similar first.
+    """
+    if scope not in SCOPES:
+        raise ValueError(f"scope must be one of {', '.join(SCOPES)}")
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    now = datetime.utcnow()
+
+    query = (
+        BaseListing.query
+        .join(Evaluation, BaseListing.evaluation_id == Evaluation.id)
+        .filter(
+            Evaluation.unit_id == evaluation.unit_id,
+            BaseListing.evaluation_id != evaluation.id,
+            BaseListing.is_active.is_(True),
+            BaseListing.rent_value > 0,
+            BaseListing.area > 0,
+            func.lower(BaseListing.city) == _normalized(evaluation.city),
+        )
+    )
+    if scope == 'neighborhood':
+        query = query.filter(func.lower(BaseListing.neighborhood) == _normalized(evaluation.neighborhood))
+    if max_age_days:
+        query = query.filter(BaseListing.collected_at >= now - timedelta(days=max_age_days))
+    if evaluation.area and area_tolerance is not None:
+        query = query.filter(BaseListing.area.between(
+            evaluation.area * (1 - area_tolerance),
+            evaluation.area * (1 + area_tolerance)
+        ))
+    if room_tolerance is not None:
+        for field in ('bedrooms', 'bathrooms', 'parking_spaces'):
+            column = getattr(BaseListing, field)
+            target = getattr(evaluation, field) or 0
+            query = query.filter(func.coalesce(column, 0).between(target - room_tolerance, target + room_tolerance))
+    query = query.filter(_rent_filter() if not evaluation._is_sale_classification() else ~_rent_filter())
+    if evaluation.property_type:
+        query = query.filter(func.lower(BaseListing.type) == _normalized(evaluation.property_type))
+    if evaluation.purpose:
+        query = query.filter(func.lower(BaseListing.purpose) == _normalized(evaluation.purpose))
+
+    existing_links = {
+        link for (link,) in db.session.query(BaseListing.link).filter(
+            BaseListing.evaluation_id == evaluation.id,
+            BaseListing.link.isnot(None)
+        )
+    }
+    candidates = query.order_by(BaseListing.collected_at.desc()).limit(CANDIDATE_POOL).all()
+
+    ranked = []
+    seen_links = set(existing_links)
+    for listing in candidates:
+        # Newest first, so a link collected for several evaluations keeps its latest data.
+        if listing.link:
+            if listing.link in seen_links:
+                continue
+            seen_links.add(listing.link)
+        distance = _distance(evaluation, listing, max_age_days, now)
+        ranked.append((listing, round(1 / (1 + distance), 4)))
+
+    ranked.sort(key=lambda item: -item[1])
+    return ranked[:limit]
@@ -1,31 +1,391 @@
 import json
+import logging
 import time
-from queue import Queue, Empty
-from threading import Lock
+from collections import OrderedDict, deque
+
+from app.services.sse_broker import LocalBroker, PostgresNotifyBroker
+from app.services.sse_hub import Empty, Full, HEARTBEAT, HeartbeatWheel, Lock, Queue, ShardedLock
+
+logger = logging.getLogger(__name__)
 
 _listeners = {}
-_lock = Lock()
+# Publish/register/remove only contend with operations on channels of the same shard.
+_locks = ShardedLock()
+# Guards the LRU indexes below (_history, _channel_stats); held only for dict bookkeeping.
+_index_lock = Lock()
+_broker = LocalBroker()
+_heartbeats = HeartbeatWheel()
+
+# Replay log: the last events of each channel, so a reconnecting client can
+# resume from its Last-Event-ID instead of reloading everything.
+_history = OrderedDict()
+_history_settings = {
+    'buffer_size': 200,
+    'max_channels': 1000
+}
+_evicted_channel_floor = 0
+# Highest event id delivered to this process. With the Postgres broker ids come from a
+# sequence and publishers in different workers can commit out of order, so an event may
+# arrive after one with a higher id; see _ChannelHistory.late.
+_max_delivered_id = 0
+
+# Per-listener queue bound. On overflow 'drop_oldest' discards the oldest pending
+# event, 'coalesce' collapses the whole backlog into a single resync notice.
+# A listener that keeps overflowing without consuming is evicted.
+_listener_settings = {
+    'queue_size': 100,
+    'overflow_policy': 'drop_oldest',
+    'evict_after_drops': 50
+}
+OVERFLOW_POLICIES = ('drop_oldest', 'coalesce')
+
+_channel_stats = OrderedDict()
+
+
+def _stats_for(channel_key):
+    """Counters of channel_key, marked most recently used. The caller holds _index_lock."""
+    stats = _channel_stats.get(channel_key)
+    if stats is None:
+        stats = {'queued': 0, 'dropped': 0, 'evicted': 0}
+        _channel_stats[channel_key] = stats
+        while len(_channel_stats) > _history_settings['max_channels']:
+            _channel_stats.popitem(last=False)
+    else:
+        _channel_stats.move_to_end(channel_key)
+    return stats
+
+
+def _count(channel_key, field, amount=1):
+    """Adds to a channel counter; control channels are not tracked."""
+    if not amount or is_control_channel(channel_key):
+        return
+    with _index_lock:
+        _stats_for(channel_key)[field] += amount
+
+
+def _notice(event, channel_key):
+    return {"event": event, "data": {"channel": channel_key}, "ts": int(time.time())}
+
+
+class SSEListener:
+    """
+    Bounded event queue of one SSE connection. A listener can be attached to
+    several channels (multiplexed streams); items are (channel_key, payload).
+    """
+
+    def __init__(self, maxsize, overflow_policy, evict_after_drops):
+        self.overflow_policy = overflow_policy
+        self.evict_after_drops = evict_after_drops
+        self.evicted = False
+        self.channel_keys = set()
+        self.heartbeat_slot = None
+        self._queue = Queue(maxsize=maxsize)
+        # Resync notices of replays that found the queue full, delivered ahead of it.
+        self._pending_notices = deque()
+        self._lock = Lock()
+        # Drops since the consumer last took an event off the queue.
+        self._pending_drops = 0
+        self._last_activity = time.monotonic()
+
+    def offer(self, channel_key, payload):
+        """Queue a payload. Returns False when the listener has been evicted."""
+        with self._lock:
+            if self.evicted:
+                return False
+            try:
+                self._queue.put_nowait((channel_key, payload))
+                _count(channel_key, 'queued')
+                return True
+            except Full:
+                pass
+
+            self._pending_drops += 1
+            if self._pending_drops > self.evict_after_drops:
+                self._evict(channel_key)
+                return False
+
+            _count(channel_key, 'dropped')
+            if self.overflow_policy == 'coalesce':
+                self._coalesce(channel_key)
+            else:
+                self._drain(1)
+                self._queue.put_nowait((channel_key, payload))
+            return True
+
+    def replay(self, channel_key, payloads, has_gap=False):
+        """
+        Queue the events replayed to a reconnecting client. Replay never counts
+        toward eviction: when the history has a gap or the events do not fit in
+        the free queue space, one resync notice is queued instead of them.
+        Returns False when the listener has been evicted.
+        """
+        with self._lock:
+            if self.evicted:
+                return False
+            free = self._free_slots()
+            if not has_gap and (free is None or len(payloads) <= free):
+                for payload in payloads:
+                    self._queue.put_nowait((channel_key, payload))
+                _count(channel_key, 'queued', len(payloads))
+            elif free is None or free > 0:
+                self._queue.put_nowait((channel_key, _notice("resync", channel_key)))
+            else:
+                # Earlier channels of a multiplexed stream filled the queue with their replay,
+                # which stays queued; only this channel falls back to a resync.
+                self._pending_notices.append((channel_key, _notice("resync", channel_key)))
+            return True
+
+    def _free_slots(self):
+        """Free queue slots, or None when the queue is unbounded."""
+        if self._queue.maxsize <= 0:
+            return None
+        return max(self._queue.maxsize - self._queue.qsize(), 0)
+
+    def _coalesce(self, channel_key):
+        """
+        Replace the whole backlog with resync notices: one for channel_key and one
+        for every other channel that had events pending, so none loses them silently.
+        """
+        channel_keys = [channel_key]
+        while True:
+            try:
+                key, payload = self._queue.get_nowait()
+            except Empty:
+                break
+            if key is None:
+                continue
+            if payload["event"] != "resync":
+                _count(key, 'dropped')
+            if key not in channel_keys:
+                channel_keys.append(key)
+        for key in channel_keys:
+            try:
+                self._queue.put_nowait((key, _notice("resync", key)))
+            except Full:
+                break
+
+    def _drain(self, limit=None):
+        drained = 0
+        while limit is None or drained < limit:
+            try:
+                self._queue.get_nowait()
+            except Empty:
+                break
+            drained += 1
+        return drained
+
+    def _evict(self, channel_key):
+        self._pending_notices.clear()
+        _count(channel_key, 'dropped', self._drain())
+        _count(channel_key, 'evicted')
+        self.evicted = True
+        # Tells the consumer to close; the browser reconnects with Last-Event-ID and replays.
+        self._queue.put_nowait((channel_key, _notice("evicted", channel_key)))
+        logger.warning("Evicted slow SSE consumer on %s", channel_key)
+
+    def get(self, timeout=None):
+        with self._lock:
+            item = self._pending_notices.popleft() if self._pending_notices else None
+        if item is None:
+            item = self._queue.get(timeout=timeout)
+        self._pending_drops = 0
+        self._last_activity = time.monotonic()
+        return item
+
+    def heartbeat(self, interval):
+        """Called by the heartbeat wheel; wakes an idle consumer so it can send a keep-alive."""
+        if self.evicted or time.monotonic() - self._last_activity < interval:
+            return
+        with self._lock:
+            if self._queue.empty():
+                try:
+                    self._queue.put_nowait(HEARTBEAT)
+                except Full:
+                    pass
+
+    def qsize(self):
+        return self._queue.qsize() + len(self._pending_notices)
+
+
+class _ChannelHistory:
+    def __init__(self, maxlen):
+        self.events = deque(maxlen=maxlen)
+        # Highest id that fell out of the buffer; replays older than this have a gap.
+        self.dropped_up_to = 0
+        # (id, highest id delivered before it) of events that arrived out of id order.
+        self.late = deque(maxlen=maxlen)
+
+    def append(self, payload, max_delivered_id):
+        if len(self.events) == self.events.maxlen:
+            self.dropped_up_to = max(self.dropped_up_to, self.events[0]['id'])
+        if payload['id'] < max_delivered_id:
+            self.late.append((payload['id'], max_delivered_id))
+        self.events.append(payload)
+
+    def may_have_missed(self, last_event_id):
+        """
+        Whether a client that last saw last_event_id may have missed a late event:
+        one with a lower id that arrived after it, which an id filter cannot replay.
+        """
+        return any(late_id < last_event_id <= seen_id for late_id, seen_id in self.late)
+
+
+def _record_history(channel_key, payload):
+    """Append to the channel's replay log. The caller holds the channel's shard lock."""
+    global _evicted_channel_floor, _max_delivered_id
+    with _index_lock:
+        max_delivered_id = _max_delivered_id
+        _max_delivered_id = max(_max_delivered_id, payload['id'])
+        history = _history.get(channel_key)
+        if history is None:
+            history = _ChannelHistory(_history_settings['buffer_size'])
+            _history[channel_key] = history
+        else:
+            _history.move_to_end(channel_key)
+
+        while len(_history) > _history_settings['max_channels']:
+            _, evicted = _history.popitem(last=False)
+            if evicted.events:
+                _evicted_channel_floor = max(_evicted_channel_floor, max(event['id'] for event in evicted.events))
+    history.append(payload, max_delivered_id)
+
+
+def _deliver_local(channel_key, payload):
+    with _locks.for_key(channel_key):
+        # Control messages are only for the live stream; they must not take replay/stats slots.
+        if payload.get('id') is not None and not is_control_channel(channel_key):
+            _record_history(channel_key, payload)
+        listeners = list(_listeners.get(channel_key, ()))
+    for listener in listeners:
+        if not listener.offer(channel_key, payload):
+            remove_listener(channel_key, listener)
+
+
+_broker.start(_deliver_local)
+
+
+def set_broker(broker):
+    global _broker
+    previous = _broker
+    broker.start(_deliver_local)
+    _broker = broker
+    if previous is not broker:
+        previous.stop()
+
+
+def get_broker():
+    return _broker
+
 
+def init_app(app):
+    """Select the SSE broker from app config (SSE_BROKER = 'local' or 'postgres')."""
+    _history_settings['buffer_size'] = int(app.config.get('SSE_REPLAY_BUFFER_SIZE', 200))
+    _history_settings['max_channels'] = int(app.config.get('SSE_REPLAY_MAX_CHANNELS', 1000))
 
-def register_listener(channel_key):
-    queue = Queue()
-    with _lock:
+    overflow_policy = (app.config.get('SSE_OVERFLOW_POLICY') or 'drop_oldest').strip().lower()
+    if overflow_policy not in OVERFLOW_POLICIES:
+        raise ValueError(f"Unknown SSE_OVERFLOW_POLICY '{overflow_policy}'. Use one of {OVERFLOW_POLICIES}.")
+    _listener_settings['overflow_policy'] = overflow_policy
+    _listener_settings['queue_size'] = int(app.config.get('SSE_LISTENER_QUEUE_SIZE', 100))
+    _listener_settings['evict_after_drops'] = int(app.config.get('SSE_EVICT_AFTER_DROPS', 50))
+    _heartbeats.interval = float(app.config.get('SSE_HEARTBEAT_INTERVAL', 15))
+
+    backend = (app.config.get('SSE_BROKER') or 'local').strip().lower()
+    if backend == 'local':
+        broker = LocalBroker()
+    elif backend == 'postgres':
+        dsn = app.config.get('SSE_BROKER_URL') or app.config.get('SQLALCHEMY_DATABASE_URI')
+        broker = PostgresNotifyBroker(dsn, channel=app.config.get('SSE_NOTIFY_CHANNEL', 'precifica_sse'))
+    else:
+        raise ValueError(f"Unknown SSE_BROKER '{backend}'. Use 'local' or 'postgres'.")
+    set_broker(broker)
+    logger.info("SSE broker configured: %s", backend)
+
+
+def parse_event_id(value):
+    """Parse a Last-Event-ID header/query value. Returns None when absent or invalid."""
+    if value is None:
+        return None
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        return None
+
+
+def _replay_events(channel_key, last_event_id):
+    """Return (events newer than last_event_id, whether the history has a gap)."""
+    floor = max(_broker.history_floor or 0, _evicted_channel_floor)
+    history = _history.get(channel_key)
+    if history is None:
+        return [], last_event_id < floor
+
+    floor = max(floor, history.dropped_up_to)
+    events = [payload for payload in history.events if payload['id'] > last_event_id]
+    return events, last_event_id < floor or history.may_have_missed(last_event_id)
+
+
+def register_listener(channel_key, last_event_id=None, listener=None):
+    """
+    Subscribe a listener to channel_key, replaying events newer than last_event_id.
+    Pass an existing listener to attach one more channel to a multiplexed stream.
+    """
+    if listener is None:
+        listener = SSEListener(
+            _listener_settings['queue_size'],
+            _listener_settings['overflow_policy'],
+            _listener_settings['evict_after_drops']
+        )
+        _heartbeats.add(listener)
+    if not is_control_channel(channel_key):
+        with _index_lock:
+            _stats_for(channel_key)
+
+    with _locks.for_key(channel_key):
+        if last_event_id is not None:
+            events, has_gap = _replay_events(channel_key, last_event_id)
+            # A gap means some events are gone for good; the client must reload its state.
+            listener.replay(channel_key, events, has_gap)
+        if listener.evicted:
+            # Evicted through another channel of its stream, which is closing.
+            return listener
+
+        listener.channel_keys.add(channel_key)
         listeners = _listeners.get(channel_key)
         if listeners is None:
             listeners = set()
             _listeners[channel_key] = listeners
-        listeners.add(queue)
-    return queue
+        listeners.add(listener)
+    return listener
 
 
-def remove_listener(channel_key, queue):
-    with _lock:
+def remove_listener(channel_key, listener):
+    with _locks.for_key(channel_key):
+        listener.channel_keys.discard(channel_key)
         listeners = _listeners.get(channel_key)
-        if not listeners:
-            return
-        listeners.discard(queue)
-        if not listeners:
-            _listeners.pop(channel_key, None)
+        if listeners:
+            listeners.discard(listener)
+            if not listeners:
+                _listeners.pop(channel_key, None)
+    if not listener.channel_keys:
+        _heartbeats.discard(listener)
+
+
+def get_channel_stats(channel_key=None):
+    """Queued/dropped/evicted counters plus current listeners and backlog, per channel."""
+    with _index_lock:
+        keys = [channel_key] if channel_key is not None else list(_channel_stats.keys() | set(_listeners))
+        counters = {key: dict(_channel_stats.get(key, {'queued': 0, 'dropped': 0, 'evicted': 0})) for key in keys}
+
+    result = {}
+    for key in keys:
+        with _locks.for_key(key):
+            listeners = list(_listeners.get(key, ()))
+        result[key] = {
+            **counters[key],
+            'listeners': len(listeners),
+            'pending': sum(listener.qsize() for listener in listeners)
+        }
+    return result
 
 
 def publish_event(channel_key, event, data):
@@ -34,11 +394,180 @@ def publish_event(channel_key, event, data):
         "data": data,
         "ts": int(time.time())
     }
-    with _lock:
-        listeners = list(_listeners.get(channel_key, []))
-    for queue in listeners:
-        queue.put(payload)
+    _broker.publish(channel_key, payload)
+
+
+def format_sse(event, data, event_id=None):
+    message = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=True)}\n\n"
+    if event_id is not None:
+        message = f"id: {event_id}\n{message}"
+    return message
+
+
+def _is_coalescable(payload):
+    return payload["event"] == "listing_added" and "changes" in payload["data"]
+
+
+def _coalesce_listing_burst(listener, first_item, window):
+    """
+    Merge delta-mode listing_added events of one channel arriving within `window`
+    seconds into one listings_added frame. Returns (frames, item that ended the burst or None).
+    """
+    channel_key, first_payload = first_item
+    listings = [first_payload["data"]["listing"]]
+    changes = dict(first_payload["data"]["changes"])
+    last_payload = first_payload
+    held = None
+    deadline = time.monotonic() + window
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            item = listener.get(timeout=remaining)
+        except Empty:
+            break
+        if item[0] != channel_key or not _is_coalescable(item[1]):
+            held = item
+            break
+        listings.append(item[1]["data"]["listing"])
+        changes.update(item[1]["data"]["changes"])
+        last_payload = item[1]
+
+    if len(listings) == 1:
+        return [first_item], held
+
+    merged = {
+        "event": "listings_added",
+        "data": {
+            "evaluation_id": first_payload["data"].get("evaluation_id"),
+            "listings": listings,
+            "changes": changes
+        },
+        "id": last_payload.get("id"),
+        "ts": last_payload["ts"]
+    }
+    return [(channel_key, merged)], held
+
+
+def _iter_items(listener, coalesce_window):
+    """
+    Yield (channel_key, payload) items from a listener, or None when a heartbeat is due.
+    Blocks without a timeout; the heartbeat wheel wakes idle listeners.
+    """
+    held = None
+    while True:
+        if held is not None:
+            item, held = held, None
+        else:
+            item = listener.get()
+
+        if item is HEARTBEAT:
+            yield None
+        elif coalesce_window and _is_coalescable(item[1]):
+            items, held = _coalesce_listing_burst(listener, item, coalesce_window)
+            yield from items
+        else:
+            yield item
+
+
+def stream_channel(channel_key, connected_data, last_event_id=None, coalesce_window=0):
+    """
+    SSE generator for one channel, replaying events newer than last_event_id first.
+    With coalesce_window > 0, bursts of delta listing_added events are merged.
+    """
+    listener = register_listener(channel_key, last_event_id=last_event_id)
+    try:
+        yield format_sse("connected", connected_data)
+        for item in _iter_items(listener, coalesce_window):
+            if item is None:
+                yield ": ping\n\n"
+                continue
+
+            _, payload = item
+            yield format_sse(payload["event"], payload["data"], payload.get("id"))
+            if payload["event"] == "evicted":
+                break
+    except GeneratorExit:
+        pass
+    finally:
+        remove_listener(channel_key, listener)
+
+
+CONTROL_CHANNEL_PREFIX = "stream:"
+
+
+def control_channel_key(stream_id):
+    return f"{CONTROL_CHANNEL_PREFIX}{stream_id}"
+
+
+def is_control_channel(channel_key):
+    return channel_key.startswith(CONTROL_CHANNEL_PREFIX)
+
+
+def request_subscription_change(stream_id, owner_id, add=(), remove=()):
+    """
+    Ask a multiplexed stream to add/remove channels. Goes through the broker so it
+    reaches the stream whichever worker holds the connection.
+    """
+    publish_event(
+        control_channel_key(stream_id),
+        "subscriptions",
+        {"owner_id": owner_id, "add": list(add), "remove": list(remove)}
+    )
+
+
+def stream_channels(stream_id, owner_id, channel_keys, last_event_id=None, coalesce_window=0, max_channels=None):
+    """
+    SSE generator multiplexing several channels on one connection. Frames keep the
+    original event name and wrap the data as {"channel": ..., "data": ...}.
+    Subscriptions change through request_subscription_change(stream_id, ...); a change
+    that would take the stream past max_channels adds nothing and reports the rejected keys.
+    """
+    control_key = control_channel_key(stream_id)
+    listener = register_listener(control_key)
+    for channel_key in channel_keys:
+        register_listener(channel_key, last_event_id=last_event_id, listener=listener)
+
+    def subscribed():
+        return sorted(key for key in listener.channel_keys if key != control_key)
+
+    try:
+        yield format_sse("connected", {"stream_id": stream_id, "channels": subscribed()})
+        for item in _iter_items(listener, coalesce_window):
+            if item is None:
+                yield ": ping\n\n"
+                continue
 
+            channel_key, payload = item
+            if channel_key == control_key:
+                change = payload["data"]
+                if payload["event"] != "subscriptions" or change.get("owner_id") != owner_id:
+                    continue
+                for key in change.get("remove", []):
+                    if key != control_key:
+                        remove_listener(key, listener)
+                added = [key for key in dict.fromkeys(change.get("add", [])) if key not in listener.channel_keys]
+                result = {"stream_id": stream_id}
+                # The cap is checked here, where the current subscriptions are known.
+                if max_channels is not None and len(subscribed()) + len(added) > max_channels:
+                    result.update({"rejected": added, "error": f"At most {max_channels} channels per stream"})
+                else:
+                    for key in added:
+                        register_listener(key, listener=listener)
+                result["channels"] = subscribed()
+                yield format_sse("subscriptions", result)
+                continue
 
-def format_sse(event, data):
-    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=True)}\n\n"
+            yield format_sse(
+                payload["event"],
+                {"channel": channel_key, "data": payload["data"]},
+                payload.get("id")
+            )
+            if payload["event"] == "evicted":
+                break
+    except GeneratorExit:
+        pass
+    finally:
+        for channel_key in list(listener.channel_keys):
+            remove_listener(channel_key, listener)
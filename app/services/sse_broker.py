@@ -0,0 +1,223 @@
+"""
+Brokers used by app.services.sse to fan events out to SSE listeners.
+
+A broker receives every published event and hands it back to the local
+delivery callback of each worker process that should see it:
+
+- LocalBroker: single process, delivers synchronously (development / one worker).
+- PostgresNotifyBroker: uses Postgres LISTEN/NOTIFY so that an event published
+  by any gunicorn worker reaches listeners connected to every other worker.
+
+Brokers also assign the event ``id`` used for Last-Event-ID replay, and expose
+``history_floor``: every event with an id above it has been delivered to this
+process. LocalBroker ids are strictly increasing. PostgresNotifyBroker ids come
+from a sequence and are only approximately ordered: two workers publishing at
+once can commit (and so deliver) a lower id after a higher one. app.services.sse
+records such late events and answers a replay that may have skipped one with resync.
+"""
+
+import json
+import logging
+import os
+import time
+import uuid
+from threading import Event, Lock, Thread
+
+import psycopg
+from psycopg import sql
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY payloads are limited to 8000 bytes; keep some room for the chunk header.
+NOTIFY_CHUNK_SIZE = 7500
+
+
+def to_libpq_dsn(url):
+    """Convert a SQLAlchemy URL (postgresql+psycopg2://...) into a libpq DSN."""
+    parsed = make_url(url)
+    if '+' in parsed.drivername:
+        parsed = parsed.set(drivername=parsed.drivername.split('+', 1)[0])
+    return parsed.render_as_string(hide_password=False)
+
+
+class LocalBroker:
+    """In-process broker: events only reach listeners of the current worker."""
+
+    def __init__(self):
+        self._deliver = None
+        self._id_lock = Lock()
+        self._last_id = 0
+        self.history_floor = 0
+
+    def _next_id(self):
+        # Millisecond based so ids keep growing across process restarts.
+        with self._id_lock:
+            self._last_id = max(self._last_id + 1, int(time.time() * 1000))
+            return self._last_id
+
+    def start(self, deliver):
+        self._deliver = deliver
+        self.history_floor = self._next_id()
+
+    def stop(self):
+        self._deliver = None
+
+    def publish(self, channel_key, payload):
+        payload['id'] = self._next_id()
+        if self._deliver is not None:
+            self._deliver(channel_key, payload)
+
+
+class PostgresNotifyBroker:
+    """
+    Cross-process broker backed by Postgres LISTEN/NOTIFY.
+
+    Each worker keeps a single LISTEN connection (one background thread) and
+    demultiplexes notifications to its local queues by channel key. Payloads
+    larger than the NOTIFY limit are split in chunks sent in one transaction,
+    so they arrive contiguous and in order.
+    """
+
+    def __init__(self, dsn, channel='precifica_sse', reconnect_delay=1.0, chunk_size=NOTIFY_CHUNK_SIZE):
+        self._dsn = to_libpq_dsn(dsn)
+        self._channel = channel
+        self._sequence = f"{channel}_event_id_seq"
+        self.history_floor = 0
+        self._reconnect_delay = reconnect_delay
+        self._chunk_size = chunk_size
+        self._deliver = None
+        self._stopped = Event()
+        self._thread = None
+        self._pid = None
+        self._publish_conn = None
+        self._publish_lock = Lock()
+        self._partials = {}
+
+    def start(self, deliver):
+        self._deliver = deliver
+        self._ensure_listener()
+
+    def stop(self):
+        self._stopped.set()
+        with self._publish_lock:
+            if self._publish_conn is not None:
+                try:
+                    self._publish_conn.close()
+                except Exception:
+                    pass
+                self._publish_conn = None
+
+    def _ensure_listener(self):
+        # The listener thread does not survive a fork, so restart it per process.
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stopped.clear()
+        self._thread = Thread(target=self._listen_forever, name='sse-pg-listener', daemon=True)
+        self._thread.start()
+
+    def _listen_forever(self):
+        while not self._stopped.is_set():
+            try:
+                with psycopg.connect(self._dsn, autocommit=True) as conn:
+                    conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self._channel)))
+                    # Events with ids above the current sequence value are now guaranteed
+                    # to reach this connection; anything older may have been missed.
+                    self.history_floor = self._read_sequence_floor(conn)
+                    logger.info("SSE broker listening on Postgres channel %s", self._channel)
+                    while not self._stopped.is_set():
+                        for notify in conn.notifies(timeout=5.0):
+                            self._handle_notification(notify.payload)
+                        self._purge_partials()
+            except Exception as e:
+                if self._stopped.is_set():
+                    break
+                logger.warning("SSE broker listener failed, reconnecting: %s", e)
+                self._stopped.wait(self._reconnect_delay)
+
+    def _ensure_sequence(self, conn):
+        conn.execute(sql.SQL("CREATE SEQUENCE IF NOT EXISTS {}").format(sql.Identifier(self._sequence)))
+
+    def _read_sequence_floor(self, conn):
+        self._ensure_sequence(conn)
+        row = conn.execute(
+            "SELECT coalesce(pg_sequence_last_value(%s::regclass), 0)",
+            (self._sequence,)
+        ).fetchone()
+        return int(row[0])
+
+    def _handle_notification(self, raw):
+        try:
+            message_id, index, count, chunk = raw.split(':', 3)
+            index = int(index)
+            count = int(count)
+        except ValueError:
+            logger.warning("Ignoring malformed SSE notification")
+            return
+
+        if count == 1:
+            body = chunk
+        else:
+            parts = self._partials.setdefault(message_id, {'ts': time.monotonic(), 'chunks': [None] * count})
+            parts['chunks'][index] = chunk
+            if any(part is None for part in parts['chunks']):
+                return
+            self._partials.pop(message_id, None)
+            body = ''.join(parts['chunks'])
+
+        try:
+            message = json.loads(body)
+        except ValueError:
+            logger.warning("Ignoring undecodable SSE notification %s", message_id)
+            return
+
+        deliver = self._deliver
+        if deliver is not None:
+            deliver(message['channel'], message['payload'])
+
+    def _purge_partials(self, max_age=60):
+        now = time.monotonic()
+        for message_id in [key for key, value in self._partials.items() if now - value['ts'] > max_age]:
+            self._partials.pop(message_id, None)
+
+    def _get_publish_connection(self):
+        if self._publish_conn is None or self._publish_conn.closed:
+            self._publish_conn = psycopg.connect(self._dsn, autocommit=True)
+            self._ensure_sequence(self._publish_conn)
+        return self._publish_conn
+
+    def _send(self, channel_key, payload):
+        message_id = uuid.uuid4().hex
+        conn = self._get_publish_connection()
+        with conn.transaction():
+            row = conn.execute("SELECT nextval(%s::regclass)", (self._sequence,)).fetchone()
+            payload['id'] = int(row[0])
+            body = json.dumps({'channel': channel_key, 'payload': payload}, ensure_ascii=True, default=str)
+            chunks = [body[i:i + self._chunk_size] for i in range(0, len(body), self._chunk_size)]
+            for index, chunk in enumerate(chunks):
+                conn.execute(
+                    "SELECT pg_notify(%s, %s)",
+                    (self._channel, f"{message_id}:{index}:{len(chunks)}:{chunk}")
+                )
+
+    def publish(self, channel_key, payload):
+        self._ensure_listener()
+        with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    self._send(channel_key, payload)
+                    return
+                except Exception as e:
+                    logger.warning("SSE broker publish failed (attempt %s): %s", attempt + 1, e)
+                    try:
+                        if self._publish_conn is not None:
+                            self._publish_conn.close()
+                    except Exception:
+                        pass
+                    self._publish_conn = None
+
+        # Postgres unavailable: at least reach the listeners of this worker.
+        logger.error("SSE broker could not publish %s to Postgres; delivering locally only", channel_key)
+        if self._deliver is not None:
+            self._deliver(channel_key, payload)
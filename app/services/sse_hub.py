@@ -0,0 +1,116 @@
+"""
+Wait primitives and heartbeat scheduling used by app.services.sse.
+
+Under gunicorn's gevent worker every SSE connection is a greenlet, so the hub
+uses gevent queues and locks and a single heartbeat greenlet. Outside gevent
+(flask run, scripts) it falls back to the stdlib equivalents and a daemon thread.
+"""
+
+import logging
+import os
+import time
+from queue import Empty, Full  # gevent.queue raises these same exceptions
+
+try:
+    from gevent import monkey as _gevent_monkey
+except ImportError:
+    _gevent_monkey = None
+
+logger = logging.getLogger(__name__)
+
+# Gunicorn patches the worker before the app is imported, so checking once at import is enough.
+COOPERATIVE = _gevent_monkey is not None and _gevent_monkey.is_module_patched('threading')
+
+if COOPERATIVE:
+    import gevent
+    from gevent.lock import Semaphore as Lock
+    from gevent.queue import Queue
+
+    sleep = gevent.sleep
+
+    def spawn(target, name):
+        return gevent.spawn(target)
+else:
+    from queue import Queue
+    from threading import Lock, Thread
+
+    sleep = time.sleep
+
+    def spawn(target, name):
+        thread = Thread(target=target, name=name, daemon=True)
+        thread.start()
+        return thread
+
+
+# Queued by the heartbeat wheel; stream generators turn it into an SSE comment.
+HEARTBEAT = (None, None)
+
+
+class ShardedLock:
+    """Fixed pool of locks; a channel key always maps to the same shard."""
+
+    def __init__(self, shards=64):
+        self._locks = [Lock() for _ in range(shards)]
+
+    def for_key(self, key):
+        return self._locks[hash(key) % len(self._locks)]
+
+
+class HeartbeatWheel:
+    """
+    One ticker for every SSE listener of the process.
+
+    Listeners are spread round-robin over `slots` buckets. Every interval/slots
+    seconds the ticker visits the next bucket and queues HEARTBEAT for its idle
+    listeners, so connections block without a timeout and an idle stream still
+    gets a keep-alive at least every 2 * interval seconds.
+    """
+
+    def __init__(self, interval=15, slots=30):
+        self.interval = interval
+        self._slots = [set() for _ in range(slots)]
+        self._cursor = 0
+        self._next_slot = 0
+        self._lock = Lock()
+        self._runner = None
+        self._pid = None
+
+    def add(self, listener):
+        self._ensure_running()
+        with self._lock:
+            slot = self._next_slot
+            self._next_slot = (slot + 1) % len(self._slots)
+            self._slots[slot].add(listener)
+        listener.heartbeat_slot = slot
+
+    def discard(self, listener):
+        slot = getattr(listener, 'heartbeat_slot', None)
+        if slot is None:
+            return
+        with self._lock:
+            self._slots[slot].discard(listener)
+        listener.heartbeat_slot = None
+
+    def size(self):
+        with self._lock:
+            return sum(len(slot) for slot in self._slots)
+
+    def _ensure_running(self):
+        # Like the broker listener, the ticker does not survive a fork.
+        with self._lock:
+            if self._runner is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._runner = spawn(self._run, 'sse-heartbeat')
+
+    def _run(self):
+        while True:
+            sleep(self.interval / len(self._slots))
+            try:
+                with self._lock:
+                    bucket = list(self._slots[self._cursor])
+                    self._cursor = (self._cursor + 1) % len(self._slots)
+                for listener in bucket:
+                    listener.heartbeat(self.interval)
+            except Exception as e:
+                logger.warning("SSE heartbeat tick failed: %s", e)
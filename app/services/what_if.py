@@ -0,0 +1,171 @@
+"""
+What-if previews of an evaluation's metrics over many listing selections.
+
+The evaluation's listings are loaded once into NumPy arrays (R$/m², valid and
+active masks) and each scenario becomes a row of a boolean matrix, so a batch
+of checkbox states, or "drop each listing in turn", is evaluated with a few
+vectorized reductions instead of one ORM pass (and one HTTP call) per scenario.
+Metrics follow Evaluation.metrics_from_aggregates(), including the
+evaluation's value_statistic.
+"""
+
+import numpy as np
+
+from app.extensions import db
+from app.models.evaluation import BaseListing
+from app.utils.listing_statistics import central_values
+
+MAX_SCENARIOS = 200
+
+
+class UnknownListingError(LookupError):
+    """A scenario references a listing that does not belong to the evaluation."""
+
+    def __init__(self, listing_id):
+        super().__init__(f'Listing {listing_id} does not belong to the evaluation')
+        self.listing_id = listing_id
+
+
+class ListingArrays:
+    """Per-listing arrays of one evaluation, in listing id order."""
+
+    def __init__(self, ids, sqm_values, valid, active):
+        self.ids = ids
+        self.sqm_values = sqm_values
+        self.valid = valid
+        self.active = active
+        self._positions = {int(listing_id): position for position, listing_id in enumerate(ids)}
+
+    @classmethod
+    def load(cls, evaluation):
+        rows = (
+            db.session.query(BaseListing.id, BaseListing.rent_value, BaseListing.area, BaseListing.is_active)
+            .filter(BaseListing.evaluation_id == evaluation.id)
+            .order_by(BaseListing.id)
+            .all()
+        )
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        rent = np.array([row[1] or 0.0 for row in rows], dtype=np.float64)
+        area = np.array([row[2] or 0.0 for row in rows], dtype=np.float64)
+        active = np.array([row[3] is not False for row in rows], dtype=bool)
+        # Same rule as Evaluation._listing_contribution: rent value and positive area.
+        valid = (rent != 0) & (area > 0)
+        sqm_values = np.divide(rent, area, out=np.zeros_like(rent), where=valid)
+        return cls(ids, sqm_values, valid, active)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def position(self, listing_id):
+        try:
+            return self._positions[int(listing_id)]
+        except (KeyError, TypeError, ValueError):
+            raise UnknownListingError(listing_id)
+
+
+def _uses_mean(evaluation):
+    return (evaluation.value_statistic or 'mean') == 'mean'
+
+
+def _metric_vectors(evaluation, active_count, inactive_count, sqm_sum, valid_count, robust_values=None):
+    """
+    get_metrics() fields for each scenario, from per-scenario aggregate vectors.
+    robust_values: per-scenario median/trimmed mean used as region_value_sqm instead of the mean.
+    """
+    has_value = (active_count > 0) & (valid_count > 0)
+    if robust_values is not None:
+        region_value_sqm = np.where(has_value, robust_values, 0.0)
+    else:
+        region_value_sqm = np.divide(sqm_sum, valid_count, out=np.zeros_like(sqm_sum), where=has_value)
+    estimated_price = region_value_sqm * (evaluation.area or 0.0)
+    step = evaluation._get_rounding_step()
+    rounded_price = np.round(estimated_price * evaluation._get_depreciation_factor() / step) * step
+    return [
+        {
+            'region_value_sqm': float(region_value_sqm[index]),
+            'estimated_price': float(estimated_price[index]),
+            'rounded_price': int(rounded_price[index]),
+            'analyzed_properties_count': int(active_count[index]),
+            'active_listings_count': int(active_count[index]),
+            'inactive_listings_count': int(inactive_count[index]),
+            'total_listings_count': int(active_count[index] + inactive_count[index])
+        }
+        for index in range(len(active_count))
+    ]
+
+
+def evaluate_masks(evaluation, arrays, active, present):
+    """
+    Metrics for each row of the (scenarios x listings) boolean matrices `active`
+    (counted as active) and `present` (not deleted).
+    """
+    active = active & present
+    selected = active & arrays.valid
+    robust_values = None
+    if not _uses_mean(evaluation):
+        robust_values = central_values(np.where(selected, arrays.sqm_values, np.nan), evaluation.value_statistic)
+    return _metric_vectors(
+        evaluation,
+        active.sum(axis=1),
+        (present & ~active).sum(axis=1),
+        selected.astype(np.float64) @ arrays.sqm_values,
+        selected.sum(axis=1),
+        robust_values
+    )
+
+
+def scenario_masks(arrays, scenarios):
+    """
+    Builds the active/present matrices of scenarios shaped like the bulk endpoint
+    payload: {'updates': [{'id', 'is_active'}], 'deleted_ids': [...]}, applied on
+    top of the stored state.
+    """
+    if len(scenarios) > MAX_SCENARIOS:
+        raise ValueError(f'At most {MAX_SCENARIOS} scenarios per request')
+    active = np.tile(arrays.active, (len(scenarios), 1))
+    present = np.ones_like(active)
+    for row, scenario in enumerate(scenarios):
+        if not isinstance(scenario, dict):
+            raise ValueError('Each scenario must be an object')
+        for update in scenario.get('updates') or []:
+            if not isinstance(update, dict) or not isinstance(update.get('is_active'), bool):
+                raise ValueError('Each scenario update must have an id and a boolean is_active')
+            active[row, arrays.position(update.get('id'))] = update['is_active']
+        for deleted_id in scenario.get('deleted_ids') or []:
+            present[row, arrays.position(deleted_id)] = False
+    return active, present
+
+
+def leave_one_out(evaluation, arrays):
+    """
+    Metrics with each active listing left out in turn, as [(listing_id, metrics)].
+    For the mean this is the totals minus each listing's contribution, in O(listings);
+    median/trimmed mean evaluate one masked row per left-out listing.
+    """
+    positions = np.flatnonzero(arrays.active)
+    if not _uses_mean(evaluation):
+        present = np.ones((len(positions), len(arrays)), dtype=bool)
+        present[np.arange(len(positions)), positions] = False
+        active = np.tile(arrays.active, (len(positions), 1))
+        metrics = evaluate_masks(evaluation, arrays, active, present)
+        return [(int(arrays.ids[position]), item) for position, item in zip(positions, metrics)]
+
+    selected = arrays.active & arrays.valid
+    sqm_total = float(arrays.sqm_values[selected].sum())
+    valid_total = int(selected.sum())
+    active_total = len(positions)
+    inactive_total = len(arrays) - active_total
+
+    metrics = _metric_vectors(
+        evaluation,
+        np.full(len(positions), active_total - 1),
+        np.full(len(positions), inactive_total),
+        sqm_total - np.where(selected[positions], arrays.sqm_values[positions], 0.0),
+        valid_total - selected[positions].astype(np.int64)
+    )
+    return [(int(arrays.ids[position]), item) for position, item in zip(positions, metrics)]
+
+
+def baseline(evaluation, arrays):
+    """Metrics of the stored selection."""
+    return evaluate_masks(evaluation, arrays, arrays.active[np.newaxis, :], np.ones((1, len(arrays)), dtype=bool))[0]
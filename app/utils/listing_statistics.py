@@ -0,0 +1,158 @@
+"""
+Robust statistics over the R$/m² values of an evaluation's listings.
+
+Everything works on NumPy arrays in one vectorized pass, so the same code
+serves a single sample (describe) and a batch of what-if selections
+(central_values, one selection per row with NaN for listings left out).
+"""
+
+import numpy as np
+
+# Statistic used for region_value_sqm, selectable per evaluation.
+STATISTICS = ('mean', 'median', 'trimmed_mean')
+OUTLIER_METHODS = ('iqr', 'mad')
+
+# Share of the sample cut from each end by the trimmed mean.
+TRIM_PROPORTION = 0.1
+# Tukey fences: outside [Q1 - k*IQR, Q3 + k*IQR].
+IQR_FACTOR = 1.5
+# Modified z-score (Iglewicz-Hoaglin): |0.6745 * (x - median) / MAD| above this.
+MAD_THRESHOLD = 3.5
+MAD_SCALE = 0.6745
+Z_95 = 1.959964
+# Two-sided 95% Student t critical values by degrees of freedom; Z_95 above 30.
+T_95 = (
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042
+)
+
+
+def central_values(values, statistic, trim=TRIM_PROPORTION):
+    """
+    `statistic` of each row of a 2D array, ignoring NaN (listings left out of that
+    row). Rows without values give 0.0.
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    present = ~np.isnan(values)
+    counts = present.sum(axis=1)
+    result = np.zeros(values.shape[0])
+    has_values = counts > 0
+    if statistic not in STATISTICS:
+        raise ValueError(f"statistic must be one of {', '.join(STATISTICS)}")
+    if not values.shape[1]:
+        return result
+    if statistic == 'mean':
+        np.divide(np.where(present, values, 0.0).sum(axis=1), counts, out=result, where=has_values)
+        return result
+
+    # NaN sorts last, so the first `count` columns of each row are its values in order.
+    ordered = np.sort(values, axis=1)
+    rows = np.arange(values.shape[0])
+    if statistic == 'median':
+        low = ordered[rows, np.maximum(counts - 1, 0) // 2]
+        high = ordered[rows, np.minimum(counts // 2, values.shape[1] - 1)]
+        result[has_values] = ((low + high) / 2)[has_values]
+        return result
+
+    cut = np.floor(counts * trim).astype(np.int64)
+    ranks = np.arange(values.shape[1])
+    kept = (ranks >= cut[:, np.newaxis]) & (ranks < (counts - cut)[:, np.newaxis])
+    np.divide(np.where(kept, ordered, 0.0).sum(axis=1), kept.sum(axis=1), out=result, where=has_values)
+    return result
+
+
+def central_value(values, statistic, trim=TRIM_PROPORTION):
+    """`statistic` of a 1D sample; 0.0 when it is empty."""
+    values = np.asarray(values, dtype=np.float64).reshape(1, -1)
+    return float(central_values(values, statistic, trim)[0])
+
+
+def _t_critical(degrees_of_freedom):
+    if degrees_of_freedom < 1:
+        return None
+    if degrees_of_freedom <= len(T_95):
+        return T_95[degrees_of_freedom - 1]
+    return Z_95
+
+
+def outlier_mask(values, method='iqr'):
+    """
+    Boolean mask of outliers in a 1D sample and the (low, high) fences used.
+    Samples under 4 values flag nothing.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if method not in OUTLIER_METHODS:
+        raise ValueError(f"method must be one of {', '.join(OUTLIER_METHODS)}")
+    if len(values) < 4:
+        return np.zeros(len(values), dtype=bool), (None, None)
+    if method == 'iqr':
+        q1, q3 = np.percentile(values, [25, 75])
+        low, high = q1 - IQR_FACTOR * (q3 - q1), q3 + IQR_FACTOR * (q3 - q1)
+    else:
+        median = np.median(values)
+        mad = np.median(np.abs(values - median))
+        if mad == 0:
+            return np.zeros(len(values), dtype=bool), (float(median), float(median))
+        spread = MAD_THRESHOLD * mad / MAD_SCALE
+        low, high = median - spread, median + spread
+    return (values < low) | (values > high), (float(low), float(high))
+
+
+def describe(values, ids=None, method='iqr', trim=TRIM_PROPORTION):
+    """
+    Summary of a 1D sample: count, mean, median, trimmed mean, spread (std, IQR,
+    MAD), 95% confidence intervals of the mean (Student t) and of the median
+    (order statistics), and the outliers by `method` with their ids.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    ids = list(range(len(values))) if ids is None else list(ids)
+    count = len(values)
+    summary = {
+        'count': count,
+        'trim_proportion': trim,
+        'outlier_method': method,
+        'mean': None, 'median': None, 'trimmed_mean': None,
+        'std': None, 'min': None, 'max': None, 'q1': None, 'q3': None, 'iqr': None, 'mad': None,
+        'mean_ci_95': None, 'median_ci_95': None,
+        'fences': None,
+        'outliers': []
+    }
+    if not count:
+        return summary
+
+    ordered = np.sort(values)
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    summary.update({
+        'mean': float(values.mean()),
+        'median': float(median),
+        'trimmed_mean': central_value(values, 'trimmed_mean', trim),
+        'min': float(ordered[0]),
+        'max': float(ordered[-1]),
+        'q1': float(q1),
+        'q3': float(q3),
+        'iqr': float(q3 - q1),
+        'mad': float(np.median(np.abs(values - median)))
+    })
+    if count > 1:
+        std = float(values.std(ddof=1))
+        margin = float(_t_critical(count - 1) * std / np.sqrt(count))
+        summary['std'] = std
+        summary['mean_ci_95'] = [summary['mean'] - margin, summary['mean'] + margin]
+        # Ranks n/2 -/+ z*sqrt(n)/2 of the sorted sample (normal approximation to the binomial).
+        half_width = Z_95 * np.sqrt(count) / 2
+        lower = int(max(np.floor(count / 2 - half_width), 0))
+        upper = int(min(np.ceil(count / 2 + half_width), count - 1))
+        summary['median_ci_95'] = [float(ordered[lower]), float(ordered[upper])]
+
+    flagged, fences = outlier_mask(values, method)
+    summary['fences'] = list(fences) if fences[0] is not None else None
+    summary['outliers'] = [
+        {
+            'id': ids[index],
+            'sqm_value': float(values[index]),
+            'side': 'high' if values[index] > summary['median'] else 'low'
+        }
+        for index in np.flatnonzero(flagged)
+    ]
+    return summary
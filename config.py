@@ -32,3 +32,42 @@ class Config:
     ENABLE_LEGACY_UPLOAD_FALLBACK = _env_bool('ENABLE_LEGACY_UPLOAD_FALLBACK', True)
     MAX_CONTENT_LENGTH = 5 * 1024 * 1024  # 5MB max file size
     ALLOWED_LOGO_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+    # SSE fan-out: 'local' keeps events inside one process, 'postgres' uses
+    # LISTEN/NOTIFY so every gunicorn worker receives every event.
+    SSE_BROKER = os.environ.get('SSE_BROKER', 'local')
+    SSE_BROKER_URL = os.environ.get('SSE_BROKER_URL') or SQLALCHEMY_DATABASE_URI
+    SSE_NOTIFY_CHANNEL = os.environ.get('SSE_NOTIFY_CHANNEL', 'precifica_sse')
+    # Replay log used to resume streams from Last-Event-ID after a reconnect.
+    SSE_REPLAY_BUFFER_SIZE = int(os.environ.get('SSE_REPLAY_BUFFER_SIZE', 200))
+    SSE_REPLAY_MAX_CHANNELS = int(os.environ.get('SSE_REPLAY_MAX_CHANNELS', 1000))
+    # Per-connection memory bound: max queued events, overflow policy
+    # ('drop_oldest' or 'coalesce') and drops tolerated before eviction.
+    SSE_LISTENER_QUEUE_SIZE = int(os.environ.get('SSE_LISTENER_QUEUE_SIZE', 100))
+    SSE_OVERFLOW_POLICY = os.environ.get('SSE_OVERFLOW_POLICY', 'drop_oldest')
+    SSE_EVICT_AFTER_DROPS = int(os.environ.get('SSE_EVICT_AFTER_DROPS', 50))
+    # Evaluation channel payloads: 'full' sends evaluation.to_dict() on every
+    # listing event, 'delta' sends only the changed metric fields. In delta mode
+    # listing_added bursts within SSE_COALESCE_WINDOW seconds become one frame.
+    SSE_EVALUATION_EVENT_MODE = os.environ.get('SSE_EVALUATION_EVENT_MODE', 'full')
+    SSE_COALESCE_WINDOW = float(os.environ.get('SSE_COALESCE_WINDOW', 0.25))
+    # Max channels one multiplexed /api/streams connection may subscribe to.
+    SSE_MAX_STREAM_CHANNELS = int(os.environ.get('SSE_MAX_STREAM_CHANNELS', 50))
+    # Keep-alive comment interval for idle streams, sent by one heartbeat ticker per worker.
+    SSE_HEARTBEAT_INTERVAL = float(os.environ.get('SSE_HEARTBEAT_INTERVAL', 15))
+    # Durable AI job queue: worker threads per process, running-job caps shared by
+    # all processes (global and per unit), and how long a running job may go
+    # without a heartbeat before it is requeued and resumed from its checkpoint.
+    AI_JOB_WORKERS = int(os.environ.get('AI_JOB_WORKERS', 2))
+    AI_JOB_GLOBAL_CONCURRENCY = int(os.environ.get('AI_JOB_GLOBAL_CONCURRENCY', 4))
+    AI_JOB_UNIT_CONCURRENCY = int(os.environ.get('AI_JOB_UNIT_CONCURRENCY', 2))
+    AI_JOB_POLL_INTERVAL = float(os.environ.get('AI_JOB_POLL_INTERVAL', 2))
+    AI_JOB_HEARTBEAT_INTERVAL = float(os.environ.get('AI_JOB_HEARTBEAT_INTERVAL', 30))
+    AI_JOB_STALE_AFTER = float(os.environ.get('AI_JOB_STALE_AFTER', 120))
+    AI_JOB_MAX_ATTEMPTS = int(os.environ.get('AI_JOB_MAX_ATTEMPTS', 3))
+    # Cancel flags are shared through the ai_cancellations table; each process
+    # re-reads them at most every AI_CANCEL_CACHE_SECONDS and they expire on their own.
+    AI_CANCEL_CACHE_SECONDS = float(os.environ.get('AI_CANCEL_CACHE_SECONDS', 1.0))
+    AI_CANCEL_TTL_SECONDS = int(os.environ.get('AI_CANCEL_TTL_SECONDS', 6 * 60 * 60))
+    # Full metric recomputes: 'sql' aggregates base_listings in one query,
+    # 'python' iterates the loaded listings (Evaluation.compute_listing_aggregates).
+    METRICS_ENGINE = os.environ.get('METRICS_ENGINE', 'sql')
@@ -34,6 +34,12 @@ proc_name = "precifica_app"
 # We disable it to ensure each worker loads the app in a fully patched environment.
 preload_app = False
 
+def post_worker_init(worker):
+    # Start the AI job workers right away so jobs interrupted by a deploy or a
+    # worker recycle are picked up again without waiting for a new request.
+    from app.services.ai_jobs import start_pool
+    start_pool(worker.wsgi)
+
 # Server Mechanics
 daemon = False
 pidfile = None
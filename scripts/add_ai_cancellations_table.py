@@ -0,0 +1,45 @@
+"""
+Script para criar a tabela ai_cancellations (cancelamentos de pesquisas de IA
+compartilhados entre os workers).
+
+Uso:
+    python scripts/add_ai_cancellations_table.py
+"""
+
+import sys
+import os
+
+# Adiciona o diretório raiz ao path para permitir imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.extensions import db
+from app.models.ai_job import AICancellation
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def add_ai_cancellations_table():
+    """Cria a tabela ai_cancellations caso ainda não exista."""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            inspector = db.inspect(db.engine)
+            if 'ai_cancellations' in inspector.get_table_names():
+                logger.info("A tabela 'ai_cancellations' já existe no banco de dados. Nenhuma alteração necessária.")
+                return
+
+            logger.info("Criando tabela 'ai_cancellations'...")
+            AICancellation.__table__.create(db.engine)
+            logger.info("Tabela 'ai_cancellations' criada com sucesso.")
+
+        except Exception as e:
+            logger.error(f"Erro ao executar migração: {e}")
+            raise
+
+if __name__ == '__main__':
+    logger.info("Iniciando migração do banco de dados...")
+    add_ai_cancellations_table()
+    logger.info("Processo concluído!")
@@ -0,0 +1,57 @@
+"""
+Script para criar os índices de base_listings usados na busca de comparáveis salvos
+(e nas consultas por avaliação e por link).
+
+Uso:
+    python scripts/add_base_listing_indexes.py
+"""
+
+import sys
+import os
+
+# Adiciona o diretório raiz ao path para permitir imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.extensions import db
+from sqlalchemy import text
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    'ix_base_listings_evaluation_id': "CREATE INDEX IF NOT EXISTS ix_base_listings_evaluation_id ON base_listings (evaluation_id)",
+    'ix_base_listings_link': "CREATE INDEX IF NOT EXISTS ix_base_listings_link ON base_listings (link)",
+    'ix_base_listings_location_collected': (
+        "CREATE INDEX IF NOT EXISTS ix_base_listings_location_collected "
+        "ON base_listings (lower(city), lower(neighborhood), collected_at)"
+    ),
+}
+
+def add_base_listing_indexes():
+    """Cria os índices de base_listings que ainda não existem."""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            inspector = db.inspect(db.engine)
+            existing = {index['name'] for index in inspector.get_indexes('base_listings')}
+
+            for name, statement in INDEXES.items():
+                if name in existing:
+                    logger.info(f"O índice '{name}' já existe. Nenhuma alteração necessária.")
+                    continue
+                logger.info(f"Criando índice '{name}'...")
+                with db.engine.begin() as conn:
+                    conn.execute(text(statement))
+                logger.info(f"Índice '{name}' criado com sucesso.")
+
+        except Exception as e:
+            logger.error(f"Erro ao executar migração: {e}")
+            raise
+
+if __name__ == '__main__':
+    logger.info("Iniciando migração do banco de dados...")
+    add_base_listing_indexes()
+    logger.info("Processo concluído!")
@@ -0,0 +1,91 @@
+"""
+Script para adicionar os agregados incrementais das amostras às avaliações.
+
+Este script adiciona os seguintes campos à tabela evaluations e os preenche a
+partir das amostras existentes:
+- active_listings_count: Integer - amostras ativas
+- inactive_listings_count: Integer - amostras inativas
+- sqm_value_sum: Float - soma de valor/m² das amostras ativas com valor e área
+- valid_listings_count: Integer - amostras ativas com valor e área > 0
+
+Uso:
+    python scripts/add_listing_aggregate_fields.py
+"""
+
+import sys
+import os
+
+# Adiciona o diretório raiz ao path para permitir imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.extensions import db
+from sqlalchemy import text
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+COLUMNS = {
+    'active_listings_count': "INTEGER NOT NULL DEFAULT 0",
+    'inactive_listings_count': "INTEGER NOT NULL DEFAULT 0",
+    'sqm_value_sum': "FLOAT NOT NULL DEFAULT 0.0",
+    'valid_listings_count': "INTEGER NOT NULL DEFAULT 0",
+}
+
+BACKFILL_SQL = """
+UPDATE evaluations e SET
+    active_listings_count = agg.active,
+    inactive_listings_count = agg.inactive,
+    sqm_value_sum = agg.sqm_value_sum,
+    valid_listings_count = agg.valid
+FROM (
+    SELECT
+        evaluation_id,
+        COUNT(*) FILTER (WHERE is_active) AS active,
+        COUNT(*) FILTER (WHERE NOT is_active) AS inactive,
+        COALESCE(SUM(rent_value / area) FILTER (WHERE is_active AND rent_value <> 0 AND area > 0), 0) AS sqm_value_sum,
+        COUNT(*) FILTER (WHERE is_active AND rent_value <> 0 AND area > 0) AS valid
+    FROM base_listings
+    GROUP BY evaluation_id
+) agg
+WHERE e.id = agg.evaluation_id
+"""
+
+def add_listing_aggregate_fields():
+    """Adiciona e preenche os agregados das amostras nas avaliações existentes."""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            logger.info("Verificando se as colunas já existem...")
+
+            inspector = db.inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('evaluations')]
+            missing = [name for name in COLUMNS if name not in columns]
+
+            if not missing:
+                logger.info("As colunas já existem no banco de dados. Nenhuma alteração necessária.")
+                return
+
+            for name in missing:
+                logger.info(f"Adicionando coluna '{name}'...")
+                db.session.execute(text(f"ALTER TABLE evaluations ADD COLUMN {name} {COLUMNS[name]}"))
+                logger.info(f"Coluna '{name}' adicionada com sucesso.")
+
+            logger.info("Preenchendo os agregados a partir das amostras existentes...")
+            result = db.session.execute(text(BACKFILL_SQL))
+            db.session.commit()
+            logger.info(f"Agregados preenchidos para {result.rowcount} avaliações.")
+            logger.info("Use scripts/check_evaluation_metrics.py para conferir a consistência.")
+
+        except Exception as e:
+            logger.error(f"Erro ao executar migração: {e}")
+            db.session.rollback()
+            raise
+
+if __name__ == '__main__':
+    logger.info("Iniciando migração do banco de dados...")
+    logger.info("Adicionando agregados incrementais das amostras...")
+    add_listing_aggregate_fields()
+    logger.info("Processo concluído!")
@@ -0,0 +1,61 @@
+"""
+Script para adicionar a estatística do valor do m² às avaliações.
+
+Este script adiciona o campo value_statistic à tabela evaluations:
+- value_statistic: String ('mean' por padrão) - estatística usada no valor do m² da região
+  (mean, median ou trimmed_mean)
+
+Uso:
+    python scripts/add_value_statistic_field.py
+"""
+
+import sys
+import os
+
+# Adiciona o diretório raiz ao path para permitir imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.extensions import db
+from sqlalchemy import text
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def add_value_statistic_field():
+    """Adiciona o campo value_statistic às avaliações existentes."""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            logger.info("Verificando se a coluna já existe...")
+            
+            # Verifica se a coluna já existe
+            inspector = db.inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('evaluations')]
+            
+            if 'value_statistic' in columns:
+                logger.info("A coluna 'value_statistic' já existe no banco de dados. Nenhuma alteração necessária.")
+                return
+            
+            logger.info("Adicionando coluna 'value_statistic' ao banco de dados...")
+            
+            db.session.execute(text(
+                "ALTER TABLE evaluations ADD COLUMN value_statistic VARCHAR(20) NOT NULL DEFAULT 'mean'"
+            ))
+            
+            db.session.commit()
+            logger.info("Coluna 'value_statistic' adicionada com sucesso.")
+            logger.info("Todas as avaliações existentes continuam usando a média (mean).")
+            
+        except Exception as e:
+            logger.error(f"Erro ao executar migração: {e}")
+            db.session.rollback()
+            raise
+
+if __name__ == '__main__':
+    logger.info("Iniciando migração do banco de dados...")
+    logger.info("Adicionando estatística do valor do m² às avaliações...")
+    add_value_statistic_field()
+    logger.info("Processo concluído!")
@@ -0,0 +1,71 @@
+"""
+Script para conferir os agregados incrementais das avaliações com as amostras.
+
+Compara active_listings_count, inactive_listings_count, sqm_value_sum e
+valid_listings_count de cada avaliação com um recálculo a partir das amostras.
+Com --fix, recalcula por completo (recalculate_metrics) as avaliações divergentes.
+
+Uso:
+    python scripts/check_evaluation_metrics.py [--fix] [--evaluation-id ID]
+"""
+
+import sys
+import os
+import argparse
+
+# Adiciona o diretório raiz ao path para permitir imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.extensions import db
+from app.models.evaluation import Evaluation
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+
+def check_evaluation_metrics(fix=False, evaluation_id=None):
+    """Lista (e opcionalmente corrige) as avaliações com agregados divergentes."""
+    app = create_app()
+
+    with app.app_context():
+        query = Evaluation.query.order_by(Evaluation.id)
+        if evaluation_id is not None:
+            query = query.filter(Evaluation.id == evaluation_id)
+
+        checked = 0
+        inconsistent = 0
+        last_id = 0
+        while True:
+            batch = query.filter(Evaluation.id > last_id).limit(BATCH_SIZE).all()
+            if not batch:
+                break
+            for evaluation in batch:
+                checked += 1
+                mismatches = evaluation.check_metrics_consistency()
+                if mismatches:
+                    inconsistent += 1
+                    logger.warning(f"Avaliação {evaluation.id} divergente: {mismatches}")
+                    if fix:
+                        evaluation.recalculate_metrics()
+            last_id = batch[-1].id
+            if fix:
+                db.session.commit()
+            # Libera as amostras carregadas do lote.
+            db.session.expunge_all()
+
+        logger.info(f"{checked} avaliações conferidas, {inconsistent} divergentes{' (corrigidas)' if fix and inconsistent else ''}.")
+        return inconsistent
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Confere os agregados de amostras das avaliações.")
+    parser.add_argument('--fix', action='store_true', help="Recalcula as avaliações divergentes")
+    parser.add_argument('--evaluation-id', type=int, help="Confere apenas uma avaliação")
+    args = parser.parse_args()
+
+    logger.info("Iniciando conferência dos agregados...")
+    inconsistent = check_evaluation_metrics(fix=args.fix, evaluation_id=args.evaluation_id)
+    logger.info("Processo concluído!")
+    sys.exit(1 if inconsistent and not args.fix else 0)
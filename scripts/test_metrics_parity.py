@@ -0,0 +1,163 @@
+"""
+Test script to verify that the SQL and Python metrics engines agree:
+1. recalculate_metrics gives the same aggregates and metrics with engine='sql' and engine='python'
+2. Preview metrics (_calculate_evaluation_metrics_for_states) agree with state overrides and exclusions
+3. Edge cases: no listings, only inactive listings, listings without rent value or area,
+   and every value_statistic (mean, median, trimmed_mean)
+4. Pending (unflushed) listing changes are seen by the SQL engine
+
+Creates a temporary unit with random evaluations and removes it at the end.
+"""
+
+import sys
+import os
+import random
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import Unit, Evaluation, BaseListing
+from app.controllers.evaluation_controller import _calculate_evaluation_metrics_for_states
+from app.utils.listing_statistics import STATISTICS
+
+EVALUATIONS = 20
+MAX_LISTINGS = 300
+TOLERANCE = 1e-9
+METRIC_FIELDS = (
+    'region_value_sqm', 'estimated_price', 'rounded_price', 'analyzed_properties_count',
+    'active_listings_count', 'inactive_listings_count', 'total_listings_count'
+)
+
+
+def _close(left, right):
+    if isinstance(left, float) or isinstance(right, float):
+        return abs((left or 0) - (right or 0)) <= TOLERANCE * max(1.0, abs(left or 0), abs(right or 0))
+    return left == right
+
+
+def _diff(left, right):
+    return {field: (left[field], right[field]) for field in left if not _close(left[field], right[field])}
+
+
+def _random_listing(rng, evaluation_id, number):
+    return BaseListing(
+        evaluation_id=evaluation_id,
+        sample_number=number,
+        address=f'Rua Teste {number}',
+        rent_value=rng.choice([None, 0, rng.uniform(500, 15000), rng.uniform(100000, 2000000)]),
+        area=rng.choice([None, 0, rng.uniform(20, 400)]),
+        is_active=rng.random() > 0.25
+    )
+
+
+def _engine_results(evaluation):
+    results = {}
+    for engine in ('python', 'sql'):
+        evaluation.recalculate_metrics(engine=engine)
+        results[engine] = {
+            **evaluation.compute_listing_aggregates(engine=engine),
+            **evaluation.get_metrics()
+        }
+    return results
+
+
+def test_metrics_parity(seed=42):
+    """Compare the SQL and Python metrics engines on random evaluations."""
+    app = create_app()
+    rng = random.Random(seed)
+    with app.app_context():
+        print(f"Testing metrics engine parity (seed {seed})...\n")
+
+        unit = Unit(name='Test Unit - Metrics Parity', email='metrics-parity@unit.com')
+        db.session.add(unit)
+        db.session.commit()
+        failures = 0
+
+        try:
+            print("1. Full recompute on random evaluations...")
+            evaluations = []
+            for index in range(EVALUATIONS):
+                evaluation = Evaluation(
+                    unit_id=unit.id,
+                    address=f'Avaliação {index}',
+                    neighborhood='Centro',
+                    city='Fortaleza',
+                    state='CE',
+                    area=rng.choice([0, rng.uniform(30, 500)]),
+                    analysis_type='region',
+                    classification=rng.choice(['Aluguel', 'Venda']),
+                    depreciation=rng.choice([0.0, rng.uniform(0, 30)]),
+                    value_statistic=rng.choice(STATISTICS)
+                )
+                db.session.add(evaluation)
+                db.session.flush()
+                # The first evaluations cover the edge cases: empty, then only inactive listings.
+                count = 0 if index == 0 else rng.randint(1, MAX_LISTINGS)
+                for number in range(count):
+                    listing = _random_listing(rng, evaluation.id, number + 1)
+                    if index == 1:
+                        listing.is_active = False
+                    db.session.add(listing)
+                evaluations.append(evaluation)
+            db.session.commit()
+
+            for evaluation in evaluations:
+                results = _engine_results(evaluation)
+                mismatches = _diff(results['python'], results['sql'])
+                if mismatches:
+                    failures += 1
+                    print(f"   ❌ Evaluation {evaluation.id}: {mismatches}")
+            if not failures:
+                print(f"   ✓ {len(evaluations)} evaluations match")
+
+            print("\n2. Preview metrics with state overrides and exclusions...")
+            preview_failures = 0
+            for evaluation in evaluations:
+                listing_ids = [listing.id for listing in evaluation.base_listings]
+                touched = rng.sample(listing_ids, min(len(listing_ids), rng.randint(0, 30)))
+                states = {listing_id: {'is_active': rng.random() > 0.5} for listing_id in touched}
+                excluded = rng.sample(listing_ids, min(len(listing_ids), rng.randint(0, 10)))
+                python_preview = _calculate_evaluation_metrics_for_states(evaluation, states, excluded, engine='python')
+                sql_preview = _calculate_evaluation_metrics_for_states(evaluation, states, excluded, engine='sql')
+                mismatches = _diff(python_preview, sql_preview)
+                if mismatches:
+                    preview_failures += 1
+                    print(f"   ❌ Evaluation {evaluation.id}: {mismatches}")
+            failures += preview_failures
+            if not preview_failures:
+                print(f"   ✓ {len(evaluations)} previews match")
+
+            print("\n3. Pending listing changes...")
+            evaluation = evaluations[-1]
+            listing = evaluation.base_listings[0]
+            listing.is_active = not listing.is_active
+            db.session.add(_random_listing(rng, evaluation.id, MAX_LISTINGS + 1))
+            sql_aggregates = evaluation.compute_listing_aggregates(engine='sql')
+            db.session.expire(evaluation, ['base_listings'])
+            python_aggregates = evaluation.compute_listing_aggregates(engine='python')
+            mismatches = _diff(python_aggregates, sql_aggregates)
+            if mismatches:
+                failures += 1
+                print(f"   ❌ Unflushed changes not aggregated: {mismatches}")
+            else:
+                print("   ✓ SQL engine sees the unflushed changes")
+            db.session.rollback()
+        finally:
+            print("\nCleaning up...")
+            for evaluation in Evaluation.query.filter_by(unit_id=unit.id).all():
+                db.session.delete(evaluation)
+            db.session.delete(unit)
+            db.session.commit()
+            print("   ✓ Test data removed")
+
+        if failures:
+            print(f"\n❌ {failures} parity checks failed")
+            return False
+        print("\n✅ All tests passed!")
+        return True
+
+
+if __name__ == '__main__':
+    seed = int(sys.argv[1]) if len(sys.argv) > 1 else 42
+    success = test_metrics_parity(seed)
+    sys.exit(0 if success else 1)
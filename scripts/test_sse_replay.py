@@ -0,0 +1,174 @@
+"""
+Test script to verify Last-Event-ID replay against bounded listener queues:
+1. A backlog that fits in the queue is replayed in order
+2. A backlog larger than the queue gets one resync notice, without eviction
+3. Live events after a resync are still delivered
+4. A backlog between the queue size and the eviction threshold is not silently truncated
+5. A multiplexed stream whose replays overflow the queue keeps the replays that fit; only the rest get a resync
+6. An event delivered after one with a higher id (Postgres broker) gets a resync when a replay could skip it
+7. Channel counters are an LRU: a channel counted again survives the eviction of older ones
+
+Runs against the in-process broker; no database needed.
+"""
+
+import sys
+import os
+from queue import Empty
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services import sse
+
+QUEUE_SIZE = 100
+EVICT_AFTER_DROPS = 50
+
+
+def _publish(channel_key, count):
+    for index in range(count):
+        sse.publish_event(channel_key, 'listing_added', {'index': index})
+
+
+def _last_id(channel_key):
+    history = sse._history.get(channel_key)
+    return history.events[-1]['id'] if history and history.events else 0
+
+
+def _drain(listener):
+    items = []
+    while True:
+        try:
+            items.append(listener.get(timeout=0))
+        except Empty:
+            return items
+
+
+def _reconnect(channel_key, backlog):
+    """Publish `backlog` events after a client's last seen id and reconnect it."""
+    _publish(channel_key, 1)
+    last_seen = _last_id(channel_key)
+    _publish(channel_key, backlog)
+    listener = sse.register_listener(channel_key, last_event_id=last_seen)
+    return listener, _drain(listener)
+
+
+def _check(condition, message):
+    print(f"   {'✓' if condition else '❌'} {message}")
+    return condition
+
+
+def test_sse_replay():
+    """Reconnect with backlogs of several sizes and inspect what the listener receives."""
+    sse._listener_settings.update({
+        'queue_size': QUEUE_SIZE,
+        'overflow_policy': 'drop_oldest',
+        'evict_after_drops': EVICT_AFTER_DROPS
+    })
+    sse._history_settings['buffer_size'] = 200
+    print("Testing SSE replay against bounded queues...\n")
+    results = []
+
+    print("1. Backlog that fits in the queue...")
+    listener, items = _reconnect('evaluation:9001', 60)
+    events = [payload for _, payload in items]
+    results.append(_check(
+        len(events) == 60 and [event['data']['index'] for event in events] == list(range(60)),
+        f"{len(events)} events replayed in order"
+    ))
+    sse.remove_listener('evaluation:9001', listener)
+
+    print("\n2. Backlog larger than the queue...")
+    listener, items = _reconnect('evaluation:9002', 180)
+    results.append(_check(
+        [payload['event'] for _, payload in items] == ['resync'],
+        f"received {[payload['event'] for _, payload in items]}"
+    ))
+    results.append(_check(not listener.evicted, "listener not evicted"))
+    results.append(_check(listener in sse._listeners.get('evaluation:9002', ()), "listener registered"))
+    stats = sse.get_channel_stats('evaluation:9002')['evaluation:9002']
+    results.append(_check(stats['evicted'] == 0 and stats['dropped'] == 0, f"stats {stats}"))
+
+    print("\n3. Live events after the resync...")
+    _publish('evaluation:9002', 3)
+    items = _drain(listener)
+    results.append(_check(
+        [payload['data']['index'] for _, payload in items] == [0, 1, 2],
+        f"{len(items)} live events delivered"
+    ))
+    sse.remove_listener('evaluation:9002', listener)
+
+    print("\n4. Backlog between the queue size and the eviction threshold...")
+    listener, items = _reconnect('evaluation:9003', QUEUE_SIZE + EVICT_AFTER_DROPS // 2)
+    results.append(_check(
+        [payload['event'] for _, payload in items] == ['resync'],
+        "resync instead of a silently truncated replay"
+    ))
+    sse.remove_listener('evaluation:9003', listener)
+
+    print("\n5. Multiplexed stream whose replays overflow the queue...")
+    channel_keys = ['evaluation:9004', 'evaluation:9005', 'evaluation:9006']
+    _publish(channel_keys[0], 1)
+    last_seen = _last_id(channel_keys[0])
+    for channel_key in channel_keys:
+        _publish(channel_key, QUEUE_SIZE - 1)
+    listener = sse.register_listener('stream:test')
+    for channel_key in channel_keys:
+        sse.register_listener(channel_key, last_event_id=last_seen, listener=listener)
+    items = _drain(listener)
+    resyncs = {key for key, payload in items if payload['event'] == 'resync'}
+    complete = {
+        key for key in channel_keys
+        if sum(1 for item_key, payload in items if item_key == key and payload['event'] == 'listing_added') == QUEUE_SIZE - 1
+    }
+    results.append(_check(
+        complete == {channel_keys[0]} and resyncs == set(channel_keys[1:]),
+        f"replayed {sorted(complete)}, resync for {sorted(resyncs)}"
+    ))
+    results.append(_check(not listener.evicted, "listener not evicted"))
+    for channel_key in list(listener.channel_keys):
+        sse.remove_listener(channel_key, listener)
+
+    print("\n6. Events delivered out of id order...")
+    base = sse._max_delivered_id + 10
+    for event_id in (base + 2, base + 1):
+        sse._deliver_local('evaluation:9007', {'event': 'listing_added', 'data': {'index': event_id - base}, 'id': event_id, 'ts': 0})
+    expectations = {
+        base + 2: ['resync'],
+        base + 1: ['listing_added'],
+        base: ['listing_added', 'listing_added']
+    }
+    for last_seen, expected in expectations.items():
+        listener = sse.register_listener('evaluation:9007', last_event_id=last_seen)
+        received = [payload['event'] for _, payload in _drain(listener)]
+        sse.remove_listener('evaluation:9007', listener)
+        results.append(_check(
+            received == expected,
+            f"Last-Event-ID {last_seen - base}: {received}"
+        ))
+
+    print("\n7. Channel counter LRU...")
+    max_channels = sse._history_settings['max_channels']
+    sse._history_settings['max_channels'] = 3
+    try:
+        sse._channel_stats.clear()
+        for channel_key in ('evaluation:9101', 'evaluation:9102', 'evaluation:9103'):
+            sse._count(channel_key, 'queued')
+        sse._count('evaluation:9101', 'queued')
+        sse._count('evaluation:9104', 'queued')
+        results.append(_check(
+            list(sse._channel_stats) == ['evaluation:9103', 'evaluation:9101', 'evaluation:9104']
+            and sse._channel_stats['evaluation:9101']['queued'] == 2,
+            f"kept {list(sse._channel_stats)}"
+        ))
+    finally:
+        sse._history_settings['max_channels'] = max_channels
+
+    if all(results):
+        print("\n✅ All tests passed!")
+        return True
+    print(f"\n❌ {results.count(False)} checks failed")
+    return False
+
+
+if __name__ == '__main__':
+    success = test_sse_replay()
+    sys.exit(0 if success else 1)